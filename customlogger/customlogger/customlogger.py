@@ -1,10 +1,83 @@
 # logging_config.py
+import os
+import copy
+import json
+import time
+import queue
+import atexit
 import logging
+import threading
+from datetime import datetime, timezone
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 import colorlog
 '''
 Use the same logs config across multiple pojects in the same directory
+by default the console and file handlers run on a background thread behind a QueueHandler,
+so a log call on the event loop only puts the record on a queue instead of writing to the terminal and disk
+the behaviour can be tuned with environment variables:
+ - LOG_QUEUE: false writes from the calling thread like before
+ - LOG_FORMAT: json writes one JSON object per line to the log file instead of plain text
+ - LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT: rotating log file
+ - LOG_RATE_LIMIT, LOG_RATE_INTERVAL: off unless LOG_RATE_LIMIT is set, then at most LOG_RATE_LIMIT INFO/DEBUG
+   records of the same log call (logger, file and line, the apps log f-strings) every LOG_RATE_INTERVAL seconds;
+   warnings and errors are never dropped
 '''
+
+class JSONFormatter(logging.Formatter):
+    '''one JSON object per record, for log shippers'''
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    '''
+        lets at most `limit` records below `max_level` through per log call and interval,
+        the first record after a window with dropped records reports how many were dropped
+        records are grouped by the line that logged them, so one noisy loop is limited without silencing the rest of the app
+    '''
+    def __init__(self, limit: int = 100, interval: float = 1.0, max_level: int = logging.WARNING):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        #(logger name, path, line) -> [window start, records in window, dropped records]
+        self._windows = {}
+        self._pruned = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= self.max_level:
+            return True
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            if now - self._pruned >= self.interval:
+                #expired windows without dropped records have nothing left to report
+                self._windows = {k: w for k, w in self._windows.items() if w[2] or now - w[0] < self.interval}
+                self._pruned = now
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages from {record.name} were rate limited)"
+            record.args = None
+        return True
+
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -30,8 +103,10 @@ LOGGING_CONFIG = {
             "formatter": "color",
         },
         "file": {
-            "class": "logging.FileHandler",
+            "class": "logging.handlers.RotatingFileHandler",
             "filename": "app.log",
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
             "formatter": "default",
         },
     },
@@ -48,5 +123,51 @@ LOGGING_CONFIG = {
     }
 }
 
+_listener = None
+
+def _logging_config() -> dict:
+    config = copy.deepcopy(LOGGING_CONFIG)
+    file_handler = config["handlers"]["file"]
+    file_handler["filename"] = os.getenv("LOG_FILE", file_handler["filename"])
+    file_handler["maxBytes"] = int(os.getenv("LOG_MAX_BYTES", file_handler["maxBytes"]))
+    file_handler["backupCount"] = int(os.getenv("LOG_BACKUP_COUNT", file_handler["backupCount"]))
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        config["formatters"]["json"] = {"()": JSONFormatter}
+        file_handler["formatter"] = "json"
+    return config
+
+def stop_logging():
+    '''flushes the records still on the queue, registered with atexit'''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def setup_logging():
-    dictConfig(LOGGING_CONFIG)
+    global _listener
+    stop_logging()
+    dictConfig(_logging_config())
+
+    #opt-in, the apps log everything through one logger and nothing should be dropped unless asked for
+    rate_limit = RateLimitFilter(
+        limit=int(os.getenv("LOG_RATE_LIMIT", 0)),
+        interval=float(os.getenv("LOG_RATE_INTERVAL", 1.0)),
+    )
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if os.getenv("LOG_QUEUE", "true").lower() in ("0", "false", "no"):
+        for handler in handlers:
+            handler.addFilter(rate_limit)
+        return
+
+    #the filter runs on the calling thread so dropped records never reach the queue
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(rate_limit)
+    for logger in (root, logging.getLogger("myapp")):
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+atexit.register(stop_logging)
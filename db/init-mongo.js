@@ -11,6 +11,8 @@ db.createCollection('posts');
 db.createCollection('comments');
 
 //create time_series_data following the timeseries schema
+//the metaField only holds the turbine id and location, measurements are top level fields,
+//so all readings of a turbine share buckets and compress well
 db = db.getSiblingDB('time_series_data');
 
 db.createCollection("turbine_readings", {
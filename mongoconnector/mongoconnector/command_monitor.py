@@ -0,0 +1,115 @@
+import bisect
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import monitoring
+import logging
+'''
+per command latency of every MongoDB command the APIs send
+commands are grouped by command name, collection and the API route that sent them,
+every group keeps a latency histogram; commands slower than the threshold are logged with their filter or pipeline
+
+the route comes from a context variable the apps set per request,
+Motor runs the driver calls on its executor with a copy of the caller's context so the listener sees it
+'''
+
+logger = logging.getLogger("mongoconnector")
+
+#upper bounds of the histogram buckets in milliseconds, the last bucket is everything above
+BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+#handshake, auth and session housekeeping say nothing about the routes
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "authenticate", "endSessions"}
+
+#parts of a command that describe what it does, documents of inserts are left out
+COMMAND_DETAILS = ["filter", "query", "pipeline", "sort", "updates", "deletes", "key"]
+MAX_DETAIL_LENGTH = 2000
+
+current_route: ContextVar[Optional[str]] = ContextVar("mongo_route", default=None)
+
+def set_route(route: Optional[str]):
+    '''tags the commands sent from the current request with its route'''
+    current_route.set(route)
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> Optional[str]:
+    '''collection a command runs on, None for database level commands'''
+    if command_name == "getMore":
+        return command.get("collection")
+    target = command.get(command_name)
+    return target if isinstance(target, str) else None
+
+def command_details(command: Dict[str, Any]) -> str:
+    details = {name: command[name] for name in COMMAND_DETAILS if name in command}
+    text = str(details)
+    return text if len(text) <= MAX_DETAIL_LENGTH else text[:MAX_DETAIL_LENGTH] + "..."
+
+class CommandStatsListener(monitoring.CommandListener):
+    def __init__(self, slow_ms: float = 100.0):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple[Any, int], Tuple[Optional[str], Optional[str], Dict[str, Any]]] = {}
+        self._groups: Dict[Tuple[str, Optional[str], Optional[str]], Dict[str, Any]] = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        collection = command_collection(event.command_name, event.command)
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (collection, current_route.get(), event.command)
+
+    def _finished(self, event, failed: bool):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        collection, route, command = started
+        elapsed_ms = event.duration_micros / 1000
+        with self._lock:
+            group = self._groups.get((event.command_name, collection, route))
+            if group is None:
+                group = self._groups[(event.command_name, collection, route)] = {
+                    "count": 0, "failures": 0, "slow": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "buckets": [0] * (len(BUCKETS_MS) + 1),
+                }
+            group["count"] += 1
+            group["failures"] += failed
+            group["total_ms"] += elapsed_ms
+            group["max_ms"] = max(group["max_ms"], elapsed_ms)
+            group["buckets"][bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            slow = elapsed_ms >= self.slow_ms
+            group["slow"] += slow
+        if slow:
+            logger.warning(
+                f"Slow {event.command_name} on {collection or event.database_name} "
+                f"({elapsed_ms:.1f} ms, route {route or '-'}): {command_details(command)}"
+            )
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        '''one entry per (command, collection, route) with cumulative histogram buckets'''
+        with self._lock:
+            groups = {key: dict(group, buckets=list(group["buckets"])) for key, group in self._groups.items()}
+        stats = []
+        for (command_name, collection, route), group in sorted(groups.items(), key=lambda item: tuple(str(part) for part in item[0])):
+            cumulative, running = {}, 0
+            for bound, count in zip([*map(str, BUCKETS_MS), "+Inf"], group["buckets"]):
+                running += count
+                cumulative[bound] = running
+            stats.append({
+                "command": command_name,
+                "collection": collection,
+                "route": route,
+                "count": group["count"],
+                "failures": group["failures"],
+                "slow": group["slow"],
+                "total_ms": round(group["total_ms"], 3),
+                "max_ms": round(group["max_ms"], 3),
+                "avg_ms": round(group["total_ms"] / group["count"], 3),
+                "buckets": cumulative,
+            })
+        return stats
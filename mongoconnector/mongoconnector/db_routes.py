@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Request
+from . import command_monitor, mongo_connector
+'''
+FastAPI parts shared by the APIs
+tag_route is an app level dependency that tags the MongoDB commands of a request with its route template,
+router serves the pool counters and the per command latency histograms as JSON
+    app = FastAPI(dependencies=[Depends(db_routes.tag_route)])
+    app.include_router(db_routes.router)
+'''
+
+async def tag_route(request: Request):
+    '''tags the MongoDB commands of a request with its route template for the /metrics histograms'''
+    route = request.scope.get("route")
+    command_monitor.set_route(route.path if route else request.url.path)
+
+router = APIRouter()
+
+@router.get("/db/pool")
+async def db_pool():
+    """
+    MongoDB connection pool options and counters (checked out, waiters, check-out wait time).
+    """
+    return mongo_connector.pool_stats()
+
+@router.get("/db/metrics")
+async def db_metrics():
+    """
+    MongoDB pool counters and per command latency histograms by collection and route as JSON.
+    """
+    return mongo_connector.metrics()
@@ -0,0 +1,125 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+import logging
+'''
+shared index provisioning for the APIs
+every app declares the indexes its routes need and a representative query per route,
+at startup the missing indexes are created (create_index is idempotent) and every probe is explained
+so routes that still scan a whole collection, or sort their results in memory, show up in the logs
+'''
+
+logger = logging.getLogger("mongoconnector")
+
+@dataclass
+class IndexSpec:
+    collection: str
+    keys: List[Tuple[str, Any]]
+    unique: bool = False
+    options: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class QueryProbe:
+    '''
+        representative query of a route, either a find (filter + sort) or an aggregation pipeline
+    '''
+    route: str
+    collection: str
+    filter: Dict[str, Any] = field(default_factory=dict)
+    sort: Optional[Dict[str, Any]] = None
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+def _key_pattern(keys) -> Tuple:
+    return tuple((name, direction) for name, direction in keys)
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, specs: List[IndexSpec]) -> List[str]:
+    '''creates the declared indexes that do not exist yet and returns their names'''
+    created = []
+    existing_by_collection: Dict[str, set] = {}
+    for spec in specs:
+        if spec.collection not in existing_by_collection:
+            existing = set()
+            try:
+                async for index in db[spec.collection].list_indexes():
+                    existing.add(_key_pattern(index["key"].items()))
+            except Exception:
+                #list_indexes fails for collections that do not exist yet, create_index creates them
+                pass
+            existing_by_collection[spec.collection] = existing
+        pattern = _key_pattern(spec.keys)
+        if pattern in existing_by_collection[spec.collection]:
+            continue
+        name = await db[spec.collection].create_index(spec.keys, unique=spec.unique, **spec.options)
+        existing_by_collection[spec.collection].add(pattern)
+        created.append(f"{spec.collection}.{name}")
+        logger.info(f"Created index {name} on {spec.collection}")
+    return created
+
+def scan_stages(plan: Any) -> List[str]:
+    '''
+        COLLSCAN stages and $lookup joins without an index anywhere in an explain output
+    '''
+    found = []
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if stage == "COLLSCAN":
+            found.append(f"COLLSCAN {plan.get('namespace', plan.get('nss', ''))}".strip())
+        elif stage == "EQ_LOOKUP" and plan.get("strategy") in ("NestedLoopJoin", "HashJoin"):
+            found.append(f"{plan['strategy']} {plan.get('foreignCollection', '')}".strip())
+        for value in plan.values():
+            found.extend(scan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(scan_stages(value))
+    return found
+
+def sort_stages(plan: Any) -> List[str]:
+    '''
+        blocking sorts in an explain output: SORT plan stages and $sort pipeline stages, which time-series
+        collections use when no index provides the order ($_internalBoundedSort is the streaming variant)
+    '''
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "SORT":
+            found.append("SORT")
+        if "$sort" in plan:
+            found.append("$sort")
+        for value in plan.values():
+            found.extend(sort_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(sort_stages(value))
+    return found
+
+async def explain_probe(db: AsyncIOMotorDatabase, probe: QueryProbe) -> List[str]:
+    if probe.pipeline is not None:
+        command = {"aggregate": probe.collection, "pipeline": probe.pipeline, "cursor": {}}
+    else:
+        command = {"find": probe.collection, "filter": probe.filter}
+        if probe.sort:
+            command["sort"] = probe.sort
+    explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    scans = scan_stages(explain)
+    if probe.sort:
+        #a find probe declares the order its route relies on, it has to come from an index
+        scans.extend(f"in-memory {stage}" for stage in sort_stages(explain))
+    return scans
+
+async def provision_indexes(db: AsyncIOMotorDatabase, specs: List[IndexSpec], probes: List[QueryProbe] = ()):
+    '''
+        startup step: create missing indexes, then log every route whose probe still scans
+        failures are logged and never stop the API from starting
+    '''
+    try:
+        await ensure_indexes(db, specs)
+    except Exception as ex:
+        logger.error(f"Index provisioning failed: {ex}")
+        return
+    for probe in probes:
+        try:
+            scans = await explain_probe(db, probe)
+        except Exception as ex:
+            logger.warning(f"Could not explain {probe.route}: {ex}")
+            continue
+        if scans:
+            logger.warning(f"{probe.route} still scans: {', '.join(scans)}")
@@ -1,6 +1,11 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import threading
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
+from pymongo import monitoring
+from .command_monitor import CommandStatsListener
+import logging
 
 load_dotenv()  # Load environment variables from .env file
 '''
@@ -13,21 +18,231 @@ database_username = os.getenv("MONGO_INITDB_ROOT_USERNAME")
 database_password = os.getenv("MONGO_INITDB_ROOT_PASSWORD")
 base_url = os.getenv("JSON_PLACEHOLDER")
 
+logger = logging.getLogger("mongoconnector")
+
+'''
+client options that can be tuned per service through the environment
+every option is read as <SERVICE>_MONGO_<NAME> first (e.g. TASK2_MONGO_MAX_POOL_SIZE) and then as MONGO_<NAME>,
+options that are set nowhere keep the driver default
+'''
+CLIENT_OPTIONS = {
+    "MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MIN_POOL_SIZE": ("minPoolSize", int),
+    "MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "READ_PREFERENCE": ("readPreference", str),
+    "COMPRESSORS": ("compressors", str),
+}
+
+#compressor -> module the driver needs for it, zlib ships with python
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+def _available_compressors(value: str) -> str:
+    '''drops compressors whose optional package is not installed instead of failing the connection'''
+    available = []
+    for name in (part.strip() for part in value.split(",")):
+        if not name:
+            continue
+        try:
+            __import__(COMPRESSOR_MODULES.get(name, name))
+            available.append(name)
+        except ImportError:
+            logger.warning(f"Compressor {name} is configured but {COMPRESSOR_MODULES.get(name, name)} is not installed, skipping it")
+    return ",".join(available)
+
+def _service_env(service: Optional[str], name: str) -> Optional[str]:
+    value = os.getenv(f"{service.upper()}_MONGO_{name}") if service else None
+    return os.getenv(f"MONGO_{name}") if value is None else value
+
+def client_options(service: Optional[str] = None) -> Dict[str, Any]:
+    options = {}
+    for name, (option, cast) in CLIENT_OPTIONS.items():
+        value = _service_env(service, name)
+        if value is None or value == "":
+            continue
+        value = cast(value)
+        if option == "compressors":
+            value = _available_compressors(value)
+            if not value:
+                continue
+        options[option] = value
+    return options
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    '''
+        keeps connection pool counters per server so pools can be sized under load
+        waiters are check-outs that started but did not get a connection yet
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, float]] = {}
+
+    def _pool(self, address) -> Dict[str, float]:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "connections": 0, "checked_out": 0, "waiters": 0, "max_waiters": 0,
+                "checkouts": 0, "checkout_failures": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+                "cleared": 0,
+            }
+        return pool
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for field, delta in deltas.items():
+                pool[field] += delta
+            pool["max_waiters"] = max(pool["max_waiters"], pool["waiters"])
+
+    def _checked_out(self, event, failed: bool):
+        #duration is the time the check-out waited for a connection (pymongo >= 4.7)
+        waited = getattr(event, "duration", 0.0) or 0.0
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiters"] = max(0, pool["waiters"] - 1)
+            if failed:
+                pool["checkout_failures"] += 1
+            else:
+                pool["checked_out"] += 1
+                pool["checkouts"] += 1
+            pool["wait_seconds_total"] += waited
+            pool["wait_seconds_max"] = max(pool["wait_seconds_max"], waited)
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, connections=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, connections=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiters=1)
+
+    def connection_check_out_failed(self, event):
+        self._checked_out(event, failed=True)
+
+    def connection_checked_out(self, event):
+        self._checked_out(event, failed=False)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            pools = {address: dict(pool) for address, pool in self._pools.items()}
+        stats = []
+        for address, pool in sorted(pools.items()):
+            #failed check-outs waited too, the average covers every attempt
+            attempts = pool["checkouts"] + pool["checkout_failures"]
+            stats.append({
+                "address": address,
+                **pool,
+                "wait_seconds_avg": round(pool["wait_seconds_total"] / attempts, 6) if attempts else 0.0,
+            })
+        return stats
+
 class MongoDB:
     client: AsyncIOMotorClient = None
     db = None
+    options: Dict[str, Any] = {}
 
 mongodb = MongoDB()
+pool_listener = PoolStatsListener()
+#commands slower than <SERVICE>_MONGO_SLOW_COMMAND_MS / MONGO_SLOW_COMMAND_MS are logged
+command_listener = CommandStatsListener()
 
-async def connect_to_mongo(database: str):
+async def connect_to_mongo(database: str, service: Optional[str] = None):
+    mongodb.options = client_options(service)
+    command_listener.slow_ms = float(_service_env(service, "SLOW_COMMAND_MS") or 100)
     mongodb.client = AsyncIOMotorClient(
         host=database_url,
         port=int(database_port),
         username=database_username,
-        password=database_password
+        password=database_password,
+        event_listeners=[pool_listener, command_listener],
+        **mongodb.options
     )
     mongodb.db = mongodb.client[database]
     print("Connected to MongoDB")
+    if mongodb.options:
+        logger.info(f"MongoDB client options for {service or 'default'}: {mongodb.options}")
+
+def pool_stats() -> Dict[str, Any]:
+    '''configured pool options and the live counters of every server pool'''
+    return {
+        "max_pool_size": mongodb.options.get("maxPoolSize", 100),
+        "min_pool_size": mongodb.options.get("minPoolSize", 0),
+        "options": {key: value for key, value in mongodb.options.items()},
+        "pools": pool_listener.stats(),
+    }
+
+def metrics() -> Dict[str, Any]:
+    '''pool counters plus the latency histograms of the commands per collection and route'''
+    return {
+        "pool": pool_stats(),
+        "slow_command_ms": command_listener.slow_ms,
+        "commands": command_listener.stats(),
+    }
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + "}"
+
+def prometheus_lines() -> List[str]:
+    '''
+        the pool counters and command histograms in the Prometheus text format, apps add them to their /metrics output
+        command latencies are converted to seconds like the other Prometheus durations
+    '''
+    lines = []
+    pools = pool_listener.stats()
+    for name, metric_type, field, help_text in (
+        ("mongodb_pool_connections", "gauge", "connections", "Open connections per server."),
+        ("mongodb_pool_checked_out", "gauge", "checked_out", "Connections currently checked out."),
+        ("mongodb_pool_waiters", "gauge", "waiters", "Check-outs waiting for a connection."),
+        ("mongodb_pool_checkouts_total", "counter", "checkouts", "Successful connection check-outs."),
+        ("mongodb_pool_checkout_failures_total", "counter", "checkout_failures", "Failed connection check-outs."),
+        ("mongodb_pool_wait_seconds_total", "counter", "wait_seconds_total", "Time spent waiting for a connection."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+        lines += [f"{name}{_labels(address=pool['address'])} {pool[field]}" for pool in pools]
+
+    name = "mongodb_command_duration_seconds"
+    lines += [f"# HELP {name} Command latency by command, collection and route.", f"# TYPE {name} histogram"]
+    commands = command_listener.stats()
+    for command in commands:
+        labels = {"command": command["command"], "collection": command["collection"] or "", "route": command["route"] or ""}
+        for bound, count in command["buckets"].items():
+            le = bound if bound == "+Inf" else f"{float(bound) / 1000:g}"
+            lines.append(f"{name}_bucket{_labels(**labels, le=le)} {count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {command['total_ms'] / 1000}")
+        lines.append(f"{name}_count{_labels(**labels)} {command['count']}")
+    name = "mongodb_slow_commands_total"
+    lines += [f"# HELP {name} Commands slower than the slow command threshold.", f"# TYPE {name} counter"]
+    lines += [
+        f"{name}{_labels(command=command['command'], collection=command['collection'] or '', route=command['route'] or '')} {command['slow']}"
+        for command in commands
+    ]
+    return lines
 
 async def close_mongo_connection():
     if mongodb.client:
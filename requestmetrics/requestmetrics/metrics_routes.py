@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from .requestmetrics import registry
+'''
+/metrics endpoint shared by the APIs, kept apart from the middleware so that one stays plain ASGI
+    app.include_router(metrics_routes.router)
+'''
+
+#version of the Prometheus text exposition format render() writes
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Request metrics and those of the registered collectors in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,137 @@
+import bisect
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+'''
+Use the same request metrics across multiple projects in the same directory
+a pure ASGI middleware records per route latency and response size histograms, status codes and in-flight requests,
+render() returns everything in the Prometheus text format for a /metrics endpoint
+
+recording is a few dict and list updates per request, all on the event loop so no locks are needed
+'''
+
+#latency buckets in seconds and response size buckets in bytes
+DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [100, 1000, 10000, 100000, 1000000, 10000000]
+
+#requests that matched no route share one label so unknown paths cannot blow up the series
+UNMATCHED_ROUTE = "unmatched"
+
+class Histogram:
+    __slots__ = ("bounds", "buckets", "sum", "count")
+
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels: Dict[str, object]) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else str(bound)
+
+def histogram_lines(name: str, help_text: str, series: List[Tuple[Dict[str, object], Histogram]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in series:
+        running = 0
+        for bound, count in zip([*map(format_bound, histogram.bounds), "+Inf"], histogram.buckets):
+            running += count
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': bound})} {running}")
+        lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+    return lines
+
+def sample_lines(name: str, metric_type: str, help_text: str, samples: List[Tuple[Dict[str, object], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{name}{format_labels(labels) if labels else ''} {value}" for labels, value in samples)
+    return lines
+
+class MetricsRegistry:
+    def __init__(self, duration_buckets: List[float] = DURATION_BUCKETS, size_buckets: List[float] = SIZE_BUCKETS):
+        self.duration_buckets = duration_buckets
+        self.size_buckets = size_buckets
+        self.in_flight = 0
+        self.durations: Dict[Tuple[str, str], Histogram] = {}
+        self.sizes: Dict[Tuple[str, str], Histogram] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        #callables returning extra Prometheus text lines, e.g. database metrics
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def observe(self, method: str, route: str, status: int, seconds: float, size: int):
+        key = (method, route)
+        duration = self.durations.get(key)
+        if duration is None:
+            duration = self.durations[key] = Histogram(self.duration_buckets)
+            self.sizes[key] = Histogram(self.size_buckets)
+        duration.observe(seconds)
+        self.sizes[key].observe(size)
+        status_key = (method, route, status)
+        self.responses[status_key] = self.responses.get(status_key, 0) + 1
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        def labels(key):
+            return {"method": key[0], "route": key[1]}
+        lines = sample_lines("http_requests_in_flight", "gauge", "Requests currently being served.", [({}, self.in_flight)])
+        lines += sample_lines(
+            "http_requests_total", "counter", "Responses by route and status code.",
+            [({**labels(key), "status": key[2]}, count) for key, count in sorted(self.responses.items())],
+        )
+        lines += histogram_lines(
+            "http_request_duration_seconds", "Request latency by route.",
+            [(labels(key), histogram) for key, histogram in sorted(self.durations.items())],
+        )
+        lines += histogram_lines(
+            "http_response_size_bytes", "Response body size by route.",
+            [(labels(key), histogram) for key, histogram in sorted(self.sizes.items())],
+        )
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class MetricsMiddleware:
+    '''
+        pure ASGI middleware, streaming responses are timed until their last body chunk
+        the route label is the matched route template (FastAPI puts the route into the scope), not the raw path
+    '''
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        registry = self.registry
+        start = perf_counter()
+        #requests that fail before a response started end up as 500 in the error middleware
+        response = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            registry.in_flight -= 1
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            registry.observe(scope["method"], route, response["status"], perf_counter() - start, response["size"])
@@ -1,11 +1,13 @@
 from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI #get the FastAPI and other modules from it
 from mongoconnector import mongo_connector #import the MongoDB connection functions
+from mongoconnector import index_advisor, db_routes
 import logging
 from fastapi.middleware.cors import CORSMiddleware
 
 from customlogger import customlogger
-from .services import populate_db
+from requestmetrics import requestmetrics, metrics_routes
+from .services import populate_db, indexes, report_snapshots
 from .routes import users, posts, comments, reports #import all defined routes
 
 from dotenv import load_dotenv
@@ -30,17 +32,30 @@ This is useful for managing resources like database connections, ensuring they a
 and closed when the app stops, preventing resource leaks and ensuring clean shutdowns.
 when application starts, and connects to MongoDB, Check if the 3 required collections exist.
 if they dont exist, create them and populate them with data from the JSON Placeholder API.
+afterwards the indexes the routes need are created if missing and routes that still scan are logged.
+then the precomputed user reports of users with new posts or comments are refreshed, and again periodically
+while the app runs; a failed refresh is logged and the reports fall back to the live pipeline.
 '''
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await mongo_connector.connect_to_mongo(os.getenv('USERS_COLLECTION'))
+    #pool size, timeouts, compression etc. come from TASK1_MONGO_* / MONGO_* environment variables
+    await mongo_connector.connect_to_mongo(os.getenv('USERS_COLLECTION'), service="task1")
     await populate_db.populate_db(mongo_connector.mongodb.db)
+    await index_advisor.provision_indexes(mongo_connector.mongodb.db, indexes.INDEXES, indexes.PROBES)
+    #precomputed reports are only rebuilt for users whose posts or comments changed
+    try:
+        await report_snapshots.ensure_snapshots(mongo_connector.mongodb.db)
+    except Exception as ex:
+        #users without a report are served by the live pipeline, the refresher retries
+        logger.error(f"Building the user reports failed: {ex}")
+    report_snapshots.start_refresher(mongo_connector.mongodb.db)
     print("Application started and connected to MongoDB")
     yield   # This is where the application runs
+    await report_snapshots.stop_refresher()
     await mongo_connector.close_mongo_connection()
 
-app = FastAPI(lifespan=lifespan, title="UsersAPI")  # Use the lifespan context manager
+app = FastAPI(lifespan=lifespan, title="UsersAPI", dependencies=[Depends(db_routes.tag_route)])  # Use the lifespan context manager
 
 app.add_middleware(
     CORSMiddleware,
@@ -50,14 +65,20 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],  # to allow downloading files
 )
+#per route latency, response size and status metrics, served on /metrics
+app.add_middleware(requestmetrics.MetricsMiddleware)
+requestmetrics.registry.add_collector(mongo_connector.prometheus_lines)
+app.include_router(metrics_routes.router)
 app.include_router(users.route)
 app.include_router(posts.route)
 app.include_router(comments.route)
 app.include_router(reports.route)
+#MongoDB pool counters and command histograms as JSON on /db/pool and /db/metrics, shared with the other API
+app.include_router(db_routes.router)
 
 @app.get("/")
 async def root():
     """
     default endpoint.
     """
-    return {"message": "Task-1 API Running!"}
\ No newline at end of file
+    return {"message": "Task-1 API Running!"}
@@ -7,9 +7,10 @@
 #comments: List of comments on the user's posts
 #posts_count: Number of posts by the user
 #comments_count: Number of comments on the user's posts
+#the summary model only carries the counts, for callers that do not need posts and comments
 
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional, Union
 
 
 class PostSummary(BaseModel):
@@ -34,3 +35,22 @@ class UserReportModel(BaseModel):
     comments: List[CommentSummary] = Field(default_factory=list, description="List of comments on the user's posts")
     posts_count: int = Field(..., description="Number of posts by the user")
     comments_count: int = Field(..., description="Total number of comments on the user's posts")
+
+
+class UserReportSummaryModel(BaseModel):
+    id: int = Field(..., description="User ID")
+    name: str = Field(..., description="Full name of the user")
+    username: str = Field(..., description="Username of the user")
+    posts_count: int = Field(..., description="Number of posts by the user")
+    comments_count: int = Field(..., description="Total number of comments on the user's posts")
+
+
+'''
+reports model that allows pagination, summary first: full reports validate against both models
+but keep their posts/comments only as UserReportModel
+'''
+class UserReportsResponseModel(BaseModel):
+    reports: List[Union[UserReportSummaryModel, UserReportModel]]
+    next_cursor: Optional[str] = None
+    has_more: bool
+    count: int
@@ -1,76 +1,73 @@
+from bson import ObjectId
 from fastapi import APIRouter, HTTPException, Query, status, Response
-from typing import List
+from typing import Optional, Union
 import logging
+import os
 from fastapi.responses import JSONResponse
 from mongoconnector import mongo_connector
-from ..models.report import CommentSummary, PostSummary, UserReportModel
+from ..models.report import UserReportModel, UserReportSummaryModel, UserReportsResponseModel
+from ..services import report_snapshots
+from ..services.report_snapshots import report_stages
+from ..services.coalesce import RequestCoalescer
 
 route = APIRouter()
 logger = logging.getLogger("task-1")
 
-@route.get("/reports", response_model=List[UserReportModel])
+#summary first: full reports validate against both models but keep their posts/comments only as UserReportModel
+ReportResponse = Union[UserReportSummaryModel, UserReportModel]
+
+#set REPORT_COALESCING=false to give every request its own lookup
+report_coalescer = RequestCoalescer(enabled=os.getenv("REPORT_COALESCING", "true").lower() != "false")
+
+@route.get("/reports", response_model=UserReportsResponseModel)
 async def get_user_reports(
-    page: int = Query(1, ge=1),
-    limit: int = Query(50, ge=1, le=100)
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=100),
+    summary_only: bool = Query(False, description="Only return the post and comment counts")
 ):
     '''
         Fetches list of users, their posts and comments to their posts
         Instead of pulling all values frokm db into memory, it uses mongo pipelines and aggregation
         for better memory management and also handles pagination by default
 
-        sending page and limit will cause pagination out the box
+        same cursor pagination as the other lists: the ObjectId of the last user of the previous page,
+        so every page costs the same no matter how deep the client pages and inserts do not shift pages
+        the documents come out of the pipeline in the shape of the report models and are returned as they are
     '''
     try:
-        skip = (page - 1) * limit
+        match_stage = {}
+        if cursor:
+            try:
+                #cursor must fit the ObjectID format of the MongoID so convert it here
+                match_stage["_id"] = {"$lt": ObjectId(cursor)}
+            except Exception as ex:
+                logger.error(str(ex))
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unexpected error")
 
-        #setup the aggregation pipeline here
+        #setup the aggregation pipeline here, one extra user tells whether there is another page
         pipeline = [
-            {"$skip": skip},
-            {"$limit": limit},
-            {
-                #join User with their posts and store them in posts 'object'
-                "$lookup": {
-                    "from": "posts",
-                    "localField": "id",
-                    "foreignField": "userId",
-                    "as": "posts"
-                }
-            },
-            {
-                #join user with the comments on their posts, store it as a comments 'object'
-                "$lookup": {
-                    "from": "comments",
-                    "localField": "posts.id",
-                    "foreignField": "postId",
-                    "as": "comments"
-                }
-            },
-            {
-                #count the contents of the 2 objects in the 2 lookup queries
-                "$addFields": {
-                    "posts_count": {"$size": "$posts"},
-                    "comments_count": {"$size": "$comments"}
-                }
-            }
+            {"$match": match_stage},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit + 1},
+            *report_stages(summary_only)
         ]
 
         # return users with their data
-        users_data = await mongo_connector.mongodb.db['users'].aggregate(pipeline).to_list(length=None)
+        reports = await mongo_connector.mongodb.db['users'].aggregate(pipeline).to_list(length=limit + 1)
 
-        reports = [
-            UserReportModel(
-                id=user['id'],
-                name=user['name'],
-                username=user['username'],
-                posts=[PostSummary(**post) for post in user['posts']],
-                comments=[CommentSummary(**comment) for comment in user['comments']],
-                posts_count=user['posts_count'],
-                comments_count=user['comments_count']
-            )
-            for user in users_data
-        ]
-        
-        return reports
+        has_more = len(reports) > limit
+        if has_more:
+            reports = reports[:-1]
+        next_cursor = None
+        if has_more and reports:
+            next_cursor = str(reports[-1]["_id"])
+
+        return UserReportsResponseModel(
+            reports=reports,
+            next_cursor=next_cursor,
+            has_more=has_more,
+            count=len(reports)
+        )
     #catch any other exceptions and raise them again
     except Exception:
         raise
@@ -78,73 +75,46 @@ async def get_user_reports(
         logger.error(str(ex))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error.")
     
+async def load_user_report(user_id: int, summary_only: bool):
+    '''
+        one round trip: the precomputed report, or for users without one the live pipeline,
+        whose empty result already means the user does not exist
+    '''
+    db = mongo_connector.mongodb.db
+    report = await report_snapshots.get_report(db, user_id, summary_only)
+    if report:
+        return report
+    #setup the aggregation pipeline here
+    pipeline = [
+        {
+            #match user ID here and then add the other pipeline valiues as before
+            "$match": {
+                "id": user_id
+            }
+        },
+        *report_stages(summary_only)
+    ]
+    user_data = await db['users'].aggregate(pipeline).to_list(length=1)
+    return user_data[0] if user_data else None
+
 #this route fetches a report for a specific user by their ID
-@route.get("/reports/{user_id}", response_model=UserReportModel)
-async def get_user_report(user_id: int):
+@route.get("/reports/{user_id}", response_model=ReportResponse)
+async def get_user_report(user_id: int, summary_only: bool = Query(False, description="Only return the post and comment counts")):
     '''
         Fetch single user report which includes their posts, and comments to the posts from the database. 
-        uses a pipeline again which matches the user_id parameter
+        reads the precomputed report (one indexed find_one), users without one yet fall back
+        to the live pipeline which matches the user_id parameter
+        concurrent requests for the same user share one in-flight lookup
     '''
     try:
-        #already check if user exists before we run the query
-        user_exists = await mongo_connector.mongodb.db['users'].count_documents({"id": user_id}, limit=1)
-        if not user_exists:
+        report = await report_coalescer.run((user_id, summary_only), lambda: load_user_report(user_id, summary_only))
+        if not report:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        #setup the aggregation pipeline here
-        pipeline = [
-            {
-                #match user ID here and then add the other pipeline valiues as before
-                "$match": {
-                    "id": user_id
-                }
-            },
-            {
-                #join User with their posts and store them in posts 'object'
-                "$lookup": {
-                    "from": "posts",
-                    "localField": "id",
-                    "foreignField": "userId",
-                    "as": "posts"
-                }
-            },
-            {
-                #join user with the comments on their posts, store it as a comments 'object'
-                "$lookup": {
-                    "from": "comments",
-                    "localField": "posts.id",
-                    "foreignField": "postId",
-                    "as": "comments"
-                }
-            },
-            {
-                #count the contents of the 2 objects in the 2 lookup queries
-                "$addFields": {
-                    "posts_count": {"$size": "$posts"},
-                    "comments_count": {"$size": "$comments"}
-                }
-            }
-        ]
-
-        # return users with their data
-        user_data = await mongo_connector.mongodb.db['users'].aggregate(pipeline).to_list(length=1)
-
-        if not user_data:
-            raise HTTPException(status_code=404, detail="User not found")
-        #return result as userreport model, doesnt include
-        user = user_data[0]
-        return UserReportModel(
-            id=user['id'],
-            name=user['name'],
-            username=user['username'],
-            posts=[PostSummary(**post) for post in user['posts']],
-            comments=[CommentSummary(**comment) for comment in user['comments']],
-            posts_count=user['posts_count'],
-            comments_count=user['comments_count']
-        )
+        return report
     
     #to ensure that the 404 is returned to client correctly instead of a generic 500 raise the exception again
     except HTTPException:
         raise   
     except Exception as e:
         logger.error(str(e))
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error") 
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error")
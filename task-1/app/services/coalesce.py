@@ -0,0 +1,24 @@
+#request coalescing: concurrent callers asking for the same key share one in-flight coroutine
+#instead of each running its own query, the first caller starts it and everybody awaits the same task
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+class RequestCoalescer:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        #callers that joined an already running task
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await factory()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        #shield: a caller that disconnects must not cancel the query for the others
+        return await asyncio.shield(task)
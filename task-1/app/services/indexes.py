@@ -0,0 +1,31 @@
+from mongoconnector.index_advisor import IndexSpec, QueryProbe
+'''
+indexes the task-1 routes rely on and one representative query per route
+provisioned at startup, see mongoconnector.index_advisor
+'''
+
+INDEXES = [
+    #single document lookups by the JSONPlaceholder id
+    IndexSpec("users", [("id", 1)]),
+    IndexSpec("posts", [("id", 1)]),
+    IndexSpec("comments", [("id", 1)]),
+    #filtered cursor pagination (newest first) and the $lookup joins of the reports
+    IndexSpec("posts", [("userId", 1), ("_id", -1)]),
+    IndexSpec("comments", [("postId", 1), ("_id", -1)]),
+    #precomputed reports, $merge needs a unique index on its "on" field
+    IndexSpec("user_reports", [("id", 1)], unique=True),
+]
+
+PROBES = [
+    QueryProbe("GET /users/{user_id}", "users", {"id": 1}),
+    QueryProbe("GET /posts/{post_id}", "posts", {"id": 1}),
+    QueryProbe("GET /posts?user_id", "posts", {"userId": 1}, sort={"_id": -1}),
+    QueryProbe("GET /comments/{comment_id}", "comments", {"id": 1}),
+    QueryProbe("GET /comments?post_id", "comments", {"postId": 1}, sort={"_id": -1}),
+    QueryProbe("GET /reports/{user_id}", "user_reports", {"id": 1}),
+    QueryProbe("GET /reports/{user_id} (no snapshot yet)", "users", pipeline=[
+        {"$match": {"id": 1}},
+        {"$lookup": {"from": "posts", "localField": "id", "foreignField": "userId", "as": "posts"}},
+        {"$lookup": {"from": "comments", "localField": "posts.id", "foreignField": "postId", "as": "comments"}},
+    ]),
+]
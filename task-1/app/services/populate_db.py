@@ -2,6 +2,7 @@
 # Import the requests module
 import httpx
 from motor.motor_asyncio import AsyncIOMotorClient
+from . import report_snapshots
 from dotenv import load_dotenv
 import os
 
@@ -27,6 +28,8 @@ async def populate_db(db: AsyncIOMotorClient):
                         data = response.json()
                     # Insert data into the MongoDB collection
                         await db[collection].insert_many(data)
+                        #the precomputed reports of the affected users are rebuilt after populating
+                        await report_snapshots.mark_dirty_for(db, collection, data)
                         print(f"Populated {collection} collection with {len(data)} documents.")
                     else:
                         print(f"Failed to fetch {collection} data: {response.status_code}")
@@ -0,0 +1,183 @@
+#precomputed user reports, one document per user in the user_reports collection
+#the reports are built with the same $lookup stages as the live /reports pipeline and written with $merge
+#writers (populate_db) mark the users whose posts or comments changed in a small dirty set,
+#only those users are rebuilt, so a single report read is one indexed find_one
+#staleness: marked users are rebuilt at startup and every REPORT_REFRESH_SECONDS, writes that bypass mark_dirty
+#(other clients of the database) show up after the full rebuild every REPORT_FULL_REFRESH_SECONDS;
+#users without a report are always served by the live pipeline (see routes/reports.py)
+import os
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import logging
+
+snapshot_collection = "user_reports"
+dirty_collection = "user_reports_dirty"
+
+#0 turns the periodic refresh, or only the full rebuild, off
+REPORT_REFRESH_SECONDS = float(os.getenv("REPORT_REFRESH_SECONDS", 300))
+REPORT_FULL_REFRESH_SECONDS = float(os.getenv("REPORT_FULL_REFRESH_SECONDS", 3600))
+
+logger = logging.getLogger("task-1")
+
+def report_stages(summary_only: bool = False) -> List[Dict]:
+    '''
+        joins posts and the comments on them to the matched users
+        the $lookup sub-pipelines only return the fields the report models need, the counts are computed in the database;
+        summary_only only keeps the post ids (for the comments join) and counts the comments without loading them
+    '''
+    if summary_only:
+        post_fields = {"_id": 0, "id": 1}
+        comment_stages = [{"$count": "total"}]
+        comments_count = {"$ifNull": [{"$first": "$comments.total"}, 0]}
+    else:
+        post_fields = {"_id": 0, "id": 1, "title": 1, "body": 1}
+        comment_stages = [{"$project": {"_id": 0, "id": 1, "postId": 1, "name": 1, "email": 1, "body": 1}}]
+        comments_count = {"$size": "$comments"}
+
+    #_id stays in the documents for the pagination cursor, the report models ignore it
+    report_fields = {"id": 1, "name": 1, "username": 1, "posts_count": 1, "comments_count": 1}
+    if not summary_only:
+        report_fields.update({"posts": 1, "comments": 1})
+    return [
+        {
+            #join User with their posts and store them in posts 'object'
+            "$lookup": {
+                "from": "posts",
+                "localField": "id",
+                "foreignField": "userId",
+                "pipeline": [{"$project": post_fields}],
+                "as": "posts"
+            }
+        },
+        {
+            #join user with the comments on their posts, store it as a comments 'object'
+            "$lookup": {
+                "from": "comments",
+                "localField": "posts.id",
+                "foreignField": "postId",
+                "pipeline": comment_stages,
+                "as": "comments"
+            }
+        },
+        {
+            #count the contents of the 2 objects in the 2 lookup queries
+            "$addFields": {
+                "posts_count": {"$size": "$posts"},
+                "comments_count": comments_count
+            }
+        },
+        {"$project": report_fields}
+    ]
+
+async def mark_dirty(db: AsyncIOMotorClient, user_ids: Iterable[int]):
+    '''queues users whose report has to be rebuilt'''
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    now = datetime.now(timezone.utc)
+    await db[dirty_collection].bulk_write(
+        [UpdateOne({"_id": user_id}, {"$set": {"marked_at": now}}, upsert=True) for user_id in user_ids],
+        ordered=False,
+    )
+
+async def mark_dirty_for(db: AsyncIOMotorClient, collection: str, documents: List[Dict]):
+    '''maps freshly written users, posts or comments to the users whose reports they change'''
+    if collection == "users":
+        user_ids = [document["id"] for document in documents]
+    elif collection == "posts":
+        user_ids = [document["userId"] for document in documents]
+    elif collection == "comments":
+        post_ids = list({document["postId"] for document in documents})
+        user_ids = await db["posts"].distinct("userId", {"id": {"$in": post_ids}})
+    else:
+        return
+    await mark_dirty(db, user_ids)
+
+async def refresh(db: AsyncIOMotorClient, user_ids: Optional[List[int]] = None):
+    '''
+        rebuilds the reports of the given users (all users when None) with $merge on the user id
+        reports of users that no longer exist are removed
+    '''
+    match_stage = {"id": {"$in": user_ids}} if user_ids is not None else {}
+    pipeline = [
+        {"$match": match_stage},
+        *report_stages(),
+        #user_reports has its own _id, replacing a report must not try to change it
+        {"$unset": "_id"},
+        {"$set": {"refreshed_at": "$$NOW"}},
+        {"$merge": {"into": snapshot_collection, "on": "id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    async for _ in db["users"].aggregate(pipeline):
+        pass
+
+    existing = await db["users"].distinct("id", match_stage)
+    stale_filter = {"id": {"$nin": existing}}
+    if user_ids is not None:
+        stale_filter["id"]["$in"] = user_ids
+    await db[snapshot_collection].delete_many(stale_filter)
+    logger.info(f"Refreshed user reports for {len(user_ids) if user_ids is not None else 'all'} users")
+
+async def refresh_dirty(db: AsyncIOMotorClient) -> int:
+    '''
+        rebuilds the reports of the queued users and clears their marks
+        marks set while the refresh runs are newer than the snapshot time and stay queued
+    '''
+    started = datetime.now(timezone.utc)
+    user_ids = [entry["_id"] async for entry in db[dirty_collection].find({"marked_at": {"$lte": started}}, {"_id": 1})]
+    if not user_ids:
+        return 0
+    await refresh(db, user_ids)
+    await db[dirty_collection].delete_many({"_id": {"$in": user_ids}, "marked_at": {"$lte": started}})
+    return len(user_ids)
+
+async def ensure_snapshots(db: AsyncIOMotorClient):
+    '''builds every report once when the collection is empty, otherwise only the queued users'''
+    if not await db[snapshot_collection].count_documents({}, limit=1):
+        await refresh(db)
+        await db[dirty_collection].delete_many({})
+        return
+    await refresh_dirty(db)
+
+async def refresh_periodically(db: AsyncIOMotorClient, interval: float = REPORT_REFRESH_SECONDS,
+                               full_interval: float = REPORT_FULL_REFRESH_SECONDS):
+    '''rebuilds the marked users every `interval` seconds and every report every `full_interval` seconds'''
+    last_full = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if full_interval and time.monotonic() - last_full >= full_interval:
+                await refresh(db)
+                last_full = time.monotonic()
+            else:
+                await refresh_dirty(db)
+        except Exception as ex:
+            #the reports stay as they are until the next attempt
+            logger.error(f"Refreshing the user reports failed: {ex}")
+
+_refresh_task: Optional[asyncio.Task] = None
+
+def start_refresher(db: AsyncIOMotorClient) -> bool:
+    '''runs refresh_periodically as a background task, returns False when REPORT_REFRESH_SECONDS is 0'''
+    global _refresh_task
+    if REPORT_REFRESH_SECONDS <= 0:
+        return False
+    _refresh_task = asyncio.create_task(refresh_periodically(db))
+    return True
+
+async def stop_refresher():
+    if _refresh_task and not _refresh_task.done():
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+
+async def get_report(db: AsyncIOMotorClient, user_id: int, summary_only: bool = False) -> Optional[Dict]:
+    projection = {"_id": 0, "refreshed_at": 0}
+    if summary_only:
+        projection.update({"posts": 0, "comments": 0})
+    return await db[snapshot_collection].find_one({"id": user_id}, projection)
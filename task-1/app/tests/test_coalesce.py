@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from ..services.coalesce import RequestCoalescer
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_query():
+    coalescer = RequestCoalescer()
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    results = await asyncio.gather(*(coalescer.run(1, query) for _ in range(5)))
+
+    assert calls == 1
+    assert results == [{"id": 1}] * 5
+    assert coalescer.coalesced == 4
+    #finished queries are not cached, the next call runs again
+    await coalescer.run(1, query)
+    assert calls == 2
+
+@pytest.mark.asyncio
+async def test_disabled_coalescer_runs_every_call():
+    coalescer = RequestCoalescer(enabled=False)
+    calls = 0
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+
+    await asyncio.gather(coalescer.run(1, query), coalescer.run(1, query))
+    assert calls == 2
@@ -0,0 +1,61 @@
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from mongoconnector import index_advisor
+from ..services import indexes
+
+class AsyncIndexCursor:
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+@pytest.mark.asyncio
+async def test_only_missing_indexes_are_created():
+    '''indexes that already exist with the same keys are not created again'''
+    existing = {
+        "users": [{"key": {"_id": 1}}, {"key": {"id": 1}}],
+        "posts": [{"key": {"_id": 1}}],
+        "comments": [{"key": {"_id": 1}}],
+        "user_reports": [{"key": {"_id": 1}}],
+    }
+    collections = {}
+    for name, items in existing.items():
+        collection = MagicMock()
+        collection.list_indexes = MagicMock(return_value=AsyncIndexCursor(items))
+        collection.create_index = AsyncMock(side_effect=lambda keys, **kwargs: "_".join(f"{k}_{d}" for k, d in keys))
+        collections[name] = collection
+    db = MagicMock()
+    db.__getitem__.side_effect = collections.__getitem__
+
+    created = await index_advisor.ensure_indexes(db, indexes.INDEXES)
+
+    assert "users.id_1" not in created
+    assert set(created) == {"posts.id_1", "comments.id_1", "posts.userId_1__id_-1", "comments.postId_1__id_-1", "user_reports.id_1"}
+    collections["users"].create_index.assert_not_awaited()
+
+def test_scan_stages_finds_collection_scans_and_unindexed_lookups():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "EQ_LOOKUP",
+                "foreignCollection": "users_data.posts",
+                "strategy": "NestedLoopJoin",
+                "inputStage": {"stage": "COLLSCAN", "namespace": "users_data.users"},
+            }
+        }
+    }
+    assert index_advisor.scan_stages(explain) == ["NestedLoopJoin users_data.posts", "COLLSCAN users_data.users"]
+    assert index_advisor.scan_stages({"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}) == []
+
+def test_sort_stages_finds_blocking_sorts():
+    explain = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+    assert index_advisor.sort_stages(explain) == ["SORT"]
+    assert index_advisor.sort_stages({"stages": [{"$cursor": {}}, {"$sort": {"sortKey": {"timestamp": 1}}}]}) == ["$sort"]
+    assert index_advisor.sort_stages({"stages": [{"$cursor": {}}, {"$_internalBoundedSort": {}}]}) == []
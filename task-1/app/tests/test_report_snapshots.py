@@ -0,0 +1,77 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from ..main import app, lifespan
+from ..services import report_snapshots
+
+@pytest.mark.asyncio
+async def test_new_comments_mark_the_post_authors_dirty():
+    '''comments change the report of the user who wrote the post, not of the commenter'''
+    posts = MagicMock()
+    posts.distinct = AsyncMock(return_value=[3, 7])
+    dirty = MagicMock()
+    dirty.bulk_write = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.side_effect = {"posts": posts, "user_reports_dirty": dirty}.__getitem__
+
+    await report_snapshots.mark_dirty_for(db, "comments", [{"postId": 11}, {"postId": 11}, {"postId": 12}])
+
+    posts.distinct.assert_awaited_once()
+    assert sorted(posts.distinct.call_args[0][1]["id"]["$in"]) == [11, 12]
+    updates = dirty.bulk_write.call_args[0][0]
+    assert [update._filter["_id"] for update in updates] == [3, 7]
+
+@pytest.mark.asyncio
+async def test_refresh_dirty_without_marks_does_nothing():
+    class EmptyCursor:
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            raise StopAsyncIteration
+
+    collection = MagicMock()
+    collection.find.return_value = EmptyCursor()
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    assert await report_snapshots.refresh_dirty(db) == 0
+    collection.aggregate.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_refresher_survives_failures_and_rebuilds_everything_periodically(monkeypatch):
+    '''a failed refresh is logged and retried, every full_interval all reports are rebuilt'''
+    clock = [0.0]
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+        if len(sleeps) > 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(report_snapshots.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(report_snapshots.asyncio, "sleep", sleep)
+    refresh_dirty = AsyncMock(side_effect=[RuntimeError("not primary"), 1])
+    refresh = AsyncMock()
+    monkeypatch.setattr(report_snapshots, "refresh_dirty", refresh_dirty)
+    monkeypatch.setattr(report_snapshots, "refresh", refresh)
+
+    with pytest.raises(asyncio.CancelledError):
+        await report_snapshots.refresh_periodically(MagicMock(), interval=10, full_interval=30)
+
+    assert refresh_dirty.await_count == 2
+    refresh.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_startup_continues_when_the_reports_cannot_be_built():
+    with patch('app.main.mongo_connector') as connector, \
+         patch('app.main.populate_db.populate_db', new=AsyncMock()), \
+         patch('app.main.index_advisor.provision_indexes', new=AsyncMock()), \
+         patch('app.main.report_snapshots.ensure_snapshots', new=AsyncMock(side_effect=RuntimeError("aggregation failed"))), \
+         patch('app.main.report_snapshots.start_refresher') as start_refresher:
+        connector.connect_to_mongo = AsyncMock()
+        connector.close_mongo_connection = AsyncMock()
+        async with lifespan(app):
+            start_refresher.assert_called_once()
+        connector.close_mongo_connection.assert_awaited_once()
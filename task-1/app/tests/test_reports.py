@@ -39,7 +39,7 @@ def test_fetch_reports_empty():
         response = client.get("/reports")
         assert response.status_code == 200
         
-        assert response.json() == []
+        assert response.json() == {"reports": [], "next_cursor": None, "has_more": False, "count": 0}
 
         # Verify the MongoDB aggregation was called correctly
         mock_collection.aggregate.assert_called_once()
@@ -48,8 +48,9 @@ def test_fetch_reports_empty():
         call_args = mock_collection.aggregate.call_args[0][0]
         # Check that pipeline contains expected stages
         pipeline_stages = [stage.keys() for stage in call_args]
-        assert any('$skip' in stage for stage in pipeline_stages)
+        assert any('$sort' in stage for stage in pipeline_stages)
         assert any('$limit' in stage for stage in pipeline_stages)
+        assert not any('$skip' in stage for stage in pipeline_stages)
         assert any('$lookup' in stage for stage in pipeline_stages)
         assert any('$addFields' in stage for stage in pipeline_stages)
 
@@ -65,7 +66,8 @@ def test_fetch_single_report(mock_reports: any):
         mock_users = AsyncMock()
         mock_db.__getitem__.return_value = mock_users
         
-        # Mock count_documents (user exists check)
+        # No precomputed report yet, the live pipeline answers
+        mock_users.find_one = AsyncMock(return_value=None)
         mock_users.count_documents = AsyncMock(return_value=1)
         
         # Mock the cursor returned by aggregate
@@ -90,7 +92,8 @@ def test_fetch_single_report(mock_reports: any):
         assert response_data["comments_count"] == 3
         
         # Verify database call structure
-        mock_users.count_documents.assert_awaited_once_with({"id": 1}, limit=1)
+        # A single round trip, no separate existence check
+        mock_users.count_documents.assert_not_awaited()
         mock_users.aggregate.assert_called_once()
 
         pipeline = mock_users.aggregate.call_args[0][0]
@@ -110,15 +113,20 @@ def test_fetch_single_report_not_found():
         mock_users_collection = AsyncMock()
         mock_db.__getitem__.return_value = mock_users_collection
         
-        # Mock count_documents returning 0 (user not found)
+        # No precomputed report and an empty aggregation result (user not found)
+        mock_users_collection.find_one = AsyncMock(return_value=None)
         mock_users_collection.count_documents = AsyncMock(return_value=0)
+        mock_cursor = MagicMock()
+        mock_cursor.to_list = AsyncMock(return_value=[])
+        mock_users_collection.aggregate = MagicMock(return_value=mock_cursor)
         
         response = client.get("/reports/999")  # Non-existent user ID
         assert response.status_code == 404
         assert response.json()["detail"] == "User not found"
         
         # Verify the database query
-        mock_users_collection.count_documents.assert_awaited_once_with({"id": 999}, limit=1)
+        mock_users_collection.count_documents.assert_not_awaited()
+        assert mock_users_collection.aggregate.call_args[0][0][0] == {"$match": {"id": 999}}
 
 def test_fetch_list_of_reports(mock_reports: any):
     '''returns list of posts and 200 success'''
@@ -147,13 +155,15 @@ def test_fetch_list_of_reports(mock_reports: any):
         response_data = response.json()
         
         # Check values
-        assert response_data[0]["id"] == 1
-        assert response_data[0]["name"] == "Tom"
-        assert response_data[0]["username"] == "tom34"
-        assert len(response_data[0]["posts"]) == 2
-        assert len(response_data[0]["comments"]) == 3
-        assert response_data[0]["posts_count"] == 2
-        assert response_data[0]["comments_count"] == 3
+        reports = response_data["reports"]
+        assert reports[0]["id"] == 1
+        assert reports[0]["name"] == "Tom"
+        assert reports[0]["username"] == "tom34"
+        assert len(reports[0]["posts"]) == 2
+        assert len(reports[0]["comments"]) == 3
+        assert reports[0]["posts_count"] == 2
+        assert reports[0]["comments_count"] == 3
+        assert response_data["has_more"] is False
         
         # Verify database call structure
         mock_users.aggregate.assert_called_once()
@@ -161,4 +171,61 @@ def test_fetch_list_of_reports(mock_reports: any):
         pipeline = mock_users.aggregate.call_args[0][0]  
         assert any(stage.get("$lookup", {}).get("from") == "posts" for stage in pipeline)
         assert any(stage.get("$lookup", {}).get("from") == "comments" for stage in pipeline)
-        assert any("$addFields" in stage for stage in pipeline)
\ No newline at end of file
+        assert any("$addFields" in stage for stage in pipeline)
+def test_fetch_reports_summary_only():
+    '''summary reports only carry the counts, comments are counted in the database instead of being loaded'''
+    with patch('app.routes.reports.mongo_connector.mongodb') as mock_mongodb:
+        mock_users = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_users
+        mock_cursor = MagicMock()
+        mock_cursor.to_list = AsyncMock(return_value=[{"id": 1, "name": "Tom", "username": "tom34", "posts_count": 2, "comments_count": 3}])
+        mock_users.aggregate = MagicMock(return_value=mock_cursor)
+
+        response = client.get("/reports", params={"summary_only": True})
+
+        assert response.status_code == 200
+        assert response.json()["reports"] == [{"id": 1, "name": "Tom", "username": "tom34", "posts_count": 2, "comments_count": 3}]
+
+        pipeline = mock_users.aggregate.call_args[0][0]
+        comments_lookup = next(stage["$lookup"] for stage in pipeline if stage.get("$lookup", {}).get("from") == "comments")
+        assert comments_lookup["pipeline"] == [{"$count": "total"}]
+        assert "posts" not in pipeline[-1]["$project"]
+
+def test_fetch_reports_next_page_uses_cursor(mock_reports: any):
+    '''a full page returns the ObjectId of its last user, the next page continues before it'''
+    with patch('app.routes.reports.mongo_connector.mongodb') as mock_mongodb:
+        mock_users = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_users
+        mock_cursor = MagicMock()
+        mock_cursor.to_list = AsyncMock(return_value=mock_reports)
+        mock_users.aggregate = MagicMock(return_value=mock_cursor)
+
+        response = client.get("/reports", params={"limit": 1})
+        page = response.json()
+        assert page["has_more"] and page["count"] == 1
+        assert page["next_cursor"] == str(mock_reports[0]["_id"])
+
+        client.get("/reports", params={"limit": 1, "cursor": page["next_cursor"]})
+        pipeline = mock_users.aggregate.call_args[0][0]
+        assert pipeline[0] == {"$match": {"_id": {"$lt": mock_reports[0]["_id"]}}}
+        assert pipeline[1] == {"$sort": {"_id": -1}}
+
+        assert client.get("/reports", params={"cursor": "not-an-objectid"}).status_code == 400
+
+def test_fetch_single_report_from_snapshot(mock_reports: any):
+    '''a precomputed report is a single find_one, the live pipeline is not run'''
+    with patch('app.routes.reports.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+        snapshot = {key: value for key, value in mock_reports[0].items() if key != "_id"}
+        mock_collection.find_one = AsyncMock(return_value=snapshot)
+        mock_collection.count_documents = AsyncMock()
+
+        response = client.get("/reports/1")
+
+        assert response.status_code == 200
+        assert response.json()["comments_count"] == 3
+        mock_mongodb.db.__getitem__.assert_called_once_with("user_reports")
+        mock_collection.find_one.assert_awaited_once_with({"id": 1}, {"_id": 0, "refreshed_at": 0})
+        mock_collection.count_documents.assert_not_awaited()
+        mock_collection.aggregate.assert_not_called()
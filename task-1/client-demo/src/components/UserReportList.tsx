@@ -11,7 +11,7 @@ const UserReportsList = () => {
     const [loading, setLoading] = useState(true);
     const [loadingMore, setLoadingMore] = useState(false);
     const [expandedPosts, setExpandedPosts] = useState(new Set());
-    const [page, setPage] = useState(1);
+    const [cursor, setCursor] = useState<string | null>(null);
     const [hasMore, setHasMore] = useState(true);
 
     // Initial data load
@@ -24,14 +24,14 @@ const UserReportsList = () => {
                 //setError(null);
 
                 const data = await fetchReports({
-                    page: 1, limit: 10
+                    limit: 10
                 });
 
 
                 if (mounted) {
-                    setReports(data);
-                    setHasMore(data.length === 10);
-                    setPage(1);
+                    setReports(data.reports);
+                    setHasMore(data.has_more);
+                    setCursor(data.next_cursor);
                 }
             } catch (err) {
                 if (mounted) {
@@ -60,19 +60,18 @@ const UserReportsList = () => {
             setLoadingMore(true);
             //setError(null);
 
-            const nextPage = page + 1;
-            const data = await fetchReports({ page: nextPage, limit: 10 });
+            const data = await fetchReports({ cursor, limit: 10 });
 
-            setReports(prev => [...prev, ...data]);
-            setHasMore(data.length === 10);
-            setPage(nextPage);
+            setReports(prev => [...prev, ...data.reports]);
+            setHasMore(data.has_more);
+            setCursor(data.next_cursor);
         } catch (err) {
             //setError(err.message || 'Failed to load more reports');
             console.error('Error loading more reports:', err);
         } finally {
             setLoadingMore(false);
         }
-    }, [page, loadingMore, hasMore]);
+    }, [cursor, loadingMore, hasMore]);
 
     // Scroll handler for infinite loading
     const handleScroll = useCallback((e: any) => {
@@ -106,7 +105,7 @@ const UserReportsList = () => {
     // Retry function
     const handleRetry = useCallback(() => {
         setReports([]);
-        setPage(1);
+        setCursor(null);
         setHasMore(true);
         setExpandedPosts(new Set());
         //setError(null);
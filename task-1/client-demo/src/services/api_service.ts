@@ -1,17 +1,17 @@
-import type { QueryParameters, UserReportInterface } from '../types/interfaces';
+import type { QueryParameters, UserReportsResponse } from '../types/interfaces';
 import { _get } from '../utils/http_utility';
-//fetches user reports and returns a User
+//fetches a page of user reports, pass the next_cursor of the previous page to continue
 
 export const fetchReports = async (
     params?: QueryParameters
-): Promise<UserReportInterface[]> => {
+): Promise<UserReportsResponse> => {
     try {
         const response = await _get(`/reports`, {
             params
         });
         if (response.status === 200)
             return response.data;
-        return [];
+        return { reports: [], next_cursor: null, has_more: false, count: 0 };
     } catch (error) {
         throw error; // rethrow the error for further handling
     }
@@ -30,7 +30,7 @@ interface Comment {
 }
 
 export interface QueryParameters {
-    page: number;
+    cursor?: string | null;
     limit: number;
 }
 
@@ -47,4 +47,11 @@ export interface UserReportInterface {
     comments: Comment[];
     posts_count: number;
     comments_count: number;
+}
+
+export interface UserReportsResponse {
+    reports: UserReportInterface[];
+    next_cursor: string | null;
+    has_more: boolean;
+    count: number;
 }
\ No newline at end of file
@@ -0,0 +1,81 @@
+'''
+columnar export of raw turbine readings, without starting the API
+    python -m api.export OUTPUT [--turbine-id ID] [--start-date DATE] [--end-date DATE] [--format parquet|arrow]
+                         [--batch-size N] [--limit N] [--database NAME]
+
+writes the same file as /timeseries/export: Parquet (zstd) or an Arrow IPC file that
+pyarrow.memory_map / pandas.read_feather load without copying, the format defaults to the OUTPUT extension
+dates are ISO 8601 like the API parameters, e.g. 2016-01-01 or 2016-01-01T12:00
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import List
+from dotenv import load_dotenv
+from customlogger import customlogger
+from mongoconnector import mongo_connector
+from .services import readings_export
+from .services.readings_stream import readings_query
+import logging
+
+logger = logging.getLogger("task-2")
+
+async def export(args: argparse.Namespace) -> int:
+    '''streams the selection into OUTPUT and reports rows and size'''
+    query = readings_query(args.turbine_id, args.start_date, args.end_date)
+    await mongo_connector.connect_to_mongo(args.database, service="task2")
+    started = time.perf_counter()
+    size = 0
+    try:
+        #written to a temporary file first so an interrupted export never leaves a truncated file behind
+        partial = args.output + ".partial"
+        try:
+            with open(partial, 'wb') as file:
+                async for chunk in readings_export.export_readings(mongo_connector.mongodb.db, query, args.format,
+                                                                    args.batch_size, args.limit):
+                    file.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(partial)
+            raise
+        os.replace(partial, args.output)
+    finally:
+        await mongo_connector.close_mongo_connection()
+    elapsed = time.perf_counter() - started
+    rows = readings_export.row_count(args.output, args.format)
+    print(f"{args.output}: {rows} readings, {size / 1e6:.1f} MB in {elapsed:.2f}s")
+    return 0
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m api.export", description="Export turbine readings to Parquet or Arrow IPC")
+    parser.add_argument("output", help="file to write, .parquet or .arrow")
+    parser.add_argument("--turbine-id", help="only this turbine, all turbines when omitted")
+    parser.add_argument("--start-date", type=datetime.fromisoformat, help="first timestamp, inclusive")
+    parser.add_argument("--end-date", type=datetime.fromisoformat, help="last timestamp, inclusive")
+    parser.add_argument("--format", choices=list(readings_export.FORMATS), help="defaults to the OUTPUT extension, else parquet")
+    parser.add_argument("--batch-size", type=int, default=readings_export.EXPORT_BATCH_SIZE, help="readings per record batch")
+    parser.add_argument("--limit", type=int, help="maximum number of readings")
+    parser.add_argument("--database", default=os.getenv('TURBINES_COLLECTION'), help="source database")
+    args = parser.parse_args(argv)
+    if not args.format:
+        args.format = "arrow" if args.output.endswith((".arrow", ".feather")) else "parquet"
+    return args
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    if args.start_date and args.end_date and args.start_date > args.end_date:
+        logger.error("--start-date must be earlier than --end-date")
+        return 2
+    if not args.database:
+        logger.error("No source database, pass --database or set TURBINES_COLLECTION")
+        return 2
+    return asyncio.run(export(args))
+
+if __name__ == "__main__":
+    load_dotenv()
+    customlogger.setup_logging()
+    sys.exit(main(sys.argv[1:]))
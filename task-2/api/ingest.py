@@ -0,0 +1,175 @@
+'''
+standalone CSV ingestion, without starting the API
+    python -m api.ingest [PATH ...] [--workers N] [--writers N] [--batch-size N] [--database NAME] [--dry-run]
+    python -m api.ingest [DIRECTORY] --watch [--database NAME]
+
+PATH is a CSV file (.csv, .csv.gz, .csv.zst or a .zip of CSV files) or a directory of them
+(default: the data/csv directory the API loads on startup),
+the filename without extension is used as the turbine_id like on startup and the ingestion manifest
+is honoured, so files that were loaded already are skipped and interrupted files resume
+
+--dry-run only parses the files in the process pool and writes nothing, comparing its parse rate with the
+write rate of a real run shows whether a slow load is bound by the CPU or by MongoDB
+
+--watch keeps running after the load and tails rows appended to the files of DIRECTORY, like the API does with WATCH_CSV=true
+while it runs (see csv_watcher), for deployments that load the data outside of the API
+'''
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+from dotenv import load_dotenv
+from customlogger import customlogger
+from mongoconnector import mongo_connector
+from mongoconnector.index_advisor import ensure_indexes
+from .services import csv_service, csv_sources, csv_watcher, indexes, ingest_manifest, power_curve_rollup, turbine_registry
+from .services.csv_sources import CsvSource
+import logging
+
+logger = logging.getLogger("task-2")
+
+def discover_files(paths: List[str]) -> List[CsvSource]:
+    '''every CSV source given directly or found in a given directory, one per member for zip archives'''
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.extend(csv_sources.discover(path))
+        elif os.path.isfile(path):
+            sources.extend(csv_sources.sources_for(path))
+        else:
+            raise FileNotFoundError(f"{path} does not exist.")
+    if not sources:
+        raise FileNotFoundError("No CSV files found.")
+    return csv_sources.unique_turbines(sources)
+
+def _rate(rows: int, seconds: float) -> str:
+    return f"{rows / seconds:,.0f} rows/s" if seconds > 0 else "-"
+
+async def dry_run(files: List[CsvSource], workers: int, batch_size: int) -> int:
+    '''
+        parses every file in the process pool and reports the parse rate per file and overall
+        workers only send counts back, so a dry run holds no more than one batch per worker in memory
+    '''
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(workers)
+
+    async def count(pool: ProcessPoolExecutor, source: CsvSource) -> Dict:
+        async with slots:
+            return await loop.run_in_executor(pool, csv_service.count_csv_file, source.path, source.turbine_id,
+                                              batch_size, 0, source.member)
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = await asyncio.gather(*[count(pool, source) for source in files])
+    elapsed = time.perf_counter() - started
+
+    for source, result in zip(files, results):
+        print(f"{source.name}: {result['rows']} rows ({result['skipped']} skipped), "
+              f"parse {result['parse_seconds']:.2f}s, {_rate(result['rows'], result['parse_seconds'])}")
+    rows = sum(result["rows"] for result in results)
+    parse_seconds = sum(result["parse_seconds"] for result in results)
+    print(f"dry run: {rows} rows from {len(files)} files in {elapsed:.2f}s, {_rate(rows, elapsed)} overall "
+          f"({workers} workers, {_rate(rows, parse_seconds)} per worker)")
+    return 0
+
+async def ingest(files: List[CsvSource], database: str, workers: int, writers: int, batch_size: int) -> int:
+    '''loads the files like the API startup does and reports parse and write rates separately'''
+    await mongo_connector.connect_to_mongo(database, service="task2")
+    try:
+        db = mongo_connector.mongodb.db
+        #the resume deletes and the dedupe pre-query need the turbine/timestamp index
+        await ensure_indexes(db, indexes.INDEXES)
+        await power_curve_rollup.ensure_rollups(db)
+        await turbine_registry.ensure_registry(db)
+
+        plans = [await ingest_manifest.plan_file(db, source.path, source.turbine_id, source.member) for source in files]
+        for plan in plans:
+            if plan.skip:
+                print(f"{plan.file_name}: already ingested, skipped")
+        pending = [plan for plan in plans if not plan.skip]
+        if not pending:
+            return 0
+
+        started = time.perf_counter()
+        stats = await csv_service.ingest_csv_files(db, pending, workers=workers, writers=writers, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+    finally:
+        await mongo_connector.close_mongo_connection()
+
+    for file_stats in stats:
+        print(f"{file_stats.file_name}: {file_stats.rows_written} rows written, {file_stats.rows_duplicate} duplicates, "
+              f"{file_stats.rows_failed} rejected, {file_stats.rows_skipped} skipped | "
+              f"parse {file_stats.parse_seconds:.2f}s {_rate(file_stats.rows_parsed, file_stats.parse_seconds)}, "
+              f"write {file_stats.write_seconds:.2f}s {_rate(file_stats.rows_written, file_stats.write_seconds)}"
+              + (f" | error: {file_stats.error}" if file_stats.error else ""))
+    rows_parsed = sum(file_stats.rows_parsed for file_stats in stats)
+    rows_written = sum(file_stats.rows_written for file_stats in stats)
+    parse_seconds = sum(file_stats.parse_seconds for file_stats in stats)
+    write_seconds = sum(file_stats.write_seconds for file_stats in stats)
+    #parse and write seconds are summed over the concurrent workers and writers, so their rates are per worker/writer
+    print(f"total: {rows_written} rows in {elapsed:.2f}s, {_rate(rows_written, elapsed)} overall | "
+          f"parse {_rate(rows_parsed, parse_seconds)} per worker ({workers}), "
+          f"write {_rate(rows_written, write_seconds)} per writer ({writers})")
+    return 1 if any(file_stats.error for file_stats in stats) else 0
+
+async def watch(directory: str, database: str, workers: int, writers: int, batch_size: int) -> int:
+    '''loads the directory like the API startup does and then tails it until interrupted'''
+    await mongo_connector.connect_to_mongo(database, service="task2")
+    watcher = csv_watcher.CsvWatcher(mongo_connector.mongodb.db, Path(directory))
+    try:
+        db = mongo_connector.mongodb.db
+        await ensure_indexes(db, indexes.INDEXES)
+        await csv_service.populate_time_series(db, workers, writers, batch_size, Path(directory))
+        await watcher.run()
+    finally:
+        for state in list(watcher.tails.values()):
+            await watcher.flush(state, force=True)
+        await mongo_connector.close_mongo_connection()
+    return 0
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m api.ingest", description="Load turbine CSV exports into MongoDB")
+    parser.add_argument("paths", nargs="*", default=[str(csv_service.csv_data_path)], help="CSV files or directories")
+    parser.add_argument("--workers", type=int, default=csv_service.INGEST_WORKERS, help="parser processes")
+    parser.add_argument("--writers", type=int, default=csv_service.INGEST_WRITERS, help="concurrent insert tasks")
+    parser.add_argument("--batch-size", type=int, default=csv_service.INGEST_BATCH_SIZE, help="CSV rows per insert")
+    parser.add_argument("--database", default=os.getenv('TURBINES_COLLECTION'), help="target database")
+    parser.add_argument("--dry-run", action="store_true", help="parse only, nothing is written")
+    parser.add_argument("--watch", action="store_true", help="keep tailing new rows of the directory after the load")
+    return parser.parse_args(argv)
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    if args.watch:
+        if len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+            logger.error("--watch needs a single CSV directory")
+            return 2
+        if not args.database:
+            logger.error("No target database, pass --database or set TURBINES_COLLECTION")
+            return 2
+        try:
+            return asyncio.run(watch(args.paths[0], args.database, args.workers, args.writers, args.batch_size))
+        except KeyboardInterrupt:
+            return 0
+    try:
+        files = discover_files(args.paths)
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        return 2
+    if args.dry_run:
+        return asyncio.run(dry_run(files, args.workers, args.batch_size))
+    if not args.database:
+        logger.error("No target database, pass --database or set TURBINES_COLLECTION")
+        return 2
+    return asyncio.run(ingest(files, args.database, args.workers, args.writers, args.batch_size))
+
+if __name__ == "__main__":
+    load_dotenv()
+    customlogger.setup_logging()
+    sys.exit(main(sys.argv[1:]))
@@ -1,11 +1,13 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from mongoconnector import mongo_connector  # import the MongoDB connection functions
+from mongoconnector import index_advisor, db_routes
 import logging
 from customlogger import customlogger
-from .services import csv_service  # import the CSV service
-from .routes import timeseries  # import the time-series routes
+from requestmetrics import requestmetrics, metrics_routes
+from .services import csv_service, csv_watcher, indexes  # import the CSV services and the index declarations
+from .routes import timeseries, ingestion  # import the time-series and ingestion routes
 
 from dotenv import load_dotenv
 import os
@@ -25,14 +27,23 @@ origins = ["http://localhost:3000",
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Connecting to database.....")
-    await mongo_connector.connect_to_mongo(os.getenv('TURBINES_COLLECTION'))
-    logger.info("Populating data")
-    await csv_service.populate_time_series(mongo_connector.mongodb.db)
+    #pool size, timeouts, compression etc. come from TASK2_MONGO_* / MONGO_* environment variables
+    await mongo_connector.connect_to_mongo(os.getenv('TURBINES_COLLECTION'), service="task2")
+    #create missing indexes before the ingestion starts, its resume deletes filter on turbine and timestamp
+    await index_advisor.provision_indexes(mongo_connector.mongodb.db, indexes.INDEXES, indexes.PROBES)
+    #populating runs in the background so the API (and health checks) answer right away
+    #progress is available on /ingestion/status
+    logger.info("Populating data in the background")
+    csv_service.start_background_ingestion(mongo_connector.mongodb.db)
+    #rows appended to the CSV files afterwards are tailed into the database, see /ingestion/watcher
+    csv_watcher.start_watcher(mongo_connector.mongodb.db)
     logger.info("Application started and connected to MongoDB")
     yield  # This is where the application runs
+    await csv_watcher.stop_watcher()
+    await csv_service.stop_background_ingestion()
     await mongo_connector.close_mongo_connection()
 
-app = FastAPI(lifespan=lifespan, title="TurbineDataApi")  # Use the lifespan context manager
+app = FastAPI(lifespan=lifespan, title="TurbineDataApi", dependencies=[Depends(db_routes.tag_route)])  # Use the lifespan context manager
 
 #add CORS middleware here to allow cross-origin requests
 #if added at the top, it will be overwritten and will cause CORS issues
@@ -44,11 +55,18 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],  # to allow downloading files
 )
+#per route latency, response size and status metrics, served on /metrics
+app.add_middleware(requestmetrics.MetricsMiddleware)
+requestmetrics.registry.add_collector(mongo_connector.prometheus_lines)
+app.include_router(metrics_routes.router)
 app.include_router(timeseries.route)
+app.include_router(ingestion.route)
+#MongoDB pool counters and command histograms as JSON on /db/pool and /db/metrics, shared with the other API
+app.include_router(db_routes.router)
 
 @app.get("/")
 async def root():
     """
     Default endpoint.
     """
-    return {"message": "Task-2 API Running!"}
\ No newline at end of file
+    return {"message": "Task-2 API Running!"}
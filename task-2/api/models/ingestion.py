@@ -0,0 +1,26 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, List
+
+class IngestionStatusModel(BaseModel):
+    state: str = Field(..., description="idle, scanning, running, completed or failed")
+    started_at: Optional[datetime] = Field(None, description="When the current or last run started")
+    finished_at: Optional[datetime] = Field(None, description="When the last run finished")
+    files_total: int = Field(..., description="Number of CSV files loaded by this run")
+    files_done: int = Field(..., description="Number of CSV files that are fully loaded")
+    files_failed: int = Field(..., description="Number of CSV files that stopped with an error")
+    rows_written: int = Field(..., description="Readings inserted by this run")
+    rows_duplicate: int = Field(0, description="Readings skipped because their turbine and timestamp were already stored")
+    rows_failed: int = Field(0, description="Readings the database rejected")
+    rows_per_second: float = Field(..., description="Average insert rate of this run")
+    eta_seconds: Optional[float] = Field(None, description="Estimated seconds until the run completes")
+    pending_turbines: List[str] = Field(default_factory=list, description="Turbines whose data is still loading")
+    error: Optional[str] = Field(None, description="Error of the last run, if it failed")
+
+class WatcherStatusModel(BaseModel):
+    enabled: bool = Field(..., description="Whether the CSV directory is watched for new rows (WATCH_CSV)")
+    directory: str = Field(..., description="Watched CSV directory")
+    files_tailed: int = Field(..., description="Number of CSV files whose new rows are being tailed")
+    rows_pending: int = Field(..., description="Rows read but not flushed to the database yet")
+    rows_written: int = Field(..., description="Readings inserted by the watcher since startup")
+    last_flush: Optional[datetime] = Field(None, description="When buffered rows were last written")
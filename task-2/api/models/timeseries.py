@@ -1,13 +1,13 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict
 
+#measurements that readings written before the schema change stored inside the metaField, see schema_migration
+LEGACY_METADATA_FIELDS = ["rpm", "azimuth", "external_temperature", "internal_temperature"]
+
+#the metaField of the time-series collection, only turbine identity and location so every turbine fills few buckets
 class TurbineMetadata(BaseModel):
     turbine_id: str = Field(..., description="Unique identifier for the turbine")
-    rpm: float = Field(..., description="Turbines rotations per minute")
-    azimuth: float = Field(..., description="Degrees or angles the direction in which points the rotor hub or a spinner of the turbine")
-    external_temperature: float = Field(..., description="Turbines recorded external temperature")
-    internal_temperature: float = Field(..., description="Turbines recorded internal temperature")
     latitude: Optional[float] = Field(..., description="Latitude of the turbine location")
     longitude: Optional[float] = Field(..., description="Longitude of the turbine location")
     altitude: Optional[float] = Field(..., description="Altitude of the turbine location in meters")
@@ -15,13 +15,74 @@ class TimeSeriesModel(BaseModel):
     timestamp: datetime = Field(..., description="Timestamp of the data point")
     power: float = Field(..., description="Power production in watts")
     wind_speed: float = Field(..., description="Wind speed in m/s")
+    rpm: float = Field(..., description="Turbines rotations per minute")
+    azimuth: float = Field(..., description="Degrees or angles the direction in which points the rotor hub or a spinner of the turbine")
+    external_temperature: float = Field(..., description="Turbines recorded external temperature")
+    internal_temperature: float = Field(..., description="Turbines recorded internal temperature")
     metadata: TurbineMetadata = Field(..., description="Turbine metadata")
 
+    @model_validator(mode="before")
+    @classmethod
+    def lift_legacy_measurements(cls, data: Any) -> Any:
+        '''readings that were not migrated yet keep their measurements in metadata'''
+        if isinstance(data, dict) and isinstance(data.get("metadata"), dict):
+            legacy = {name: data["metadata"][name] for name in LEGACY_METADATA_FIELDS if name in data["metadata"] and name not in data}
+            if legacy:
+                data = {**data, **legacy}
+        return data
+
+class TimeSeriesPageModel(BaseModel):
+    readings: List[TimeSeriesModel]
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor of the next page, None on the last page")
+    has_more: bool
+    count: int
+
+class CacheStatsModel(BaseModel):
+    size: int = Field(..., description="Number of cached responses")
+    maxsize: int = Field(..., description="Maximum number of cached responses before LRU eviction")
+    ttl_seconds: float = Field(..., description="Seconds a cached response stays valid")
+    hits: int = Field(..., description="Lookups answered from the cache")
+    misses: int = Field(..., description="Lookups that had to run the aggregation")
+    hit_ratio: float = Field(..., description="hits / (hits + misses)")
+    evictions: int = Field(..., description="Entries dropped because the cache was full")
+    expirations: int = Field(..., description="Entries dropped because their TTL passed")
+    invalidations: int = Field(..., description="Entries dropped because new data was ingested")
+    stale_sets: int = Field(..., description="Responses not cached because their turbine was invalidated while they were computed")
+
 class AggregatedTimeSeriesModel(BaseModel):
+    wind_speed_bin: Optional[float] = Field(None, description="Lower bound of the wind speed bin in m/s")
     average_power: float = Field(..., description="Average power production in watts")
     average_wind_speed: float = Field(..., description="Average wind speed in m/s")
     average_azimuth: float = Field(..., description="Average azimuth angle")
     average_external_temperature: float = Field(..., description="Average external temps")
     average_internal_temperature: float = Field(..., description="Average internal temps")
     average_rpm: float = Field(..., description="Average rotation speed")
-    average_azimuth: float = Field(..., description="Degrees or angles the direction in which points the rotor hub or a spinner of the turbine")
\ No newline at end of file
+    average_azimuth: float = Field(..., description="Degrees or angles the direction in which points the rotor hub or a spinner of the turbine")
+
+class TurbineCoverageModel(BaseModel):
+    turbine_id: str = Field(..., description="Unique identifier for the turbine")
+    first_timestamp: datetime = Field(..., description="Timestamp of the first reading")
+    last_timestamp: datetime = Field(..., description="Timestamp of the last reading")
+    readings: int = Field(..., description="Number of stored readings")
+    coverage: float = Field(..., description="Share of the 10 minute slots between first and last reading that hold a reading")
+    latitude: Optional[float] = Field(None, description="Latitude of the turbine location")
+    longitude: Optional[float] = Field(None, description="Longitude of the turbine location")
+    altitude: Optional[float] = Field(None, description="Altitude of the turbine location in meters")
+
+class TurbinePowerCurveModel(BaseModel):
+    turbine_id: str = Field(..., description="Unique identifier for the turbine")
+    power_curve: List[AggregatedTimeSeriesModel] = Field(..., description="Averages per wind speed bin")
+
+class DownsampledPointModel(BaseModel):
+    timestamp: datetime = Field(..., description="Start of the window (minmax) or time of the kept reading (lttb)")
+    value: float = Field(..., description="Window average (minmax) or reading value (lttb)")
+    min: Optional[float] = Field(None, description="Smallest value in the window, minmax only")
+    max: Optional[float] = Field(None, description="Largest value in the window, minmax only")
+    count: Optional[int] = Field(None, description="Readings in the window, minmax only")
+
+class DownsampledSeriesModel(BaseModel):
+    turbine_id: str = Field(..., description="Unique identifier for the turbine")
+    field: str = Field(..., description="Downsampled measurement")
+    method: str = Field(..., description="minmax or lttb")
+    window_minutes: Optional[int] = Field(None, description="Window length, minmax only")
+    points: List[DownsampledPointModel]
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, status
+import logging
+
+from mongoconnector import mongo_connector
+from ..models.ingestion import IngestionStatusModel, WatcherStatusModel
+from ..services import csv_service, csv_watcher
+from ..services.ingest_status import ingestion_status
+
+route = APIRouter()
+logger = logging.getLogger("task-2")
+
+@route.get("/ingestion/status", response_model=IngestionStatusModel)
+async def get_ingestion_status():
+    '''
+        progress of the background CSV ingestion: files done, rows/sec and ETA
+        the API serves requests while this runs, turbines in pending_turbines answer 503 until loaded
+    '''
+    return ingestion_status.snapshot()
+
+@route.post("/ingestion/run", response_model=IngestionStatusModel, status_code=status.HTTP_202_ACCEPTED)
+async def run_ingestion():
+    '''
+        starts an on-demand ingestion run which only loads new or appended CSV files
+    '''
+    if not csv_service.start_background_ingestion(mongo_connector.mongodb.db):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ingestion is already running")
+    logger.info("Started on-demand ingestion")
+    return ingestion_status.snapshot()
+
+@route.get("/ingestion/watcher", response_model=WatcherStatusModel)
+async def get_watcher_status():
+    '''
+        state of the watcher that tails new rows of the CSV files while the API runs
+    '''
+    return csv_watcher.watcher_status()
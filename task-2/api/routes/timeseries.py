@@ -1,17 +1,81 @@
 from fastapi import APIRouter, HTTPException, Query, Response, status
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pymongo import ASCENDING
 import logging
 
 
 from mongoconnector import mongo_connector
-from ..models.timeseries import TimeSeriesModel, AggregatedTimeSeriesModel
+from ..models.timeseries import TimeSeriesModel, TimeSeriesPageModel, AggregatedTimeSeriesModel, TurbinePowerCurveModel, CacheStatsModel
+from ..models.timeseries import DownsampledSeriesModel, TurbineCoverageModel
+from ..services.ingest_status import ingestion_status
+from ..services import power_curve_rollup, downsampling, turbine_registry, readings_export
+from ..services.response_cache import MISSING, normalize_datetime, power_curve_cache
+from ..services.readings_stream import NDJSON_MEDIA_TYPE, readings_query, stream_readings
+from ..services.readings_cursor import after_cursor, encode_cursor, page_sort
 
 route = APIRouter()
 logger = logging.getLogger("task-2")
 
+MAX_BINS = 1000
+MAX_FLEET_TURBINES = 100
+
+def default_date_range(start_date: Optional[datetime], end_date: Optional[datetime]):
+    #if dates dont exist i.e. its an API only call, set them to default values
+    if not start_date or not end_date:
+        start_date = datetime.strptime('01.01.2016, 00:00', '%d.%m.%Y, %H:%M')
+        end_date = datetime.strptime('02.01.2016, 00:00', '%d.%m.%Y, %H:%M')
+    #dates with Z or an offset become naive UTC like the stored timestamps, the rollup day split compares them with naive days
+    start_date, end_date = normalize_datetime(start_date), normalize_datetime(end_date)
+    if start_date >= end_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be earlier than end_date.")
+    return start_date, end_date
+
+def checked_date_range(start_date: Optional[datetime], end_date: Optional[datetime]):
+    '''optional bounds of the raw reading routes, normalized like default_date_range so aware and naive dates compare'''
+    start_date, end_date = normalize_datetime(start_date), normalize_datetime(end_date)
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be earlier than end_date.")
+    return start_date, end_date
+
+def bin_config(bin_size: float, min_wind_speed: float, max_wind_speed: float) -> power_curve_rollup.BinConfig:
+    if min_wind_speed > max_wind_speed:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_wind_speed must not be greater than max_wind_speed.")
+    bins = power_curve_rollup.BinConfig(bin_size, min_wind_speed, max_wind_speed)
+    if bins.bins > MAX_BINS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BINS} wind speed bins per request.")
+    return bins
+
+def curve_models(curve: Dict[float, Dict[str, float]]) -> List[AggregatedTimeSeriesModel]:
+    '''averages of the summed partials of every wind bin'''
+    results = []
+    for bin_start, sums in curve.items():
+        count = sums["count"]
+        results.append(AggregatedTimeSeriesModel(
+            wind_speed_bin=bin_start,
+            average_wind_speed=round(sums["wind_speed_sum"] / count, 2),
+            average_power=round(sums["power_sum"] / count, 2),
+            average_azimuth=round(sums["azimuth_sum"] / count, 2),
+            average_external_temperature=round(sums["external_temperature_sum"] / count, 2),
+            average_internal_temperature=round(sums["internal_temperature_sum"] / count, 2),
+            average_rpm = round(sums["rpm_sum"] / count, 2)
+        ))
+    return results
+
+def ensure_turbine_ready(turbine_id: Optional[str] = None):
+    '''
+        aggregations over a turbine that is still being loaded would return partial results,
+        answer 503 with Retry-After instead until the background ingestion has loaded it
+    '''
+    if not ingestion_status.is_turbine_ready(turbine_id):
+        target = f"Turbine {turbine_id}" if turbine_id else "Turbine data"
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{target} is still loading (warming up), see /ingestion/status",
+            headers={"Retry-After": "10"},
+        )
+
 #This was the initial endpoint I envisioned, just keeping for posterity
 #it simply pulled all data, unaggregated and showed timestamps etc
 #overally, it wasnt a good way of showcasing timeseries data at 10min intervals
@@ -28,19 +92,7 @@ async def get_time_series_data(
         endpoint was inefficient because it doesnt use aggregation of the timeseries data but is kept for posterity
     '''
     try:
-        query = {}
-        if turbine_id:
-            query['turbine_id'] = turbine_id
-
-        if start_date and end_date:
-            query['timestamp'] = {
-                '$gte': start_date,
-                '$lte': end_date
-            }
-        elif start_date:
-            query['timestamp'] = {'$gte': start_date}
-        elif end_date:
-            query['timestamp'] = {'$lte': end_date}
+        query = readings_query(turbine_id, start_date, end_date)
         #this adjustment allows for more flexible querying using a cursor from MongoDB
         cursor = mongo_connector.mongodb.db['turbine_readings'].find(query).sort('timestamp', ASCENDING).limit(limit)
         results = await cursor.to_list(length=limit)
@@ -56,72 +108,150 @@ async def get_time_series_data(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@route.get("/timeseries/page", response_model=TimeSeriesPageModel)
+async def get_time_series_page(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    turbine_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(1000, gt=0, le=10000),
+):
+    '''
+        pages through raw readings in timestamp order (turbine by turbine without turbine_id), same idea as the ObjectId cursor of the task-1 posts
+        the cursor is the position of the last reading of the previous page, so deep pages cost the same as the first
+    '''
+    try:
+        selection = readings_query(turbine_id, start_date, end_date)
+        query = after_cursor(selection, cursor)
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    cursor_motor = mongo_connector.mongodb.db['turbine_readings'].find(query)
+    cursor_motor = cursor_motor.sort(page_sort(selection)).limit(limit + 1)
+    readings = await cursor_motor.to_list(length=limit + 1)
+
+    #one extra reading tells whether there is another page
+    has_more = len(readings) > limit
+    if has_more:
+        readings = readings[:-1]
+    return TimeSeriesPageModel(
+        readings=readings,
+        next_cursor=encode_cursor(readings[-1]) if has_more else None,
+        has_more=has_more,
+        count=len(readings),
+    )
+
+@route.get("/timeseries/stream")
+async def stream_time_series_data(
+    turbine_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, gt=0, description="Maximum number of readings, all matching readings when omitted"),
+    batch_size: int = Query(1000, gt=0, le=10000, description="Readings fetched per cursor batch and written per chunk"),
+):
+    '''
+        streams raw readings as NDJSON (one reading per line) for exports
+        documents go from the cursor to the response without being collected or validated first,
+        so memory and time to first byte do not grow with the size of the result
+    '''
+    start_date, end_date = checked_date_range(start_date, end_date)
+    query = readings_query(turbine_id, start_date, end_date)
+    return StreamingResponse(
+        stream_readings(mongo_connector.mongodb.db, query, limit, batch_size),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+@route.get("/timeseries/export")
+async def export_time_series_data(
+    turbine_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    export_format: str = Query("parquet", alias="format", pattern="^(parquet|arrow)$",
+                               description="parquet (zstd compressed) or arrow (Arrow IPC file, memory-mappable)"),
+    limit: Optional[int] = Query(None, gt=0, description="Maximum number of readings, all matching readings when omitted"),
+):
+    '''
+        downloads raw readings as a columnar Parquet or Arrow IPC file for pandas/polars/duckdb
+        the file is written in record batches while the cursor is read, so memory does not grow with the selection
+    '''
+    start_date, end_date = checked_date_range(start_date, end_date)
+    query = readings_query(turbine_id, start_date, end_date)
+    media_type, _ = readings_export.FORMATS[export_format]
+    file_name = readings_export.file_name(turbine_id, start_date, end_date, export_format)
+    return StreamingResponse(
+        readings_export.export_readings(mongo_connector.mongodb.db, query, export_format, limit=limit),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+@route.get("/timeseries/downsampled", response_model=DownsampledSeriesModel)
+async def get_downsampled_time_series(
+    turbine_id: str,
+    start_date: Optional[datetime] = Query(None, description="Defaults to the first reading of the turbine"),
+    end_date: Optional[datetime] = Query(None, description="Defaults to the last reading of the turbine"),
+    field: str = Query("power", description="power, wind_speed, azimuth, external_temperature, internal_temperature or rpm"),
+    method: str = Query(downsampling.METHOD_MINMAX, description="minmax (time windows) or lttb (Largest-Triangle-Three-Buckets)"),
+    points: int = Query(500, ge=10, le=5000, description="Target number of chart points"),
+):
+    '''
+        reduces a turbine's series to about `points` chart points, so the payload size depends on the chart and not on the range
+        minmax groups readings into equal $dateTrunc windows in the database, lttb picks representative raw readings with NumPy
+    '''
+    if field not in power_curve_rollup.MEASUREMENTS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown field {field}.")
+    if method not in (downsampling.METHOD_MINMAX, downsampling.METHOD_LTTB):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown method {method}.")
+    ensure_turbine_ready(turbine_id)
+
+    db = mongo_connector.mongodb.db
+    if not start_date or not end_date:
+        bounds = await downsampling.series_bounds(db, turbine_id)
+        if not bounds:
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+        start_date, end_date = start_date or bounds[0], end_date or bounds[1]
+    #the bounds of the stored readings are naive UTC, a Z-suffixed date from the client is normalized to match
+    start_date, end_date = checked_date_range(start_date, end_date)
+
+    window = None
+    if method == downsampling.METHOD_MINMAX:
+        window, series = await downsampling.downsample_minmax(db, turbine_id, field, start_date, end_date, points)
+    else:
+        series = await downsampling.downsample_lttb(db, turbine_id, field, start_date, end_date, points)
+    return DownsampledSeriesModel(turbine_id=turbine_id, field=field, method=method, window_minutes=window, points=series)
+
 @route.get("/aggregated_timeseries", response_model=List[AggregatedTimeSeriesModel])
 async def get_power_curve(
     start_date: Optional[datetime] = Query(None, description="Start date in YYYY-MM-DD"),
     end_date: Optional[datetime] = Query(None, description="End date in YYYY-MM-DD"),
-    turbine_id: Optional[str] = None
+    turbine_id: Optional[str] = None,
+    bin_size: float = Query(power_curve_rollup.BIN_SIZE, gt=0, description="Width of the wind speed bins in m/s"),
+    min_wind_speed: float = Query(power_curve_rollup.MIN_WIND, ge=0, description="Start of the first bin in m/s"),
+    max_wind_speed: float = Query(power_curve_rollup.MAX_WIND, ge=0, description="Start of the last bin in m/s"),
 ):
     '''
-        fetches the time series data with optional query parameters (start-end date, turbine id)
+        fetches the time series data with optional query parameters (start-end date, turbine id, wind speed bins)
         by default, the start date is set to 01.01.2016 and the end date to 02.01.2016
         
-        uses mongo data buckets (size 0.5, can be adjusted as needed), pipelines and aggregation to generate a summary grouped by windspeed
-        
+        uses wind speed bins (size 0.5 from 0 to 25 by default), pipelines and aggregation to generate a summary grouped by windspeed
+        whole days are read from the pre-aggregated daily rollups when the bins line up with them, the rest from the raw readings
+        results are cached per turbine, date range and bin config until the ingestion writes new data for the turbine
     '''
     try:
-        #check if start_date and end_date exist.
-        #if dates dont exist i.e. its an API only call, set them to default values
-        if not start_date or not end_date:
-            start_date = datetime.strptime('01.01.2016, 00:00', '%d.%m.%Y, %H:%M')
-            end_date = datetime.strptime('02.01.2016, 00:00', '%d.%m.%Y, %H:%M')
-        if start_date >= end_date:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be earlier than end_date.")
-    
-        # Wind speed bins
-        bin_size = 0.5
-        min_wind = 0.0
-        max_wind = 25.0
-        boundaries = [round(min_wind + i * bin_size, 2) for i in range(int((max_wind - min_wind) / bin_size) + 1)]
-        boundaries.append(max_wind + bin_size)
-
-        match_stage = {"timestamp": {"$gte": start_date, "$lt": end_date}}
-        if turbine_id:
-            match_stage["metadata.turbine_id"] = turbine_id
-
-        pipeline = [
-            {"$match": match_stage},
-            {
-                "$bucket": {
-                    "groupBy": "$wind_speed",
-                    "boundaries": boundaries,
-                    "default": "out_of_range",
-                    "output": {
-                        "average_power": {"$avg": "$power"},
-                        "avg_wind_speed": {"$avg": "$wind_speed"},
-                        "avg_azimuth": {"$avg": "$metadata.azimuth"},
-                        "average_external_temperature": {"$avg": "$metadata.external_temperature" },
-                        "average_internal_temperature": {"$avg": "$metadata.internal_temperature"},
-                        "average_rpm": {"$avg": "$metadata.rpm"},
-                        "count": {"$sum": 1}
-                    }
-                }
-            },
-            {"$match": {"_id": {"$ne": "out_of_range"}}},
-            {"$sort": {"_id": 1}}
-        ]
+        start_date, end_date = default_date_range(start_date, end_date)
+        bins = bin_config(bin_size, min_wind_speed, max_wind_speed)
+        ensure_turbine_ready(turbine_id)
 
-        results = []
-        async for doc in mongo_connector.mongodb.db['turbine_readings'].aggregate(pipeline):
-            results.append(AggregatedTimeSeriesModel(
-                average_wind_speed=round(doc["avg_wind_speed"], 2),
-                average_power=round(doc["average_power"], 2),
-                average_azimuth=round(doc["avg_azimuth"], 2),
-                average_external_temperature=round(doc["average_external_temperature"], 2),
-                average_internal_temperature=round(doc["average_internal_temperature"], 2),
-                average_rpm = round(doc["average_rpm"], 2)
-            ))
+        cache_key = (turbine_id, start_date, end_date, bins)
+        cached = power_curve_cache.get(cache_key)
+        if cached is not MISSING:
+            return cached
+    
+        generation = power_curve_cache.generation(turbine_id)
+        curve = await power_curve_rollup.power_curve(mongo_connector.mongodb.db, start_date, end_date, turbine_id, bins)
+        results = curve_models(curve)
         
+        power_curve_cache.set(cache_key, results, turbine_id, generation)
         return results or []
     except Exception:
         raise
@@ -129,6 +259,51 @@ async def get_power_curve(
         logger.error(str(ex))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error")
 
+@route.get("/aggregated_timeseries/fleet", response_model=List[TurbinePowerCurveModel])
+async def get_fleet_power_curves(
+    turbine_ids: List[str] = Query(..., description="Turbines to compare, repeat the parameter per turbine"),
+    start_date: Optional[datetime] = Query(None, description="Start date in YYYY-MM-DD"),
+    end_date: Optional[datetime] = Query(None, description="End date in YYYY-MM-DD"),
+    bin_size: float = Query(power_curve_rollup.BIN_SIZE, gt=0, description="Width of the wind speed bins in m/s"),
+    min_wind_speed: float = Query(power_curve_rollup.MIN_WIND, ge=0, description="Start of the first bin in m/s"),
+    max_wind_speed: float = Query(power_curve_rollup.MAX_WIND, ge=0, description="Start of the last bin in m/s"),
+):
+    '''
+        power curves of several turbines side by side, computed with one aggregation grouped by turbine and bin
+        instead of one request per turbine; turbines without readings in the range get an empty curve
+    '''
+    turbine_ids = list(dict.fromkeys(turbine_ids))
+    if len(turbine_ids) > MAX_FLEET_TURBINES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_FLEET_TURBINES} turbines per request.")
+    start_date, end_date = default_date_range(start_date, end_date)
+    bins = bin_config(bin_size, min_wind_speed, max_wind_speed)
+    for turbine_id in turbine_ids:
+        ensure_turbine_ready(turbine_id)
+
+    #tagged like an all-turbine entry, so new data for any turbine invalidates it
+    cache_key = ("fleet", tuple(sorted(turbine_ids)), start_date, end_date, bins)
+    cached = power_curve_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+
+    generation = power_curve_cache.generation()
+    curves = await power_curve_rollup.power_curves(
+        mongo_connector.mongodb.db, start_date, end_date, turbine_ids, bins, per_turbine=True
+    )
+    results = [
+        TurbinePowerCurveModel(turbine_id=turbine_id, power_curve=curve_models(curves.get(turbine_id, {})))
+        for turbine_id in turbine_ids
+    ]
+    power_curve_cache.set(cache_key, results, generation=generation)
+    return results
+
+@route.get("/aggregated_timeseries/cache", response_model=CacheStatsModel)
+async def get_power_curve_cache_stats():
+    '''
+        hit/miss counters and size of the power curve response cache
+    '''
+    return power_curve_cache.stats()
+
 @route.get("/turbines", response_model=List[str])
 async def get_list_turbines():
     '''
@@ -136,8 +311,13 @@ async def get_list_turbines():
         so to avoid mistakes that comes with hardcoding them, extra endpoint to always pull
          turbines from DB.
            use this route to always fetch a fresh batch of turbin IDs from the database so that we populate the db 
+           ids come from the small turbines registry kept by the ingestion (cached in process),
+           distinct() over the readings is only used while the registry has not been filled yet
     '''
     try:
+        entries = await turbine_registry.list_turbines(mongo_connector.mongodb.db)
+        if entries:
+            return [entry["_id"] for entry in entries]
         turbinelist = await mongo_connector.mongodb.db['turbine_readings'].distinct('metadata.turbine_id')
         #to avoid serialisation problems in tests and api calls etcexplicitly  convert result to list
         turbinelist = list(turbinelist)
@@ -146,4 +326,19 @@ async def get_list_turbines():
 
     except Exception as e:
         logger.error(str(e))
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error")
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error")
+
+@route.get("/turbines/coverage", response_model=List[TurbineCoverageModel])
+async def get_turbines_coverage():
+    '''
+        first and last reading, reading count and location of every turbine straight from the registry, no readings are scanned
+    '''
+    try:
+        entries = await turbine_registry.list_turbines(mongo_connector.mongodb.db)
+        return [
+            TurbineCoverageModel(turbine_id=entry["_id"], coverage=turbine_registry.coverage(entry), **{key: value for key, value in entry.items() if key != "_id"})
+            for entry in entries
+        ]
+    except Exception as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error")
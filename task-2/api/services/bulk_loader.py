@@ -0,0 +1,160 @@
+'''
+batch writes of the CSV ingestion
+ - writes are unordered, so one bad reading does not abort the rest of its batch
+ - readings whose (turbine, timestamp) is already stored are dropped before the insert,
+   time-series collections cannot have unique indexes, so this is done with one range query per batch
+   which makes re-imports and retries safe
+ - failed writes are retried with exponential backoff: only the failed readings after a partial failure,
+   the whole batch (deduplicated again) after a network error; readings the server rejects for good are counted and dropped
+ - INGEST_DEDUPE=false skips the dedupe query for first attempts only, a batch resent after a network error is always
+   deduplicated because the server may have applied part of it
+
+INGEST_MODE=bulk switches the defaults to throughput for the initial load (bigger batches, more writers,
+w=1 without waiting for the journal), every INGEST_* variable that is set still wins
+'''
+
+import os
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Union
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+import logging
+
+INGEST_MODE = os.getenv("INGEST_MODE", "standard").lower()
+BULK_DEFAULTS = {
+    "INGEST_WRITERS": "8",
+    "INGEST_BATCH_SIZE": "10000",
+    "INGEST_WRITE_CONCERN": "1",
+    "INGEST_JOURNAL": "false",
+}
+
+logger = logging.getLogger("task-2")
+
+def setting(name: str, default: str) -> str:
+    '''INGEST_* variable, falling back to the bulk mode default and then to the standard default'''
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    return BULK_DEFAULTS.get(name, default) if INGEST_MODE == "bulk" else default
+
+INGEST_WRITE_CONCERN = setting("INGEST_WRITE_CONCERN", "")
+INGEST_JOURNAL = setting("INGEST_JOURNAL", "")
+INGEST_RETRIES = int(setting("INGEST_RETRIES", "3"))
+INGEST_RETRY_BACKOFF = float(setting("INGEST_RETRY_BACKOFF", "0.5"))
+INGEST_DEDUPE = setting("INGEST_DEDUPE", "true").lower() not in ("0", "false", "no")
+
+#server errors worth another attempt: interrupted, not primary, exceeded time limit, write conflict, shutdown...
+RETRYABLE_CODES = {6, 7, 11600, 11602, 10107, 13435, 13436, 189, 91, 89, 9001, 50, 112, 262}
+
+def write_concern(w: str = INGEST_WRITE_CONCERN, journal: str = INGEST_JOURNAL) -> Optional[WriteConcern]:
+    '''None keeps the collection default'''
+    if not w and not journal:
+        return None
+    options: Dict[str, Union[int, str, bool]] = {}
+    if w:
+        options["w"] = int(w) if w.isdigit() else w
+    if journal:
+        options["j"] = journal.lower() in ("1", "true", "yes")
+    return WriteConcern(**options)
+
+@dataclass
+class LoadResult:
+    inserted: List[Dict] = field(default_factory=list)
+    duplicates: int = 0
+    failed: int = 0
+    retries: int = 0
+
+def _key(document: Dict) -> Tuple[str, datetime]:
+    return document["metadata"]["turbine_id"], document["timestamp"]
+
+async def existing_keys(db: AsyncIOMotorClient, collection: str, documents: List[Dict]) -> Set[Tuple[str, datetime]]:
+    '''(turbine, timestamp) pairs of the batch that are already stored, one range query per turbine'''
+    ranges: Dict[str, List[datetime]] = {}
+    for document in documents:
+        turbine_id, timestamp = _key(document)
+        bounds = ranges.setdefault(turbine_id, [timestamp, timestamp])
+        bounds[0] = min(bounds[0], timestamp)
+        bounds[1] = max(bounds[1], timestamp)
+    keys = set()
+    for turbine_id, (first, last) in ranges.items():
+        cursor = db[collection].find(
+            {"metadata.turbine_id": turbine_id, "timestamp": {"$gte": first, "$lte": last}},
+            {"_id": 0, "timestamp": 1},
+        )
+        async for document in cursor:
+            keys.add((turbine_id, document["timestamp"]))
+    return keys
+
+async def deduplicate(db: AsyncIOMotorClient, collection: str, documents: List[Dict]) -> Tuple[List[Dict], int]:
+    '''drops readings that are stored already or repeated inside the batch, returns (new readings, dropped count)'''
+    seen = await existing_keys(db, collection, documents)
+    unique = []
+    for document in documents:
+        key = _key(document)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(document)
+    return unique, len(documents) - len(unique)
+
+def _is_retryable(error: Dict) -> bool:
+    return error.get("code") in RETRYABLE_CODES
+
+async def load_batch(db: AsyncIOMotorClient, collection: str, documents: List[Dict], dedupe: bool = INGEST_DEDUPE,
+                     retries: int = INGEST_RETRIES, backoff: float = INGEST_RETRY_BACKOFF,
+                     concern: Optional[WriteConcern] = None) -> LoadResult:
+    '''
+        inserts a batch unordered, returns the readings that were actually inserted so rollups only count those
+        raises the last error when retryable failures are left after every retry
+    '''
+    result = LoadResult()
+    target = db[collection]
+    concern = concern or write_concern()
+    if concern is not None:
+        target = target.with_options(write_concern=concern)
+
+    pending = documents
+    check = dedupe
+    attempt = 0
+    while True:
+        if check:
+            pending, duplicates = await deduplicate(db, collection, pending)
+            result.duplicates += duplicates
+        if not pending:
+            return result
+        try:
+            await target.insert_many(pending, ordered=False)
+            result.inserted.extend(pending)
+            return result
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            failed_indexes = {error["index"] for error in errors}
+            result.inserted.extend(document for index, document in enumerate(pending) if index not in failed_indexes)
+            retryable = [pending[error["index"]] for error in errors if _is_retryable(error)]
+            rejected = len(errors) - len(retryable)
+            if rejected:
+                result.failed += rejected
+                logger.warning(f"{rejected} readings were rejected: {errors[0].get('errmsg')}")
+            last_error: Exception = e
+            #the written readings are known, the failed ones can simply be sent again
+            pending, check = retryable, False
+        except ConnectionFailure as e:
+            #unknown how much of the batch made it, the dedupe on the next attempt skips what did, even with dedupe off
+            last_error, check = e, True
+        except OperationFailure as e:
+            if e.code not in RETRYABLE_CODES:
+                raise
+            last_error, check = e, True
+
+        if not pending:
+            return result
+        if attempt >= retries:
+            raise last_error
+        attempt += 1
+        result.retries += 1
+        delay = backoff * 2 ** (attempt - 1)
+        logger.warning(f"Retrying {len(pending)} readings in {delay:.1f}s (attempt {attempt} of {retries}): {last_error}")
+        await asyncio.sleep(delay)
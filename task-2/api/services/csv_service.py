@@ -1,27 +1,52 @@
 '''
-service runs on every application startup
-after connection to database is established, service checks if time-series collection is present
-and if it is not empty
-if it is empty, it checks the CSV directory for CSV files
-if CSV files are present, it reads them and populates the time-series collection
+service runs on every application startup (and on demand)
+after connection to database is established, service checks the CSV directory for CSV files
+and compares them with the ingestion manifest, see ingest_manifest
+only new or appended files are read into the time-series collection, a file that was interrupted
+resumes from its last committed batch
 it only takes data from the Dat/Zeit, Wind, and Leistung columns
 it also uses the filename as the turbine_id
+
+files are parsed in a process pool and the parsed batches are streamed through a bounded
+asyncio queue to several concurrent writers, so parsing and network I/O overlap.
+worker, writer, batch and queue sizes can be tuned with the INGEST_* environment variables
+batches are written unordered with retries and a (turbine, timestamp) dedupe, see bulk_loader;
+INGEST_MODE=bulk raises the writer and batch defaults for the initial load
 '''
 
 import os
 import csv
-from typing import List, Dict
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import List, Dict, Optional, Tuple, Iterator
 from datetime import datetime
+import numpy as np
 from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
 from ..models.timeseries import TimeSeriesModel, TurbineMetadata
+from . import bulk_loader, csv_sources, ingest_manifest, power_curve_rollup, turbine_registry
+from .ingest_status import ingestion_status
+from .response_cache import power_curve_cache
 import logging
 csv_data_path = Path(__file__).resolve().parents[3].joinpath("data/csv/")
 
 collection_name = "turbine_readings"
+
+#ingestion tuning, defaults keep the previous 1000 document batches
+#memory: a worker returns a whole parsed file in one result, so up to INGEST_WORKERS parsed files are held at once;
+#the queue only bounds how many of their batches wait for a writer, not the size of a single file
+INGEST_WORKERS = int(bulk_loader.setting("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_WRITERS = int(bulk_loader.setting("INGEST_WRITERS", "4"))
+INGEST_BATCH_SIZE = int(bulk_loader.setting("INGEST_BATCH_SIZE", "1000"))
+INGEST_QUEUE_SIZE = int(bulk_loader.setting("INGEST_QUEUE_SIZE", "16"))
 logger = logging.getLogger("task-2")
 
 #iterate through a selected CSV file and create a TimeSeriesModel document for each row
+#reference implementation, ingestion uses the columnar parse_csv_columns below which returns the same documents
 def parse_csv_row(row: Dict[str, str], turbine_id: str) -> Dict:
     #here, the timestamp is in the format 'dd.mm.yyyy, HH:MM' without seconds, so
     #we need to parse it correctly inclucing the comma
@@ -44,77 +69,495 @@ def parse_csv_row(row: Dict[str, str], turbine_id: str) -> Dict:
     longitude = row.get('Longitude')
     altitude = row.get('Altitude')
 
+    #measurements are top level fields, the metaField only holds what identifies the turbine
     return TimeSeriesModel(
         timestamp=timestamp,
         power=power,
         wind_speed=wind_speed,
+        rpm=rpm,
+        azimuth=azimuth,
+        external_temperature=external_temperature,
+        internal_temperature=internal_temperature,
         metadata=TurbineMetadata(
             turbine_id=turbine_id,
             latitude=float(latitude.replace(',', '.')) if latitude else None,
             longitude=float(longitude.replace(',', '.')) if longitude else None,
             altitude=float(altitude.replace(',', '.')) if longitude else None,
-            azimuth=azimuth,
-            external_temperature=external_temperature,
-            internal_temperature=internal_temperature,
-            rpm=rpm
         )
         ).model_dump() 
 
-#actual service to read CSVs then call parse_csv_row for each row and insert into MongoDB
-async def populate_time_series(db: AsyncIOMotorClient):
+#source column for every numeric measurement and the value used when the cell is empty
+#wind speed has no default, rows without it are skipped like parse_csv_row does
+MEASUREMENT_COLUMNS = {
+    "power": ("Leistung", 0.0),
+    "wind_speed": ("Wind", None),
+    "azimuth": ("Azimut", 0.0),
+    "external_temperature": ("Außen", 0.0),
+    "internal_temperature": ("Lager", 0.0),
+    "rpm": ("Rotor", 0.0),
+}
+LOCATION_COLUMNS = {"latitude": "Latitude", "longitude": "Longitude", "altitude": "Altitude"}
+TIMESTAMP_COLUMN = "Dat/Zeit"
+TIMESTAMP_FORMAT = "%d.%m.%Y, %H:%M"
+
+def read_csv_rows(file) -> Tuple[List[str], Iterator[List[str]]]:
+    '''
+        tokenizes an open CSV export, returns the stripped fieldnames and an iterator over the data rows
+        blank lines are dropped and the 2nd header row (units) is skipped, same as the DictReader path
+    '''
+    reader = csv.reader(file, delimiter=';')
+    rows = (row for row in reader if row)
+    fieldnames = [field.strip() for field in next(rows)]
+    next(rows, None)
+    return fieldnames, rows
+
+def _transpose(rows: List[List[str]], width: int) -> List[Tuple[str, ...]]:
+    #short rows behave like DictReader's missing values, i.e. empty, extra values are ignored
+    if any(len(row) != width for row in rows):
+        rows = [(row + [''] * width)[:width] for row in rows]
+    return list(zip(*rows))
+
+def _string_column(columns: List[Tuple[str, ...]], index: Optional[int], count: int) -> np.ndarray:
+    if index is None:
+        return np.full(count, '', dtype=str)
+    return np.array(columns[index], dtype=str)
+
+def _float_column(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+        converts a column of decimal comma strings, returns (values, empty mask, invalid mask)
+        empty cells come back as 0.0 so the caller can apply its own default
+    '''
+    empty = values == ''
+    cleaned = np.where(empty, '0', np.char.replace(values, ',', '.'))
+    try:
+        return cleaned.astype(np.float64), empty, np.zeros(len(values), dtype=bool)
+    except ValueError:
+        #at least one malformed number, convert one by one and flag the bad cells
+        converted = np.zeros(len(values), dtype=np.float64)
+        invalid = np.zeros(len(values), dtype=bool)
+        for i, value in enumerate(cleaned.tolist()):
+            try:
+                converted[i] = float(value)
+            except ValueError:
+                invalid[i] = True
+        return converted, empty, invalid
+
+def _timestamp_column(values: np.ndarray) -> Tuple[List[Optional[datetime]], np.ndarray]:
+    '''
+        decodes 'dd.mm.yyyy, HH:MM' timestamps, returns (datetimes, invalid mask)
+        fixed width values are rearranged into ISO strings and parsed by numpy in one go,
+        anything else falls back to strptime so the accepted input matches parse_csv_row
+    '''
+    values = np.char.strip(values)
+    count = len(values)
+    parsed: List[Optional[datetime]] = [None] * count
+    invalid = np.zeros(count, dtype=bool)
+
+    fixed = np.zeros(count, dtype=bool)
+    if count:
+        chars = values.astype('U17').view('U1').reshape(count, 17)
+        fixed = (np.char.str_len(values) == 17) & (chars[:, 2] == '.') & (chars[:, 5] == '.') \
+            & (chars[:, 10] == ',') & (chars[:, 11] == ' ') & (chars[:, 14] == ':')
+        digits = np.char.isdigit(chars[:, [0, 1, 3, 4, 6, 7, 8, 9, 12, 13, 15, 16]]).all(axis=1)
+        fixed &= digits
+
+    fixed_rows = np.flatnonzero(fixed)
+    fallback_rows = np.flatnonzero(~fixed).tolist()
+    if len(fixed_rows):
+        #dd.mm.yyyy, HH:MM -> yyyy-mm-ddTHH:MM
+        iso = chars[fixed_rows][:, [6, 7, 8, 9, 5, 3, 4, 2, 0, 1, 11, 12, 13, 14, 15, 16]].copy()
+        iso[:, [4, 7]] = '-'
+        iso[:, 10] = 'T'
+        iso = np.ascontiguousarray(iso).view('U16').ravel()
+        try:
+            decoded = iso.astype('datetime64[m]').astype('datetime64[us]').tolist()
+            for row, value in zip(fixed_rows.tolist(), decoded):
+                #numpy also accepts year 0, which datetime cannot represent
+                if isinstance(value, datetime):
+                    parsed[row] = value
+                else:
+                    fallback_rows.append(row)
+        except ValueError:
+            #out of range day or month somewhere, let strptime sort the rows out
+            fallback_rows = list(range(count))
+
+    for row in fallback_rows:
+        try:
+            parsed[row] = datetime.strptime(str(values[row]), TIMESTAMP_FORMAT)
+        except ValueError:
+            invalid[row] = True
+    return parsed, invalid
+
+def parse_csv_columns(rows: List[List[str]], fieldnames: List[str], turbine_id: str) -> Tuple[List[Dict], int]:
+    '''
+        columnar counterpart of parse_csv_row for a whole file or chunk of tokenized rows
+        every column is decoded into a NumPy array at once and turned into insert-ready dicts
+        without building any Pydantic models, returns (documents, skipped rows)
+    '''
+    if not rows:
+        return [], 0
+    #like a DictReader, a repeated header name resolves to its last column
+    positions = {name: index for index, name in enumerate(fieldnames)}
+    required = [TIMESTAMP_COLUMN] + [column for column, _ in MEASUREMENT_COLUMNS.values()]
+    if any(column not in positions for column in required):
+        return [], len(rows)
+
+    count = len(rows)
+    table = _transpose(rows, len(fieldnames))
+    timestamps, invalid = _timestamp_column(_string_column(table, positions[TIMESTAMP_COLUMN], count))
+
+    columns: Dict[str, List] = {}
+    for name, (column, default) in MEASUREMENT_COLUMNS.items():
+        values, empty, bad = _float_column(_string_column(table, positions[column], count))
+        invalid |= bad
+        if default is None:
+            invalid |= empty
+        else:
+            values[empty] = default
+        columns[name] = values.tolist()
+
+    #location columns are optional, altitude is only read when a longitude is present
+    latitude, latitude_empty, latitude_bad = _float_column(_string_column(table, positions.get(LOCATION_COLUMNS["latitude"]), count))
+    longitude, longitude_empty, longitude_bad = _float_column(_string_column(table, positions.get(LOCATION_COLUMNS["longitude"]), count))
+    altitude, altitude_empty, altitude_bad = _float_column(_string_column(table, positions.get(LOCATION_COLUMNS["altitude"]), count))
+    has_longitude = ~longitude_empty
+    invalid |= latitude_bad | longitude_bad | (has_longitude & (altitude_empty | altitude_bad))
+    for name, values, present in (
+        ("latitude", latitude, ~latitude_empty),
+        ("longitude", longitude, has_longitude),
+        ("altitude", altitude, has_longitude),
+    ):
+        columns[name] = [value if keep else None for value, keep in zip(values.tolist(), present.tolist())]
+
+    documents = [
+        {
+            "timestamp": timestamps[i],
+            "power": columns["power"][i],
+            "wind_speed": columns["wind_speed"][i],
+            "rpm": columns["rpm"][i],
+            "azimuth": columns["azimuth"][i],
+            "external_temperature": columns["external_temperature"][i],
+            "internal_temperature": columns["internal_temperature"][i],
+            "metadata": {
+                "turbine_id": turbine_id,
+                "latitude": columns["latitude"][i],
+                "longitude": columns["longitude"][i],
+                "altitude": columns["altitude"][i],
+            },
+        }
+        for i in np.flatnonzero(~invalid).tolist()
+    ]
+    return documents, int(invalid.sum())
+
+def _parse_chunks(file_path: str, turbine_id: str, batch_size: int, start_row: int,
+                  member: Optional[str]) -> Iterator[Tuple[int, List[Dict], int]]:
+    '''(end_row, documents, skipped rows) for every `batch_size` CSV rows after the first `start_row`'''
+    end_row = start_row
+    #.csv.gz/.csv.zst files and zip members are decompressed while they are read
+    with csv_sources.open_text(file_path, member) as file:
+        fieldnames, reader = read_csv_rows(file)
+        for _ in islice(reader, start_row):
+            pass
+        while True:
+            chunk = list(islice(reader, batch_size))
+            if not chunk:
+                break
+            documents, chunk_skipped = parse_csv_columns(chunk, fieldnames, turbine_id)
+            end_row += len(chunk)
+            yield end_row, documents, chunk_skipped
+
+#runs inside a worker process, so it must stay a plain top level function that only returns picklable data
+def parse_csv_file(file_path: str, turbine_id: str, batch_size: int = INGEST_BATCH_SIZE, start_row: int = 0,
+                   member: Optional[str] = None) -> Dict:
+    '''
+        parses a CSV file into batches of insert-ready documents using the columnar parser
+        every batch covers `batch_size` CSV rows and is returned as (end_row, documents) so progress
+        can be committed per batch, even for chunks where every row was skipped
+        the first `start_row` data rows are skipped when resuming a file
+    '''
+    started = time.perf_counter()
+    batches: List[Tuple[int, List[Dict]]] = []
+    rows = 0
+    skipped = 0
+    for end_row, documents, chunk_skipped in _parse_chunks(file_path, turbine_id, batch_size, start_row, member):
+        rows += len(documents)
+        skipped += chunk_skipped
+        batches.append((end_row, documents))
+
+    return {
+        "batches": batches,
+        "rows": rows,
+        "skipped": skipped,
+        "parse_seconds": time.perf_counter() - started,
+    }
+
+#worker process function like parse_csv_file, for benchmarks: the documents are dropped per batch, only counts are returned
+def count_csv_file(file_path: str, turbine_id: str, batch_size: int = INGEST_BATCH_SIZE, start_row: int = 0,
+                   member: Optional[str] = None) -> Dict:
+    started = time.perf_counter()
+    rows = 0
+    skipped = 0
+    for _, documents, chunk_skipped in _parse_chunks(file_path, turbine_id, batch_size, start_row, member):
+        rows += len(documents)
+        skipped += chunk_skipped
+    return {"rows": rows, "skipped": skipped, "parse_seconds": time.perf_counter() - started}
+
+@dataclass
+class FileIngestStats:
+    '''
+        throughput and progress bookkeeping for a single CSV file
+        parse time is measured in the worker process, write time is the sum of the insert_many calls
+        batches can finish out of order across writers, so the committed row only moves forward
+        over the contiguous prefix of written batches
+    '''
+    file_name: str
+    turbine_id: str
+    start_row: int = 0
+    size: int = 0
+    rows_parsed: int = 0
+    rows_skipped: int = 0
+    rows_duplicate: int = 0
+    rows_failed: int = 0
+    rows_written: int = 0
+    rows_committed: int = 0
+    last_timestamp: Optional[datetime] = None
+    batches_total: Optional[int] = None
+    batches_written: int = 0
+    parse_seconds: float = 0.0
+    write_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    next_commit: int = 0
+    written: Dict[int, Tuple[int, Optional[datetime]]] = field(default_factory=dict)
+
+    @property
+    def done(self) -> bool:
+        return self.batches_total is not None and self.batches_written >= self.batches_total
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.elapsed if self.elapsed > 0 else 0.0
+
+async def _commit_batch(db: AsyncIOMotorClient, stats: FileIngestStats, index: int, end_row: int, last_timestamp: Optional[datetime]):
+    stats.written[index] = (end_row, last_timestamp)
+    advanced = False
+    while stats.next_commit in stats.written:
+        end_row, last_timestamp = stats.written.pop(stats.next_commit)
+        stats.rows_committed = end_row
+        if last_timestamp is not None:
+            stats.last_timestamp = max(stats.last_timestamp or last_timestamp, last_timestamp)
+        stats.next_commit += 1
+        advanced = True
+    if advanced:
+        await ingest_manifest.record_progress(db, stats.file_name, stats.rows_committed, stats.last_timestamp)
+
+async def _finish_file(db: AsyncIOMotorClient, stats: FileIngestStats):
+    #only report once, when parsing has finished and every batch of the file has been written
+    if stats.finished is not None or not stats.done:
+        return
+    stats.finished = time.perf_counter()
+    if stats.error:
+        #keep the manifest in progress, the next run resumes after the last committed batch
+        logger.error(f"Ingestion of {stats.file_name} stopped at row {stats.rows_committed}: {stats.error}")
+        return
+    await ingest_manifest.mark_complete(db, stats.file_name, stats.rows_committed)
+    logger.info(
+        f"Ingested {stats.file_name}: {stats.rows_written} rows ({stats.rows_skipped} skipped, "
+        f"{stats.rows_duplicate} duplicates, {stats.rows_failed} rejected) "
+        f"in {stats.elapsed:.2f}s, {stats.rows_per_second:.0f} rows/s "
+        f"(parse {stats.parse_seconds:.2f}s, write {stats.write_seconds:.2f}s)"
+    )
+
+async def _parse_file(db: AsyncIOMotorClient, loop, pool: ProcessPoolExecutor, slots: asyncio.Semaphore,
+                      queue: asyncio.Queue, plan: ingest_manifest.FilePlan, stats: FileIngestStats, batch_size: int):
+    #a slot is held until every batch of the file has been queued, so at most
+    #`workers` parsed files are held in memory next to the bounded queue
+    async with slots:
+        try:
+            await ingest_manifest.prepare_file(db, plan)
+            result = await loop.run_in_executor(pool, parse_csv_file, plan.file_path, stats.turbine_id, batch_size, plan.start_row, plan.member)
+        except Exception as e:
+            stats.error = str(e)
+            stats.finished = time.perf_counter()
+            logger.error(f"Failed to parse {stats.file_name}: {e}")
+            return
+        stats.rows_parsed = result["rows"]
+        stats.rows_skipped = result["skipped"]
+        stats.parse_seconds = result["parse_seconds"]
+        stats.batches_total = len(result["batches"])
+        for index, (end_row, documents) in enumerate(result["batches"]):
+            await queue.put((stats, index, end_row, documents))
+        #files without any new rows never reach a writer
+        await _finish_file(db, stats)
+
+async def write_documents(db: AsyncIOMotorClient, turbine_id: str, documents: List[Dict]) -> bulk_loader.LoadResult:
+    '''
+        inserts parsed readings and folds the inserted ones into the rollups and the registry
+        rollups and registry are updated before the caller commits the rows, a crash in between is repaired by the resume;
+        only readings that were inserted count, duplicates of a re-import are already in there
+    '''
+    result = await bulk_loader.load_batch(db, collection_name, documents)
+    if result.inserted:
+        await power_curve_rollup.apply_batch(db, result.inserted)
+        await turbine_registry.apply_batch(db, result.inserted)
+        power_curve_cache.invalidate(turbine_id)
+    return result
+
+async def _write_batches(db: AsyncIOMotorClient, queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        try:
+            if item is None:
+                return
+            stats, index, end_row, documents = item
+            started = time.perf_counter()
+            try:
+                if documents:
+                    result = await write_documents(db, stats.turbine_id, documents)
+                    stats.rows_written += len(result.inserted)
+                    stats.rows_duplicate += result.duplicates
+                    stats.rows_failed += result.failed
+                #after a failed batch nothing later in the file is committed, a resume deletes it again
+                if not stats.error:
+                    await _commit_batch(db, stats, index, end_row, documents[-1]["timestamp"] if documents else None)
+            except Exception as e:
+                stats.error = str(e)
+                logger.error(f"Failed to insert batch for {stats.turbine_id}: {e}")
+            stats.write_seconds += time.perf_counter() - started
+            stats.batches_written += 1
+            await _finish_file(db, stats)
+        finally:
+            queue.task_done()
+
+async def ingest_csv_files(db: AsyncIOMotorClient, plans: List[ingest_manifest.FilePlan], workers: Optional[int] = None,
+                           writers: Optional[int] = None, batch_size: Optional[int] = None) -> List[FileIngestStats]:
+    '''
+        parses the planned CSV files in a process pool and inserts the batches with concurrent writers
+        each plan carries the turbine_id and the row to start from, see ingest_manifest.plan_file
+        at most `workers` parsed files are held in memory, see INGEST_WORKERS
+        returns the per-file throughput stats
+    '''
+    workers = workers or INGEST_WORKERS
+    writers = writers or INGEST_WRITERS
+    batch_size = batch_size or INGEST_BATCH_SIZE
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    slots = asyncio.Semaphore(workers)
+    stats = [
+        FileIngestStats(file_name=plan.file_name, turbine_id=plan.turbine_id, start_row=plan.start_row,
+                        rows_committed=plan.start_row, size=plan.size)
+        for plan in plans
+    ]
+    ingestion_status.ingesting(stats)
+
+    started = time.perf_counter()
+    #spawn instead of fork, the event loop and motor already run background threads
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    writer_tasks = [asyncio.create_task(_write_batches(db, queue)) for _ in range(writers)]
     try:
-        #now check if the timeseries collection exists is empty
-        document_count = await db[collection_name].count_documents({})
-
-        if document_count == 0:
-            logger.info(f"Collection {collection_name} is empty. Populating it from CSV files.")
-            #check if the CSV data directory exists
-            if not os.path.exists(csv_data_path):
-                raise FileNotFoundError(f"CSV directory {csv_data_path} does not exist.")
-            
-            #now check if there are any CSV files in the directory
-            csv_files = [f for f in os.listdir(csv_data_path) if f.endswith('.csv')]
-            if not csv_files:
-                raise FileNotFoundError("No CSV files found in the directory.")
-            
-            #since csv_files is not empty, iterate through each file
-            for csv_file in csv_files:
-                file_path = os.path.join(csv_data_path, csv_file)
-                turbine_id = Path(csv_file).stem  # extract filename and remove extension to use as turbine_id
-                logger.info(f"Processing file: {csv_file} with turbine_id: {turbine_id}")
-
-                #Files have more than 10k lines, so to be safe with memory issues, perfomance
-                #and mongo batch insert, read the data in chunks
-                batch: List[Dict] = []
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    reader = csv.DictReader(file, delimiter=';')
-
-                    #fieldnames in 1st row contain spaces, so we need to strip them
-                    reader.fieldnames = [field.strip() for field in reader.fieldnames]
-                    #2nd data row is also part of header so skip it
-                    next(reader)
-
-                    for row in reader:
-                        try:
-                            document = parse_csv_row(row, turbine_id)
-                            batch.append(document)
-
-                            #once batch reaches 1000 documents, insert into MongoDB and clear it
-                            if len(batch) >= 1000:
-                                await db[collection_name].insert_many(batch)
-                                #print(f"Inserted {len(batch)} documents into {collection_name}.")
-                                batch.clear()
-                        except Exception as e:
-                            logger.info(f"Skipping row due to error: {e}")
-                            continue
-                    #we are chuncking in multiples of 1000
-                    #some documents may remain, so insert them here
-                    if batch:
-                        await db[collection_name].insert_many(batch)
-                        logger.info(f"Inserted remaining {len(batch)} documents into {collection_name}.")
-
-                logger.info(f"Populated {collection_name} collection with data from {len(csv_files)} CSV files.")
-            else:
-                logger.info(f"{collection_name} collection already exists and is not empty. No action taken.")
+        await asyncio.gather(*[
+            _parse_file(db, loop, pool, slots, queue, plan, file_stats, batch_size)
+            for plan, file_stats in zip(plans, stats)
+        ])
+        #one stop marker per writer once every batch has been queued
+        for _ in writer_tasks:
+            await queue.put(None)
+        await asyncio.gather(*writer_tasks)
+        #waiting for the worker processes to exit blocks, keep it off the event loop
+        await asyncio.to_thread(pool.shutdown)
+    finally:
+        #when cancelled (app shutdown) don't block the event loop on files that are still being parsed
+        for task in writer_tasks:
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(s.rows_written for s in stats)
+    logger.info(
+        f"Inserted {total_rows} documents from {len(plans)} files in {elapsed:.2f}s "
+        f"({total_rows / elapsed if elapsed > 0 else 0:.0f} rows/s, {workers} workers, {writers} writers)"
+    )
+    return stats
+
+async def ingest_csv_directory(db: AsyncIOMotorClient, directory: Path = csv_data_path, workers: Optional[int] = None,
+                               writers: Optional[int] = None, batch_size: Optional[int] = None) -> List[FileIngestStats]:
+    '''
+        loads only the CSV files that are new, appended or changed since the last run according to the manifest
+        can be called on startup or on demand while the API is running
+    '''
+    #check if the CSV data directory exists
+    if not os.path.exists(directory):
+        raise FileNotFoundError(f"CSV directory {directory} does not exist.")
+
+    #now check if there are any CSV files in the directory, .csv.gz/.csv.zst files and zip archives included
+    sources = csv_sources.discover(directory)
+    if not sources:
+        raise FileNotFoundError("No CSV files found in the directory.")
+    ingestion_status.scanning([source.turbine_id for source in sources])
+
+    #the filename without extension (of the zip member for archives) is used as the turbine_id
+    plans = [
+        await ingest_manifest.plan_file(db, source.path, source.turbine_id, source.member)
+        for source in sources
+    ]
+    pending = [plan for plan in plans if not plan.skip]
+    for plan in pending:
+        logger.info(f"Processing file: {plan.file_name} with turbine_id: {plan.turbine_id} ({plan.reason}, from row {plan.start_row})")
+    if not pending:
+        logger.info(f"All {len(plans)} CSV files are already ingested. No action taken.")
+        return []
+    return await ingest_csv_files(db, pending, workers=workers, writers=writers, batch_size=batch_size)
+
+#held by an ingestion run and by every poll of the csv_watcher, so both never write the same file at once
+ingestion_lock = asyncio.Lock()
+
+#actual service to read CSVs and insert them into MongoDB
+async def populate_time_series(db: AsyncIOMotorClient, workers: Optional[int] = None,
+                               writers: Optional[int] = None, batch_size: Optional[int] = None, directory: Path = csv_data_path):
+    if not ingestion_status.running:
+        ingestion_status.begin()
+    try:
+        #waits for a poll of the csv_watcher that is writing right now, the run takes over its files
+        async with ingestion_lock:
+            #readings loaded before the rollups existed are backfilled once, every turbine counts as warming up meanwhile
+            await power_curve_rollup.ensure_rollups(db)
+            await turbine_registry.ensure_registry(db)
+            stats = await ingest_csv_directory(db, directory, workers=workers, writers=writers, batch_size=batch_size)
+        if stats:
+            logger.info(f"Populated {collection_name} collection with data from {len(stats)} CSV files.")
+        ingestion_status.finish()
+    except asyncio.CancelledError:
+        ingestion_status.finish("cancelled")
+        raise
     except Exception as e:
-        logger.error(f"An error occurred while populating the time-series data: {e}")
\ No newline at end of file
+        logger.error(f"An error occurred while populating the time-series data: {e}")
+        ingestion_status.finish(str(e))
+
+_ingestion_task: Optional[asyncio.Task] = None
+
+def start_background_ingestion(db: AsyncIOMotorClient, directory: Path = csv_data_path) -> bool:
+    '''
+        runs populate_time_series as a background task so the API can serve requests while loading
+        returns False when an ingestion run is already in progress
+    '''
+    global _ingestion_task
+    if ingestion_status.running:
+        return False
+    #mark the run as started right away, requests arriving before the task is scheduled see it warming up
+    ingestion_status.begin()
+    _ingestion_task = asyncio.create_task(populate_time_series(db, directory=directory))
+    return True
+
+async def stop_background_ingestion():
+    if _ingestion_task and not _ingestion_task.done():
+        _ingestion_task.cancel()
+        try:
+            await _ingestion_task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,121 @@
+'''
+turbine exports as they arrive from the SCADA systems: plain .csv, .csv.gz, .csv.zst or .zip archives
+compressed files are decompressed while they are read, nothing is extracted to disk
+every CSV member of a zip archive is a source of its own, named <archive>/<member> in the manifest
+and its turbine_id is the member's filename without extension
+a turbine is loaded from one source only: resets and resumes delete readings by turbine_id, so a second source
+of the same turbine (Turbine1.csv next to Turbine1.csv.gz, two archives with a Turbine1.csv) is skipped with a warning
+
+.csv.zst needs the optional zstandard package
+'''
+
+import io
+import os
+import gzip
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import PurePosixPath
+from typing import BinaryIO, Iterator, List, Optional, Tuple, TextIO
+import logging
+
+CSV_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+ARCHIVE_SUFFIX = ".zip"
+
+logger = logging.getLogger("task-2")
+
+@dataclass(frozen=True)
+class CsvSource:
+    path: str
+    turbine_id: str
+    member: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        '''manifest key, the file name or <archive>/<member>'''
+        file_name = os.path.basename(self.path)
+        return f"{file_name}/{self.member}" if self.member else file_name
+
+def turbine_id_for(file_name: str) -> str:
+    '''Turbine1.csv, Turbine1.csv.gz and exports/Turbine1.csv all belong to Turbine1'''
+    base = PurePosixPath(file_name).name
+    for suffix in sorted(CSV_SUFFIXES, key=len, reverse=True):
+        if base.endswith(suffix):
+            return base[:-len(suffix)]
+    return PurePosixPath(base).stem
+
+def is_source_file(file_name: str) -> bool:
+    return file_name.endswith(CSV_SUFFIXES) or file_name.endswith(ARCHIVE_SUFFIX)
+
+def archive_members(path: str) -> List[str]:
+    with zipfile.ZipFile(path) as archive:
+        return sorted(
+            info.filename for info in archive.infolist()
+            if not info.is_dir() and info.filename.endswith(".csv") and not PurePosixPath(info.filename).name.startswith(".")
+        )
+
+def sources_for(path: str) -> List[CsvSource]:
+    '''the CSV sources of a single file, one per member for zip archives'''
+    if path.endswith(ARCHIVE_SUFFIX):
+        return [CsvSource(path, turbine_id_for(member), member) for member in archive_members(path)]
+    return [CsvSource(path, turbine_id_for(path))]
+
+def unique_turbines(sources: List[CsvSource]) -> List[CsvSource]:
+    '''keeps the first source of every turbine_id, the others would delete its readings on a reset'''
+    owners = {}
+    for source in sources:
+        owner = owners.setdefault(source.turbine_id, source)
+        if owner is not source:
+            logger.warning(f"Skipping {source.name}: {owner.name} is already loaded as turbine_id {source.turbine_id}")
+    return list(owners.values())
+
+def discover(directory: str) -> List[CsvSource]:
+    sources = []
+    for file_name in sorted(os.listdir(directory)):
+        if is_source_file(file_name):
+            sources.extend(sources_for(os.path.join(directory, file_name)))
+    return unique_turbines(sources)
+
+def member_stat(path: str, member: str) -> Tuple[int, float]:
+    '''uncompressed size and modification time of a zip member'''
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+    return info.file_size, datetime(*info.date_time).timestamp()
+
+def _zstd_reader(file: BinaryIO) -> BinaryIO:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("Reading .csv.zst files needs the zstandard package") from e
+    return zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+
+@contextmanager
+def open_binary(path: str, member: Optional[str] = None) -> Iterator[BinaryIO]:
+    '''
+        raw bytes of a zip member, or of the file as stored on disk (still compressed)
+        the manifest hashes these bytes, so a gzip file with another gzip member appended or a zip member
+        with rows appended still counts as appended instead of changed
+    '''
+    if member is None:
+        with open(path, 'rb') as file:
+            yield file
+        return
+    with zipfile.ZipFile(path) as archive, archive.open(member) as file:
+        yield file
+
+@contextmanager
+def open_text(path: str, member: Optional[str] = None) -> Iterator[TextIO]:
+    '''decompressing UTF-8 text stream of a source, for the csv reader'''
+    if member is not None:
+        with zipfile.ZipFile(path) as archive, archive.open(member) as raw:
+            yield io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    elif path.endswith(".gz"):
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as file:
+            yield file
+    elif path.endswith(".zst"):
+        with open(path, 'rb') as raw, _zstd_reader(raw) as reader:
+            yield io.TextIOWrapper(reader, encoding='utf-8', newline='')
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            yield file
@@ -0,0 +1,304 @@
+'''
+continuous ingestion of the CSV directory while the API runs, so new readings show up within seconds
+the directory is polled every WATCH_INTERVAL seconds (no inotify, it does not work on every volume mount):
+ - plain .csv files that are new or grow are tailed, only the bytes after the last read offset are read
+   and only complete lines are consumed, a line that is still being written waits for the next poll
+   (a last line without line break is taken once the file did not change for WATCH_IDLE_SECONDS)
+ - tailed readings are buffered and flushed when WATCH_BATCH_SIZE rows are buffered
+   or the oldest buffered row is WATCH_FLUSH_SECONDS old, whichever comes first
+ - every flush goes through the regular write path (dedupe, rollups, registry) and then stores the consumed
+   size and hash in the ingestion manifest, so a restart continues the file as an append
+ - a file is tailed from the size and row count in its manifest entry, ingested rows are not read again;
+   the hash of the ingested part is only computed once the file grows
+ - compressed files, zip archives and files that were rewritten or left half loaded are handed to a regular
+   ingestion run (see csv_service.start_background_ingestion) which decides from the manifest what to load
+
+the watcher pauses while an ingestion run is going on and picks its files up from the manifest afterwards
+
+off by default, WATCH_CSV=true turns it on
+'''
+
+import os
+import csv
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from . import csv_service, csv_sources, ingest_manifest
+from .csv_sources import CsvSource
+from .ingest_status import ingestion_status
+import logging
+
+WATCH_CSV = os.getenv("WATCH_CSV", "false").lower() in ("1", "true", "yes")
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", 2))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", 1000))
+WATCH_FLUSH_SECONDS = float(os.getenv("WATCH_FLUSH_SECONDS", 2))
+WATCH_IDLE_SECONDS = float(os.getenv("WATCH_IDLE_SECONDS", 30))
+
+logger = logging.getLogger("task-2")
+
+@dataclass
+class TailState:
+    '''
+        read position of a tailed file
+        rows counts the CSV data rows consumed like parse_csv_file does (blank lines and the 2 header rows excluded),
+        rows_committed the ones stored in the manifest; digest hashes every byte before offset,
+        it is None for a state started from the manifest until the bytes before offset are hashed
+    '''
+    source: CsvSource
+    offset: int = 0
+    digest: Any = field(default_factory=hashlib.sha256)
+    fieldnames: Optional[List[str]] = None
+    units_skipped: bool = False
+    rows: int = 0
+    rows_committed: int = 0
+    documents: List[Dict] = field(default_factory=list)
+    pending_since: Optional[float] = None
+    last_timestamp: Optional[datetime] = None
+    size: int = 0
+    changed_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def rows_pending(self) -> int:
+        return self.rows - self.rows_committed
+
+def _is_tailable(source: CsvSource) -> bool:
+    return source.member is None and source.path.endswith(".csv")
+
+def _signature(path: str) -> Tuple[int, float]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+def read_rows(state: TailState, limit: int, final: bool = False) -> List[List[str]]:
+    '''
+        reads up to `limit` new data rows from the offset on, the skipped and header rows of a fresh state included
+        a last line without line break is only consumed when `final` is set, i.e. the file stopped growing
+    '''
+    rows: List[List[str]] = []
+    with open(state.source.path, 'rb') as file:
+        file.seek(state.offset)
+        while len(rows) < limit:
+            line = file.readline()
+            if not line or (not line.endswith(b"\n") and not final):
+                break
+            state.offset += len(line)
+            state.digest.update(line)
+            text = line.decode('utf-8').rstrip("\r\n")
+            if not text:
+                continue
+            row = next(csv.reader([text], delimiter=';'))
+            if state.fieldnames is None:
+                state.fieldnames = [name.strip() for name in row]
+            elif not state.units_skipped:
+                state.units_skipped = True
+            else:
+                rows.append(row)
+    return rows
+
+def from_manifest(source: CsvSource, rows: int, size: int) -> TailState:
+    '''state of a file whose first `size` bytes (`rows` data rows) are ingested, only the header line is read'''
+    with open(source.path, 'r', encoding='utf-8', newline='') as file:
+        fieldnames = [name.strip() for name in next(csv.reader([file.readline()], delimiter=';'))]
+    return TailState(source, offset=size, digest=None, fieldnames=fieldnames, units_skipped=True,
+                     rows=rows, rows_committed=rows, size=size)
+
+def read_documents(state: TailState, limit: int, final: bool = False) -> int:
+    '''reads and parses new rows into the flush buffer, returns how many rows were read'''
+    rows = read_rows(state, limit, final)
+    if not rows:
+        return 0
+    documents, _ = csv_service.parse_csv_columns(rows, state.fieldnames, state.source.turbine_id)
+    state.rows += len(rows)
+    state.documents.extend(documents)
+    if documents:
+        newest = max(document["timestamp"] for document in documents)
+        state.last_timestamp = max(state.last_timestamp, newest) if state.last_timestamp else newest
+    return len(rows)
+
+class CsvWatcher:
+    '''
+        polls a CSV directory and tails its growing files, see the module docstring
+        files that cannot be tailed are remembered by size and mtime so a failing file does not start a run on every poll
+    '''
+    def __init__(self, db: AsyncIOMotorClient, directory: Path = csv_service.csv_data_path, interval: float = WATCH_INTERVAL,
+                 batch_size: int = WATCH_BATCH_SIZE, flush_seconds: float = WATCH_FLUSH_SECONDS,
+                 idle_seconds: float = WATCH_IDLE_SECONDS):
+        self.db = db
+        self.directory = directory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.idle_seconds = idle_seconds
+        self.tails: Dict[str, TailState] = {}
+        self.handed_over: Dict[str, Tuple[int, float]] = {}
+        self.run_seen: Optional[datetime] = ingestion_status.started_at
+        self.rows_written = 0
+        self.last_flush: Optional[datetime] = None
+
+    def reset(self):
+        '''forgets every read position, unflushed rows are read again from the manifest's row'''
+        self.tails = {}
+
+    async def _track(self, source: CsvSource) -> Optional[TailState]:
+        '''tail state of a file seen for the first time, None when it was handed to an ingestion run'''
+        plan = await ingest_manifest.plan_file(self.db, source.path, source.turbine_id)
+        if plan.reason not in ("new", "appended", "unchanged"):
+            self._hand_over(source, plan.reason)
+            return None
+        #continue after the ingested bytes of the manifest instead of reading them again
+        committed, size = (0, 0) if plan.reason == "new" else await ingest_manifest.ingested_position(self.db, plan.file_name)
+        if plan.reason != "unchanged":
+            logger.info(f"Watching {plan.file_name} with turbine_id: {plan.turbine_id} ({plan.reason}, from row {committed})")
+        if not size:
+            return TailState(source)
+        return await asyncio.to_thread(from_manifest, source, committed, size)
+
+    def _hand_over(self, source: CsvSource, reason: str):
+        signature = _signature(source.path)
+        if self.handed_over.get(source.name) == signature:
+            return
+        self.handed_over[source.name] = signature
+        logger.info(f"{source.name} is {reason}, starting an ingestion run for it")
+        csv_service.start_background_ingestion(self.db, self.directory)
+
+    async def _check_archive(self, source: CsvSource):
+        if self.handed_over.get(source.name) == _signature(source.path):
+            return
+        plan = await ingest_manifest.plan_file(self.db, source.path, source.turbine_id, source.member)
+        if plan.skip:
+            self.handed_over[source.name] = _signature(source.path)
+        else:
+            self._hand_over(source, plan.reason)
+
+    async def _tail(self, state: TailState):
+        size, _ = _signature(state.source.path)
+        now = time.monotonic()
+        if size < state.offset:
+            #truncated or replaced, the manifest sees a changed file
+            logger.warning(f"{state.source.name} shrank below the tailed offset")
+            del self.tails[state.source.name]
+            self._hand_over(state.source, "changed")
+            return
+        if size != state.size:
+            state.size, state.changed_at = size, now
+        #a file that stopped growing for a while is complete, even without a final line break
+        final = now - state.changed_at >= self.idle_seconds
+        if state.digest is None and size > state.offset:
+            #the manifest stores the hash of the consumed bytes, new bytes are added to the hash of the ingested ones
+            state.digest = await asyncio.to_thread(ingest_manifest.file_digest, state.source.path, state.offset)
+        while size > state.offset and state.rows_pending < self.batch_size:
+            read = await asyncio.to_thread(read_documents, state, self.batch_size - state.rows_pending, final)
+            if not read:
+                break
+            if state.pending_since is None:
+                state.pending_since = now
+            if state.rows_pending >= self.batch_size:
+                await self.flush(state)
+
+    async def flush(self, state: TailState, force: bool = False):
+        '''writes the buffered rows when the batch is full or the oldest row waited long enough'''
+        if not state.rows_pending:
+            return
+        due = state.pending_since is not None and time.monotonic() - state.pending_since >= self.flush_seconds
+        if not (force or due or state.rows_pending >= self.batch_size):
+            return
+        if state.documents:
+            result = await csv_service.write_documents(self.db, state.source.turbine_id, state.documents)
+            self.rows_written += len(result.inserted)
+        _, mtime = _signature(state.source.path)
+        await ingest_manifest.record_tail(
+            self.db, state.source.name, state.source.turbine_id, state.rows, state.last_timestamp,
+            state.offset, mtime, state.digest.copy().hexdigest(),
+        )
+        logger.debug(f"Flushed {state.rows_pending} rows of {state.source.name}")
+        state.rows_committed = state.rows
+        state.documents = []
+        state.pending_since = None
+        self.last_flush = datetime.now(timezone.utc)
+
+    async def poll(self):
+        '''one pass over the directory, skipped while an ingestion run owns the files'''
+        if ingestion_status.running or csv_service.ingestion_lock.locked():
+            return
+        if ingestion_status.started_at != self.run_seen:
+            #a run loaded whatever was appended meanwhile, continue from the manifest
+            self.run_seen = ingestion_status.started_at
+            self.reset()
+        if not os.path.isdir(self.directory):
+            return
+        async with csv_service.ingestion_lock:
+            sources = await asyncio.to_thread(csv_sources.discover, self.directory)
+            for source in sources:
+                try:
+                    if not _is_tailable(source):
+                        await self._check_archive(source)
+                        continue
+                    state = self.tails.get(source.name)
+                    if state is None:
+                        state = await self._track(source)
+                        if state is None:
+                            continue
+                        self.tails[source.name] = state
+                    await self._tail(state)
+                    await self.flush(state)
+                except FileNotFoundError:
+                    self.tails.pop(source.name, None)
+                except Exception as e:
+                    #the buffered rows stay and are written on the next poll
+                    logger.error(f"Watching {source.name} failed: {e}")
+            names = {source.name for source in sources}
+            for name in [name for name in self.tails if name not in names]:
+                del self.tails[name]
+
+    async def run(self):
+        logger.info(f"Watching {self.directory} for new CSV rows every {self.interval}s")
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": True,
+            "directory": str(self.directory),
+            "files_tailed": len(self.tails),
+            "rows_pending": sum(state.rows_pending for state in self.tails.values()),
+            "rows_written": self.rows_written,
+            "last_flush": self.last_flush,
+        }
+
+_watcher: Optional[CsvWatcher] = None
+_watcher_task: Optional[asyncio.Task] = None
+
+def start_watcher(db: AsyncIOMotorClient) -> bool:
+    '''runs the watcher as a background task, returns False when it is disabled with WATCH_CSV'''
+    global _watcher, _watcher_task
+    if not WATCH_CSV:
+        return False
+    _watcher = CsvWatcher(db)
+    _watcher_task = asyncio.create_task(_watcher.run())
+    return True
+
+async def stop_watcher():
+    '''stops polling and writes what is still buffered'''
+    if _watcher_task and not _watcher_task.done():
+        _watcher_task.cancel()
+        try:
+            await _watcher_task
+        except asyncio.CancelledError:
+            pass
+    if _watcher and not csv_service.ingestion_lock.locked():
+        for state in list(_watcher.tails.values()):
+            try:
+                await _watcher.flush(state, force=True)
+            except Exception as e:
+                logger.error(f"Flushing {state.source.name} failed: {e}")
+
+def watcher_status() -> Dict:
+    if _watcher is None:
+        return {"enabled": False, "directory": str(csv_service.csv_data_path), "files_tailed": 0,
+                "rows_pending": 0, "rows_written": 0, "last_flush": None}
+    return _watcher.snapshot()
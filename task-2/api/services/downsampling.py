@@ -0,0 +1,107 @@
+'''
+downsampling of a single turbine's readings to a fixed number of chart points
+ - minmax: readings are grouped into equal time windows with $dateTrunc/$group inside MongoDB,
+   every window returns min, max, avg and count of the field, so spikes survive the reduction
+ - lttb: Largest-Triangle-Three-Buckets over the raw series, computed with NumPy; only timestamp
+   and the requested field leave the database and the result keeps the visual shape of the line
+'''
+
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from .power_curve_rollup import measurement_expression
+
+readings_collection = "turbine_readings"
+
+METHOD_MINMAX = "minmax"
+METHOD_LTTB = "lttb"
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    '''
+        indices of the points Largest-Triangle-Three-Buckets keeps out of (x, y)
+        the first and last point are always kept, every bucket in between contributes the point that forms
+        the largest triangle with the previously kept point and the average of the next bucket
+    '''
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+
+    #bucket i covers [edges[i], edges[i + 1]), the first and last point are buckets of their own
+    every = (n - 2) / (threshold - 2)
+    edges = np.append((np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64), n)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2]
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+def window_minutes(start_date: datetime, end_date: datetime, points: int) -> int:
+    '''$dateTrunc window that splits the range into at most `points` windows'''
+    return max(1, math.ceil((end_date - start_date).total_seconds() / 60 / points))
+
+async def series_bounds(db: AsyncIOMotorClient, turbine_id: str) -> Optional[Tuple[datetime, datetime]]:
+    '''first and last timestamp of a turbine, None when it has no readings'''
+    projection = {"_id": 0, "timestamp": 1}
+    first = await db[readings_collection].find_one({"metadata.turbine_id": turbine_id}, projection, sort=[("timestamp", 1)])
+    if not first:
+        return None
+    last = await db[readings_collection].find_one({"metadata.turbine_id": turbine_id}, projection, sort=[("timestamp", -1)])
+    return first["timestamp"], last["timestamp"]
+
+def _match_stage(turbine_id: str, start_date: datetime, end_date: datetime) -> Dict:
+    return {"$match": {"metadata.turbine_id": turbine_id, "timestamp": {"$gte": start_date, "$lte": end_date}}}
+
+async def downsample_minmax(db: AsyncIOMotorClient, turbine_id: str, field: str, start_date: datetime,
+                            end_date: datetime, points: int) -> Tuple[int, List[Dict]]:
+    '''window length in minutes and one {timestamp, value, min, max, count} point per non-empty window'''
+    minutes = window_minutes(start_date, end_date, points)
+    value = measurement_expression(field)
+    pipeline = [
+        _match_stage(turbine_id, start_date, end_date),
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": "$timestamp", "unit": "minute", "binSize": minutes}},
+                "value": {"$avg": value},
+                "min": {"$min": value},
+                "max": {"$max": value},
+                "count": {"$sum": 1},
+            }
+        },
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "timestamp": "$_id", "value": 1, "min": 1, "max": 1, "count": 1}},
+    ]
+    return minutes, [point async for point in db[readings_collection].aggregate(pipeline)]
+
+async def downsample_lttb(db: AsyncIOMotorClient, turbine_id: str, field: str, start_date: datetime,
+                          end_date: datetime, points: int) -> List[Dict]:
+    '''the raw {timestamp, value} points LTTB keeps'''
+    pipeline = [
+        _match_stage(turbine_id, start_date, end_date),
+        {"$sort": {"timestamp": 1}},
+        {"$project": {"_id": 0, "timestamp": 1, "value": measurement_expression(field)}},
+    ]
+    timestamps: List[datetime] = []
+    values: List[float] = []
+    async for document in db[readings_collection].aggregate(pipeline, batchSize=10000):
+        if document.get("value") is None:
+            continue
+        timestamps.append(document["timestamp"])
+        values.append(document["value"])
+    if not timestamps:
+        return []
+
+    x = np.array(timestamps, dtype="datetime64[ms]").astype(np.int64)
+    keep = lttb(x, np.array(values, dtype=np.float64), points)
+    return [{"timestamp": timestamps[i], "value": values[i]} for i in keep]
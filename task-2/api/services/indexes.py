@@ -0,0 +1,31 @@
+from datetime import datetime
+from mongoconnector.index_advisor import IndexSpec, QueryProbe
+from . import power_curve_rollup
+from .readings_cursor import after_cursor, encode_cursor, page_sort
+'''
+indexes the task-2 routes and the ingestion rely on and one representative query per route
+provisioned at startup, see mongoconnector.index_advisor
+'''
+
+_day = {"$gte": datetime(2016, 1, 1), "$lt": datetime(2016, 1, 2)}
+_page_cursor = encode_cursor({"timestamp": datetime(2016, 1, 1, 12), "metadata": {"turbine_id": "Turbine1"}})
+
+INDEXES = [
+    #every raw reading query filters on the turbine and a time range, all-turbine queries only on time
+    IndexSpec("turbine_readings", [("metadata.turbine_id", 1), ("timestamp", 1)]),
+    IndexSpec("turbine_readings", [("timestamp", 1)]),
+    *power_curve_rollup.ROLLUP_INDEXES,
+]
+
+PROBES = [
+    #page probes are deep pages (a cursor in the middle of the day), their order must come from the index
+    QueryProbe("GET /timeseries/page", "turbine_readings",
+               after_cursor({"metadata.turbine_id": "Turbine1", "timestamp": _day}, _page_cursor),
+               sort=dict(page_sort({"metadata.turbine_id": "Turbine1"}))),
+    QueryProbe("GET /timeseries/page (all turbines)", "turbine_readings", after_cursor({"timestamp": _day}, _page_cursor),
+               sort=dict(page_sort({}))),
+    QueryProbe("GET /timeseries/stream", "turbine_readings", {"timestamp": _day}, sort={"timestamp": 1}),
+    QueryProbe("GET /aggregated_timeseries (whole days)", power_curve_rollup.rollup_collection, {"turbine_id": "Turbine1", "day": _day}),
+    QueryProbe("GET /aggregated_timeseries/fleet (whole days)", power_curve_rollup.rollup_collection, {"day": _day}),
+    QueryProbe("GET /timeseries/downsampled", "turbine_readings", {"metadata.turbine_id": "Turbine1", "timestamp": _day}),
+]
@@ -0,0 +1,200 @@
+'''
+keeps one manifest document per CSV file so ingestion can be incremental and resumable
+a manifest entry records the file size, mtime and content hash of the version being ingested
+together with the number of CSV data rows that have been committed so far
+
+on every run the directory is compared against the manifest:
+ - unknown files are ingested from the first row, after removing readings of their turbine that no entry covers
+   (a database loaded before the manifest existed)
+ - unchanged files that completed are skipped without hashing
+ - files whose start still hashes to the recorded content are resumed/appended from the last committed row
+ - anything else (rewritten or truncated files) is re-ingested from scratch
+'''
+
+import os
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from . import csv_sources, power_curve_rollup, turbine_registry
+import logging
+
+manifest_collection = "ingestion_manifest"
+readings_collection = "turbine_readings"
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_COMPLETE = "complete"
+
+logger = logging.getLogger("task-2")
+
+@dataclass
+class FilePlan:
+    '''
+        what has to happen to a single file on this run
+        start_row is the number of CSV data rows to skip, reset means the turbine is reloaded from scratch
+    '''
+    file_path: str
+    file_name: str
+    turbine_id: str
+    size: int
+    mtime: float
+    #CSV member of a zip archive, the manifest tracks every member on its own
+    member: Optional[str] = None
+    sha256: str = ""
+    start_row: int = 0
+    reset: bool = False
+    skip: bool = False
+    reason: str = "new"
+
+def file_sha256(file_path: str, length: Optional[int] = None, member: Optional[str] = None) -> str:
+    '''hashes the whole file (or zip member), or only its first `length` bytes to check that an older version is a prefix'''
+    return file_digest(file_path, length, member).hexdigest()
+
+def file_digest(file_path: str, length: Optional[int] = None, member: Optional[str] = None):
+    '''sha256 object of file_sha256, more bytes can be added to it'''
+    digest = hashlib.sha256()
+    remaining = length
+    with csv_sources.open_binary(file_path, member) as file:
+        while remaining is None or remaining > 0:
+            chunk = file.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+async def plan_file(db: AsyncIOMotorClient, file_path: str, turbine_id: str, member: Optional[str] = None) -> FilePlan:
+    '''
+        compares a file on disk (or a member of a zip archive) with its manifest entry and decides whether it is skipped, resumed or reloaded
+        compressed files are compared by their compressed bytes, zip members by their uncompressed content
+    '''
+    if member is None:
+        stat = os.stat(file_path)
+        size, mtime = stat.st_size, stat.st_mtime
+    else:
+        size, mtime = csv_sources.member_stat(file_path, member)
+    file_name = csv_sources.CsvSource(file_path, turbine_id, member).name
+    plan = FilePlan(file_path=file_path, file_name=file_name, turbine_id=turbine_id, size=size, mtime=mtime, member=member)
+    entry = await db[manifest_collection].find_one({"_id": file_name})
+
+    if entry and entry.get("status") == STATUS_COMPLETE and entry.get("size") == plan.size and entry.get("mtime") == plan.mtime:
+        plan.skip, plan.reason, plan.sha256 = True, "unchanged", entry.get("sha256", "")
+        return plan
+
+    #hashing is blocking file I/O, keep it off the event loop
+    plan.sha256 = await asyncio.to_thread(file_sha256, file_path, None, member)
+    if not entry:
+        #readings without a manifest entry would all be inserted a second time, reload the turbine instead
+        if await db[readings_collection].find_one({"metadata.turbine_id": turbine_id}, {"_id": 1}):
+            plan.reset, plan.reason = True, "untracked"
+        return plan
+
+    previous_size = entry.get("size", 0)
+    if previous_size == plan.size:
+        prefix_matches = entry.get("sha256") == plan.sha256
+    elif previous_size < plan.size:
+        prefix_matches = entry.get("sha256") == await asyncio.to_thread(file_sha256, file_path, previous_size, member)
+    else:
+        prefix_matches = False
+
+    if not prefix_matches:
+        plan.reset, plan.reason = True, "changed"
+    elif entry.get("status") == STATUS_COMPLETE and previous_size == plan.size:
+        #only touched, the content is identical
+        plan.skip, plan.reason = True, "unchanged"
+    else:
+        plan.start_row = entry.get("rows_ingested", 0)
+        plan.reason = "resumed" if entry.get("status") == STATUS_IN_PROGRESS else "appended"
+    return plan
+
+async def prepare_file(db: AsyncIOMotorClient, plan: FilePlan):
+    '''
+        removes readings that are not covered by the manifest and marks the file as in progress
+        rows written after the last committed batch (a crash mid-file) are deleted, so a resume
+        never leaves duplicates behind; the CSV exports are in chronological order
+    '''
+    entry = await db[manifest_collection].find_one({"_id": plan.file_name}) or {}
+    turbine_filter = {"metadata.turbine_id": plan.turbine_id}
+    if plan.reset or plan.start_row == 0:
+        if entry or plan.reset:
+            result = await db[readings_collection].delete_many(turbine_filter)
+            logger.info(f"Removed {result.deleted_count} readings of {plan.turbine_id} before reloading {plan.file_name}")
+            await power_curve_rollup.rebuild(db, plan.turbine_id)
+            await turbine_registry.rebuild(db, plan.turbine_id)
+            #the readings of another file of this turbine (one it replaced) are gone too, it is not ingested anymore
+            stale = await db[manifest_collection].delete_many({"turbine_id": plan.turbine_id, "_id": {"$ne": plan.file_name}})
+            if stale.deleted_count:
+                logger.warning(f"{plan.file_name} replaces {stale.deleted_count} other manifest entries of {plan.turbine_id}")
+    elif entry.get("last_timestamp") is not None:
+        result = await db[readings_collection].delete_many({**turbine_filter, "timestamp": {"$gt": entry["last_timestamp"]}})
+        if result.deleted_count:
+            logger.info(f"Removed {result.deleted_count} uncommitted readings of {plan.turbine_id}")
+        #an interrupted run may have rolled up batches that were never committed
+        if result.deleted_count or entry.get("status") == STATUS_IN_PROGRESS:
+            await power_curve_rollup.rebuild(db, plan.turbine_id)
+            await turbine_registry.rebuild(db, plan.turbine_id)
+
+    update: Dict = {
+        "$set": {
+            "turbine_id": plan.turbine_id,
+            "size": plan.size,
+            "mtime": plan.mtime,
+            "sha256": plan.sha256,
+            "rows_ingested": plan.start_row,
+            "status": STATUS_IN_PROGRESS,
+            "updated_at": datetime.now(timezone.utc),
+        }
+    }
+    #a reload starts without a watermark timestamp, record_progress sets it again with $max
+    if not plan.start_row and "last_timestamp" in entry:
+        update["$unset"] = {"last_timestamp": ""}
+    await db[manifest_collection].update_one({"_id": plan.file_name}, update, upsert=True)
+
+async def record_progress(db: AsyncIOMotorClient, file_name: str, rows_ingested: int, last_timestamp: Optional[datetime]):
+    '''
+        stores the last committed CSV row of a file
+        $max keeps the watermark monotonic when concurrent writers report out of order
+    '''
+    update: Dict = {"$max": {"rows_ingested": rows_ingested}, "$set": {"updated_at": datetime.now(timezone.utc)}}
+    if last_timestamp is not None:
+        update["$max"]["last_timestamp"] = last_timestamp
+    await db[manifest_collection].update_one({"_id": file_name}, update)
+
+async def mark_complete(db: AsyncIOMotorClient, file_name: str, rows_ingested: int):
+    await db[manifest_collection].update_one(
+        {"_id": file_name},
+        {
+            "$max": {"rows_ingested": rows_ingested},
+            "$set": {"status": STATUS_COMPLETE, "updated_at": datetime.now(timezone.utc)},
+        },
+    )
+
+async def ingested_position(db: AsyncIOMotorClient, file_name: str) -> Tuple[int, int]:
+    '''(rows_ingested, size) of a file, where a tail of it continues'''
+    entry = await db[manifest_collection].find_one({"_id": file_name}, {"rows_ingested": 1, "size": 1})
+    return (entry.get("rows_ingested", 0), entry.get("size", 0)) if entry else (0, 0)
+
+async def record_tail(db: AsyncIOMotorClient, file_name: str, turbine_id: str, rows_ingested: int,
+                      last_timestamp: Optional[datetime], size: int, mtime: float, sha256: str):
+    '''
+        progress of a file that is tailed while it grows, see csv_watcher
+        size and sha256 describe the bytes consumed so far, so on the next startup rows written after them
+        are planned as an append from rows_ingested
+    '''
+    update: Dict = {
+        "$set": {
+            "turbine_id": turbine_id,
+            "rows_ingested": rows_ingested,
+            "size": size,
+            "mtime": mtime,
+            "sha256": sha256,
+            "status": STATUS_COMPLETE,
+            "updated_at": datetime.now(timezone.utc),
+        }
+    }
+    if last_timestamp is not None:
+        update["$max"] = {"last_timestamp": last_timestamp}
+    await db[manifest_collection].update_one({"_id": file_name}, update, upsert=True)
@@ -0,0 +1,106 @@
+'''
+in-process progress of the CSV ingestion that runs in the background after startup
+routes use it to report progress and to answer "warming up" for turbines that are not loaded yet
+'''
+
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+STATE_IDLE = "idle"
+STATE_SCANNING = "scanning"
+STATE_RUNNING = "running"
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+
+class IngestionStatus:
+    '''
+        progress of the current (or last) ingestion run
+        files holds the csv_service.FileIngestStats of the running files, everything else is derived on read
+    '''
+    def __init__(self):
+        self.state = STATE_IDLE
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        #None while the CSV directory has not been listed yet, i.e. every turbine may still change
+        self.scanning_turbines: Optional[Set[str]] = set()
+        self.files: List = []
+        self._started = 0.0
+        self._finished: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self.state in (STATE_SCANNING, STATE_RUNNING)
+
+    def begin(self):
+        self.state = STATE_SCANNING
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.error = None
+        self.scanning_turbines = None
+        self.files = []
+        self._started = time.perf_counter()
+        self._finished = None
+
+    def scanning(self, turbine_ids: List[str]):
+        self.scanning_turbines = set(turbine_ids)
+
+    def ingesting(self, files: List):
+        self.state = STATE_RUNNING
+        self.files = files
+        self.scanning_turbines = set()
+
+    def finish(self, error: Optional[str] = None):
+        self.state = STATE_FAILED if error else STATE_COMPLETED
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self._finished = time.perf_counter()
+        self.scanning_turbines = set()
+
+    def pending_turbines(self) -> Set[str]:
+        pending = {stats.turbine_id for stats in self.files if stats.finished is None} if self.running else set()
+        return pending | (self.scanning_turbines or set())
+
+    def is_turbine_ready(self, turbine_id: Optional[str] = None) -> bool:
+        '''a single turbine is ready once its file is loaded, all turbines once the whole run is'''
+        if not self.running:
+            return True
+        if self.scanning_turbines is None or turbine_id is None:
+            return False
+        return turbine_id not in self.pending_turbines()
+
+    def snapshot(self) -> Dict:
+        elapsed = (self._finished or time.perf_counter()) - self._started if self.started_at else 0.0
+        rows_written = sum(stats.rows_written for stats in self.files)
+        bytes_total = sum(stats.size for stats in self.files)
+        #in-progress files count by their share of written batches
+        bytes_done = sum(
+            stats.size if stats.finished is not None
+            else stats.size * stats.batches_written / stats.batches_total if stats.batches_total
+            else 0
+            for stats in self.files
+        )
+        bytes_per_second = bytes_done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.state == STATE_RUNNING and bytes_per_second > 0:
+            eta = round((bytes_total - bytes_done) / bytes_per_second, 1)
+        elif not self.running:
+            eta = 0.0
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "files_total": len(self.files),
+            "files_done": sum(1 for stats in self.files if stats.finished is not None and not stats.error),
+            "files_failed": sum(1 for stats in self.files if stats.error),
+            "rows_written": rows_written,
+            "rows_duplicate": sum(stats.rows_duplicate for stats in self.files),
+            "rows_failed": sum(stats.rows_failed for stats in self.files),
+            "rows_per_second": round(rows_written / elapsed, 1) if elapsed > 0 else 0.0,
+            "eta_seconds": eta,
+            "pending_turbines": sorted(self.pending_turbines()),
+            "error": self.error,
+        }
+
+ingestion_status = IngestionStatus()
@@ -0,0 +1,245 @@
+'''
+pre-aggregated power curve partials, one document per turbine, day and wind speed bin
+every document stores the reading count and the sums of power, wind speed, azimuth, temperatures and rpm,
+so any range of whole days can be answered by adding up a few hundred small documents
+instead of scanning the raw 10 minute readings
+
+the partials are updated with $inc whenever the CSV ingestion inserts a batch and can be rebuilt
+from the raw readings (all turbines or a single one) with an aggregation + $merge
+'''
+
+import math
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from mongoconnector.index_advisor import IndexSpec, ensure_indexes as ensure_declared_indexes
+from ..models.timeseries import LEGACY_METADATA_FIELDS
+from .response_cache import power_curve_cache
+import logging
+
+rollup_collection = "power_curve_daily"
+readings_collection = "turbine_readings"
+
+#same bins as the original $bucket: [0, 0.5), [0.5, 1.0) ... [25.0, 25.5)
+BIN_SIZE = 0.5
+MIN_WIND = 0.0
+MAX_WIND = 25.0
+
+#top level reading fields that get a <name>_sum in the rollups
+MEASUREMENTS = ["power", "wind_speed", "azimuth", "external_temperature", "internal_temperature", "rpm"]
+
+ROLLUP_INDEXES = [
+    #$merge and the $inc upserts both match on this key
+    IndexSpec(rollup_collection, [("turbine_id", 1), ("day", 1), ("bin", 1)], unique=True),
+    #fleet and all-turbine power curves only filter on the day range
+    IndexSpec(rollup_collection, [("day", 1)]),
+]
+
+logger = logging.getLogger("task-2")
+
+def wind_bin(wind_speed: Optional[float]) -> Optional[float]:
+    '''lower bound of the bin a wind speed falls into, None for values $bucket would put in its default bucket'''
+    if wind_speed is None or math.isnan(wind_speed):
+        return None
+    if not MIN_WIND <= wind_speed < MAX_WIND + BIN_SIZE:
+        return None
+    return MIN_WIND + math.floor((wind_speed - MIN_WIND) / BIN_SIZE) * BIN_SIZE
+
+def measurement_expression(name: str) -> Any:
+    '''
+        aggregation expression of a reading field
+        readings that were not migrated yet (see schema_migration) still hold the value inside the metaField
+    '''
+    if name in LEGACY_METADATA_FIELDS:
+        return {"$ifNull": [f"${name}", f"$metadata.{name}"]}
+    return f"${name}"
+
+def rollup_updates(documents: List[Dict]) -> List[UpdateOne]:
+    '''
+        folds a batch of readings into one $inc upsert per turbine, day and wind bin
+    '''
+    partials: Dict[Tuple[str, datetime, float], Dict[str, float]] = {}
+    for document in documents:
+        bin_start = wind_bin(document.get("wind_speed"))
+        if bin_start is None:
+            continue
+        timestamp = document["timestamp"]
+        key = (document["metadata"]["turbine_id"], datetime(timestamp.year, timestamp.month, timestamp.day), bin_start)
+        sums = partials.setdefault(key, dict.fromkeys(["count"] + [f"{name}_sum" for name in MEASUREMENTS], 0))
+        sums["count"] += 1
+        for name in MEASUREMENTS:
+            sums[f"{name}_sum"] += document[name]
+
+    return [
+        UpdateOne({"turbine_id": turbine_id, "day": day, "bin": bin_start}, {"$inc": sums}, upsert=True)
+        for (turbine_id, day, bin_start), sums in partials.items()
+    ]
+
+async def apply_batch(db: AsyncIOMotorClient, documents: List[Dict]):
+    '''adds freshly inserted readings to the daily partials'''
+    updates = rollup_updates(documents)
+    if updates:
+        await db[rollup_collection].bulk_write(updates, ordered=False)
+
+async def ensure_indexes(db: AsyncIOMotorClient):
+    await ensure_declared_indexes(db, ROLLUP_INDEXES)
+
+async def rebuild(db: AsyncIOMotorClient, turbine_id: Optional[str] = None):
+    '''
+        recomputes the partials of one turbine (or all of them) from the raw readings
+    '''
+    turbine_filter = {"turbine_id": turbine_id} if turbine_id else {}
+    await db[rollup_collection].delete_many(turbine_filter)
+
+    match_stage = {"wind_speed": {"$gte": MIN_WIND, "$lt": MAX_WIND + BIN_SIZE}}
+    if turbine_id:
+        match_stage["metadata.turbine_id"] = turbine_id
+    pipeline = [
+        {"$match": match_stage},
+        {
+            "$group": {
+                "_id": {
+                    "turbine_id": "$metadata.turbine_id",
+                    "day": {"$dateTrunc": {"date": "$timestamp", "unit": "day"}},
+                    "bin": {"$add": [MIN_WIND, {"$multiply": [{"$floor": {"$divide": [{"$subtract": ["$wind_speed", MIN_WIND]}, BIN_SIZE]}}, BIN_SIZE]}]},
+                },
+                "count": {"$sum": 1},
+                **{f"{name}_sum": {"$sum": measurement_expression(name)} for name in MEASUREMENTS},
+            }
+        },
+        {"$project": {"_id": 0, "turbine_id": "$_id.turbine_id", "day": "$_id.day", "bin": "$_id.bin", "count": 1,
+                      **{f"{name}_sum": 1 for name in MEASUREMENTS}}},
+        {"$merge": {"into": rollup_collection, "on": ["turbine_id", "day", "bin"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    async for _ in db[readings_collection].aggregate(pipeline):
+        pass
+    #readings of the turbine were replaced or deleted, cached curves computed before are stale
+    power_curve_cache.invalidate(turbine_id)
+    logger.info(f"Rebuilt power curve rollups for {turbine_id or 'all turbines'}")
+
+async def ensure_rollups(db: AsyncIOMotorClient):
+    '''backfills the partials once for readings that were loaded before the rollups existed'''
+    await ensure_indexes(db)
+    if await db[rollup_collection].count_documents({}, limit=1):
+        return
+    if await db[readings_collection].count_documents({}, limit=1):
+        await rebuild(db)
+
+def split_range(start_date: datetime, end_date: datetime) -> Tuple[Optional[Tuple[datetime, datetime]], List[Tuple[datetime, datetime]]]:
+    '''
+        splits [start_date, end_date) into whole days served by the rollups and the partial days at
+        both ends that still have to be read from the raw readings
+    '''
+    first_day = datetime(start_date.year, start_date.month, start_date.day)
+    if first_day < start_date:
+        first_day += timedelta(days=1)
+    last_day = datetime(end_date.year, end_date.month, end_date.day)
+    if first_day >= last_day:
+        return None, [(start_date, end_date)]
+    edges = [(start, end) for start, end in ((start_date, first_day), (last_day, end_date)) if start < end]
+    return (first_day, last_day), edges
+
+@dataclass(frozen=True)
+class BinConfig:
+    '''
+        wind speed bins [min_wind + k * size, min_wind + (k + 1) * size) for every bin start up to max_wind,
+        the default is the original $bucket layout
+    '''
+    size: float = BIN_SIZE
+    min_wind: float = MIN_WIND
+    max_wind: float = MAX_WIND
+
+    @property
+    def bins(self) -> int:
+        return int(math.floor((self.max_wind - self.min_wind) / self.size + 1e-9)) + 1
+
+    @property
+    def upper(self) -> float:
+        '''exclusive upper bound of the last bin'''
+        return self.min_wind + self.bins * self.size
+
+    def rollup_compatible(self) -> bool:
+        '''every daily partial lies completely inside one bin, so the partials can be re-binned instead of scanning readings'''
+        ratio = self.size / BIN_SIZE
+        offset = (self.min_wind - MIN_WIND) / BIN_SIZE
+        return (
+            abs(ratio - round(ratio)) < 1e-9 and round(ratio) >= 1
+            and abs(offset - round(offset)) < 1e-9
+            and self.min_wind >= MIN_WIND and self.upper <= MAX_WIND + BIN_SIZE + 1e-9
+        )
+
+    def bin_expression(self, field: str) -> Dict:
+        return {"$add": [self.min_wind, {"$multiply": [{"$floor": {"$divide": [{"$subtract": [field, self.min_wind]}, self.size]}}, self.size]}]}
+
+DEFAULT_BINS = BinConfig()
+
+def _add_partial(curve: Dict[float, Dict[str, float]], bin_start: float, partial: Dict):
+    sums = curve.setdefault(round(bin_start, 6), dict.fromkeys(["count"] + [f"{name}_sum" for name in MEASUREMENTS], 0))
+    for field in sums:
+        sums[field] += partial.get(field) or 0
+
+def _group_stage(group_key: Dict, count: Dict, sums: Dict[str, Any]) -> Dict:
+    return {"$group": {"_id": group_key, "count": count, **{f"{name}_sum": {"$sum": expression} for name, expression in sums.items()}}}
+
+async def power_curves(db: AsyncIOMotorClient, start_date: datetime, end_date: datetime,
+                       turbine_ids: Optional[List[str]] = None, bins: BinConfig = DEFAULT_BINS,
+                       per_turbine: bool = False) -> Dict[Optional[str], Dict[float, Dict[str, float]]]:
+    '''
+        summed readings per turbine (or None for all turbines mixed) and wind bin, for a date range
+        whole days come from the daily partials when the bins line up with them, everything else from the raw readings;
+        each collection is read with a single $group on (turbine, bin), so N turbines still cost one round trip per collection
+    '''
+    if bins.rollup_compatible():
+        days, edges = split_range(start_date, end_date)
+    else:
+        days, edges = None, [(start_date, end_date)]
+    curves: Dict[Optional[str], Dict[float, Dict[str, float]]] = {}
+
+    def add(doc: Dict):
+        key = doc["_id"]
+        turbine_id, bin_start = (key["turbine_id"], key["bin"]) if per_turbine else (None, key)
+        _add_partial(curves.setdefault(turbine_id, {}), bin_start, doc)
+
+    if days:
+        match_stage: Dict = {"day": {"$gte": days[0], "$lt": days[1]}}
+        if turbine_ids:
+            match_stage["turbine_id"] = turbine_ids[0] if len(turbine_ids) == 1 else {"$in": turbine_ids}
+        if bins != DEFAULT_BINS:
+            match_stage["bin"] = {"$gte": bins.min_wind, "$lt": bins.upper}
+        bin_key = "$bin" if bins == DEFAULT_BINS else bins.bin_expression("$bin")
+        group_key = {"turbine_id": "$turbine_id", "bin": bin_key} if per_turbine else bin_key
+        pipeline = [
+            {"$match": match_stage},
+            _group_stage(group_key, {"$sum": "$count"}, {name: f"${name}_sum" for name in MEASUREMENTS}),
+        ]
+        async for doc in db[rollup_collection].aggregate(pipeline):
+            add(doc)
+
+    if edges:
+        match_stage = {
+            "$or": [{"timestamp": {"$gte": start, "$lt": end}} for start, end in edges],
+            "wind_speed": {"$gte": bins.min_wind, "$lt": bins.upper},
+        }
+        if turbine_ids:
+            match_stage["metadata.turbine_id"] = turbine_ids[0] if len(turbine_ids) == 1 else {"$in": turbine_ids}
+        bin_key = bins.bin_expression("$wind_speed")
+        group_key = {"turbine_id": "$metadata.turbine_id", "bin": bin_key} if per_turbine else bin_key
+        pipeline = [
+            {"$match": match_stage},
+            _group_stage(group_key, {"$sum": 1}, {name: measurement_expression(name) for name in MEASUREMENTS}),
+        ]
+        async for doc in db[readings_collection].aggregate(pipeline):
+            add(doc)
+
+    return {turbine_id: dict(sorted(curve.items())) for turbine_id, curve in curves.items()}
+
+async def power_curve(db: AsyncIOMotorClient, start_date: datetime, end_date: datetime,
+                      turbine_id: Optional[str] = None, bins: BinConfig = DEFAULT_BINS) -> Dict[float, Dict[str, float]]:
+    '''
+        summed readings per wind bin for a turbine (or all turbines) and date range
+        whole days come from the daily partials, partial days at either end from the raw readings
+    '''
+    curves = await power_curves(db, start_date, end_date, [turbine_id] if turbine_id else None, bins)
+    return curves.get(None, {})
@@ -0,0 +1,47 @@
+'''
+opaque keyset cursors for paging through raw turbine readings
+a cursor holds the (timestamp, turbine_id) of the last reading of a page; the next page starts strictly after it,
+so every page costs the same index range scan no matter how deep the client pages (no skip)
+
+readings are unique per turbine and timestamp (see bulk_loader), so pages of one turbine are ordered by timestamp alone
+and pages over all turbines go turbine by turbine; both orders come from the (turbine_id, timestamp) index, which the
+time-series collection can only stream for a metaField prefix followed by the time field (no blocking $sort)
+'''
+
+import json
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import ASCENDING
+
+def page_sort(query: Dict) -> List[Tuple[str, int]]:
+    if "metadata.turbine_id" in query:
+        return [('timestamp', ASCENDING)]
+    return [('metadata.turbine_id', ASCENDING), ('timestamp', ASCENDING)]
+
+def encode_cursor(document: Dict) -> str:
+    payload = {"t": document["timestamp"].isoformat(), "m": document["metadata"]["turbine_id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    '''raises ValueError for cursors that were not produced by encode_cursor'''
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["t"]), str(payload["m"])
+    except Exception as ex:
+        raise ValueError(f"Invalid cursor: {cursor}") from ex
+
+def after_cursor(query: Dict, cursor: Optional[str]) -> Dict:
+    '''adds the "after the last reading of the previous page" condition in page_sort order'''
+    if not cursor:
+        return query
+    timestamp, turbine_id = decode_cursor(cursor)
+    if "metadata.turbine_id" in query:
+        keyset: Dict = {"timestamp": {"$gt": timestamp}}
+    else:
+        #the plain lower bound lets the index scan start at the cursor turbine
+        keyset = {
+            "metadata.turbine_id": {"$gte": turbine_id},
+            "$or": [{"metadata.turbine_id": {"$gt": turbine_id}}, {"metadata.turbine_id": turbine_id, "timestamp": {"$gt": timestamp}}],
+        }
+    return {"$and": [query, keyset]} if query else keyset
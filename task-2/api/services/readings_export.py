@@ -0,0 +1,140 @@
+'''
+raw turbine readings as columnar files for analysis, Parquet or Arrow IPC
+the Motor cursor is read in batches of EXPORT_BATCH_SIZE readings, every batch is converted into one Arrow
+record batch (a Parquet row group) and handed to the writer, whose output is yielded right away,
+so memory is bounded by one batch no matter how many readings are exported
+
+ - parquet: zstd compressed columns (EXPORT_PARQUET_COMPRESSION), the smallest download
+ - arrow: uncompressed Arrow IPC file (Feather v2), pyarrow.memory_map + pyarrow.ipc.open_file or
+   pandas.read_feather load it without copying or parsing
+'''
+
+import os
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from ..models.timeseries import LEGACY_METADATA_FIELDS
+from .readings_stream import readings_collection
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 65536))
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+}
+
+MEASUREMENTS = ["power", "wind_speed", "rpm", "azimuth", "external_temperature", "internal_temperature"]
+LOCATION = ["latitude", "longitude", "altitude"]
+
+#turbine_id repeats for every reading, dictionary encoding stores it once per batch
+SCHEMA = pa.schema(
+    [pa.field("timestamp", pa.timestamp("ms"), nullable=False),
+     pa.field("turbine_id", pa.dictionary(pa.int32(), pa.string()), nullable=False)]
+    + [pa.field(name, pa.float64()) for name in MEASUREMENTS + LOCATION]
+)
+
+class _ChunkSink:
+    '''write-only file for the Arrow writers, the written bytes are collected until the next drain'''
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.closed = False
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _measurement(document: Dict, name: str) -> Optional[float]:
+    #readings that were not migrated yet keep some measurements in metadata
+    if name in document or name not in LEGACY_METADATA_FIELDS:
+        return document.get(name)
+    return document["metadata"].get(name)
+
+def record_batch(documents: List[Dict]) -> pa.RecordBatch:
+    '''builds the columns of a batch of readings, missing values are nulls'''
+    columns = [
+        pa.array([document["timestamp"] for document in documents], type=pa.timestamp("ms")),
+        pa.array([document["metadata"]["turbine_id"] for document in documents]).dictionary_encode(),
+    ]
+    columns += [pa.array([_measurement(document, name) for document in documents], type=pa.float64()) for name in MEASUREMENTS]
+    columns += [pa.array([document["metadata"].get(name) for document in documents], type=pa.float64()) for name in LOCATION]
+    return pa.RecordBatch.from_arrays(columns, schema=SCHEMA)
+
+async def record_batches(db: AsyncIOMotorClient, query: Dict, batch_size: int = EXPORT_BATCH_SIZE,
+                         limit: Optional[int] = None) -> AsyncIterator[pa.RecordBatch]:
+    '''record batches of up to batch_size readings in timestamp order'''
+    cursor = db[readings_collection].find(query, {"_id": 0}).sort('timestamp', ASCENDING).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    documents = []
+    #building the columns is CPU work, it runs in a thread so the event loop keeps serving requests
+    async for document in cursor:
+        documents.append(document)
+        if len(documents) >= batch_size:
+            yield await asyncio.to_thread(record_batch, documents)
+            documents = []
+    if documents:
+        yield await asyncio.to_thread(record_batch, documents)
+
+def _writer(sink: _ChunkSink, export_format: str):
+    if export_format == "parquet":
+        return pq.ParquetWriter(sink, SCHEMA, compression=EXPORT_PARQUET_COMPRESSION)
+    return pa.ipc.new_file(sink, SCHEMA)
+
+async def export_readings(db: AsyncIOMotorClient, query: Dict, export_format: str = "parquet",
+                          batch_size: int = EXPORT_BATCH_SIZE, limit: Optional[int] = None) -> AsyncIterator[bytes]:
+    '''
+        yields the bytes of a Parquet or Arrow IPC file of the matching readings while the cursor is read
+        an empty selection still produces a valid file with the schema and no rows
+    '''
+    if export_format not in FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, expected one of {', '.join(FORMATS)}")
+    sink = _ChunkSink()
+    writer = _writer(sink, export_format)
+    try:
+        async for batch in record_batches(db, query, batch_size, limit):
+            if export_format == "parquet":
+                await asyncio.to_thread(writer.write_batch, batch, row_group_size=batch.num_rows)
+            else:
+                await asyncio.to_thread(writer.write_batch, batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def file_name(turbine_id: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime], export_format: str) -> str:
+    '''download name like Turbine1_20160101-20160201.parquet'''
+    parts = [turbine_id or "turbines"]
+    if start_date or end_date:
+        parts.append("-".join(date.strftime("%Y%m%d") if date else "" for date in (start_date, end_date)))
+    return "_".join(parts) + FORMATS[export_format][1]
+
+def row_count(path: str, export_format: str) -> int:
+    '''rows of an exported file, read from the footer without loading the columns'''
+    if export_format == "parquet":
+        return pq.ParquetFile(path).metadata.num_rows
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(index).num_rows for index in range(reader.num_record_batches))
@@ -0,0 +1,55 @@
+'''
+raw turbine readings straight from the Motor cursor
+documents are serialized as NDJSON while the cursor is iterated, so memory is bounded by one
+cursor batch and the first bytes leave before the rest of the result has been read
+'''
+
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+from .schema_migration import flatten_reading
+
+readings_collection = "turbine_readings"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def readings_query(turbine_id: Optional[str] = None, start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None) -> Dict:
+    '''filter on the time-series metaField and the inclusive date range used by /timeseries'''
+    query: Dict = {}
+    if turbine_id:
+        query['metadata.turbine_id'] = turbine_id
+    if start_date and end_date:
+        query['timestamp'] = {'$gte': start_date, '$lte': end_date}
+    elif start_date:
+        query['timestamp'] = {'$gte': start_date}
+    elif end_date:
+        query['timestamp'] = {'$lte': end_date}
+    return query
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def to_ndjson(document: Dict) -> str:
+    return json.dumps(document, default=_json_default, separators=(',', ':')) + "\n"
+
+async def stream_readings(db: AsyncIOMotorClient, query: Dict, limit: Optional[int] = None,
+                          batch_size: int = 1000) -> AsyncIterator[bytes]:
+    '''
+        yields NDJSON chunks of up to batch_size readings in timestamp order, limit None streams everything
+    '''
+    cursor = db[readings_collection].find(query, {"_id": 0}).sort('timestamp', ASCENDING).batch_size(batch_size)
+    if limit:
+        cursor = cursor.limit(limit)
+    lines = []
+    async for document in cursor:
+        #readings that were not migrated yet are streamed in the new shape too
+        lines.append(to_ndjson(flatten_reading(document)))
+        if len(lines) >= batch_size:
+            yield "".join(lines).encode()
+            lines = []
+    if lines:
+        yield "".join(lines).encode()
@@ -0,0 +1,111 @@
+'''
+small in-process cache for aggregated responses
+entries expire after a TTL and the least recently used entry is evicted once the cache is full
+every entry is tagged with the turbine it was computed for, so ingestion can drop exactly the
+entries that new data for a turbine makes stale (plus the all-turbine entries)
+a response computed while its turbine was invalidated is not stored: callers take the generation before
+computing and pass it to set, which skips the entry when an invalidation happened in between
+'''
+
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+MISSING = object()
+
+def normalize_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    '''timezone aware query values are stored as naive UTC, the same way MongoDB compares them'''
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class TTLCache:
+    def __init__(self, maxsize: int = 256, ttl: float = 600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        #key -> (expires_at, turbine_id, value), ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[float, Optional[str], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        #invalidations per turbine, of everything, and of anything (what all-turbine entries depend on)
+        self._turbine_generations: Dict[str, int] = {}
+        self._cleared = 0
+        self._invalidated = 0
+
+    def generation(self, turbine_id: Optional[str] = None) -> Hashable:
+        '''changes whenever entries tagged with turbine_id are invalidated, see set'''
+        if turbine_id is None:
+            return self._invalidated
+        return self._turbine_generations.get(turbine_id, 0), self._cleared
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        expires_at, _, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, turbine_id: Optional[str] = None, generation: Optional[Hashable] = None):
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self.generation(turbine_id):
+            #invalidated while the value was computed, it may already be stale
+            self.stale_sets += 1
+            return
+        self._entries[key] = (self._clock() + self.ttl, turbine_id, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, turbine_id: Optional[str] = None):
+        '''drops the entries of a turbine and every entry that mixes all turbines, or everything when no turbine is given'''
+        self._invalidated += 1
+        if turbine_id is None:
+            self._cleared += 1
+            stale = list(self._entries)
+        else:
+            self._turbine_generations[turbine_id] = self._turbine_generations.get(turbine_id, 0) + 1
+            stale = [key for key, (_, entry_turbine, _) in self._entries.items() if entry_turbine in (turbine_id, None)]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_sets": self.stale_sets,
+        }
+
+#power curves per (turbine_id, start_date, end_date, bin config)
+power_curve_cache = TTLCache(
+    maxsize=int(os.getenv("POWER_CURVE_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("POWER_CURVE_CACHE_TTL", 600)),
+)
@@ -0,0 +1,116 @@
+'''
+online migration of turbine readings written with the old schema, where rpm, azimuth and the temperatures
+were stored inside the time-series metaField; MongoDB opens a bucket per distinct metaField value,
+so those readings ended up roughly one per bucket
+
+the readings of every turbine are rewritten in batches: a batch of old readings is read in timestamp order,
+inserted again with the measurements as top level fields and then the old copies are deleted,
+so the API keeps answering while the migration runs (pipelines read both shapes, see measurement_expression)
+a batch that was inserted but not deleted when the migration stopped is detected and replaced on the next run,
+so the tool can be interrupted and started again at any time
+
+sums and counts do not change, so the power curve rollups and the turbine registry stay valid
+
+usage: python -m api.services.schema_migration [--turbine-id ID] [--batch-size N] [--pause SECONDS] [--dry-run]
+'''
+
+import os
+import asyncio
+import argparse
+from typing import Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from ..models.timeseries import LEGACY_METADATA_FIELDS
+import logging
+
+readings_collection = "turbine_readings"
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 5000))
+#pause between batches so the migration leaves room for the API and the ingestion
+MIGRATION_PAUSE_SECONDS = float(os.getenv("MIGRATION_PAUSE_SECONDS", 0.05))
+
+#readings that still carry a measurement in the metaField
+LEGACY_FILTER = {"metadata.rpm": {"$exists": True}}
+
+logger = logging.getLogger("task-2")
+
+def flatten_reading(document: Dict) -> Dict:
+    '''the reading with its measurements moved out of metadata, readings in the new shape are returned as they are'''
+    metadata = document.get("metadata") or {}
+    if not any(name in metadata for name in LEGACY_METADATA_FIELDS):
+        return document
+    flattened = {key: value for key, value in document.items() if key != "metadata"}
+    for name in LEGACY_METADATA_FIELDS:
+        if name in metadata:
+            flattened.setdefault(name, metadata[name])
+    flattened["metadata"] = {key: value for key, value in metadata.items() if key not in LEGACY_METADATA_FIELDS}
+    return flattened
+
+async def legacy_turbines(db: AsyncIOMotorClient) -> List[str]:
+    return sorted(await db[readings_collection].distinct("metadata.turbine_id", LEGACY_FILTER))
+
+async def migrate_batch(db: AsyncIOMotorClient, turbine_id: str, batch_size: int) -> int:
+    '''rewrites the oldest `batch_size` old schema readings of a turbine, returns how many were migrated'''
+    legacy = await db[readings_collection].find(
+        {"metadata.turbine_id": turbine_id, **LEGACY_FILTER}
+    ).sort("timestamp", 1).limit(batch_size).to_list(length=batch_size)
+    if not legacy:
+        return 0
+
+    timestamps = [document["timestamp"] for document in legacy]
+    #copies of this batch from a run that stopped between the insert and the delete
+    await db[readings_collection].delete_many({
+        "metadata.turbine_id": turbine_id,
+        "metadata.rpm": {"$exists": False},
+        "timestamp": {"$in": timestamps},
+    })
+    #the copies get new _ids, so deleting the old readings by _id can never hit them
+    copies = [{key: value for key, value in flatten_reading(document).items() if key != "_id"} for document in legacy]
+    await db[readings_collection].insert_many(copies, ordered=False)
+    await db[readings_collection].delete_many({"_id": {"$in": [document["_id"] for document in legacy]}, **LEGACY_FILTER})
+    return len(legacy)
+
+async def migrate(db: AsyncIOMotorClient, turbine_id: Optional[str] = None, batch_size: int = MIGRATION_BATCH_SIZE,
+                  pause: float = MIGRATION_PAUSE_SECONDS) -> Dict[str, int]:
+    '''migrates every old schema reading of one turbine (or all of them), returns the migrated readings per turbine'''
+    turbine_ids = [turbine_id] if turbine_id else await legacy_turbines(db)
+    migrated: Dict[str, int] = {}
+    for current in turbine_ids:
+        migrated[current] = 0
+        while True:
+            count = await migrate_batch(db, current, batch_size)
+            if not count:
+                break
+            migrated[current] += count
+            logger.info(f"Migrated {migrated[current]} readings of {current} to the new schema")
+            if pause:
+                await asyncio.sleep(pause)
+    logger.info(f"Schema migration finished, {sum(migrated.values())} readings of {len(migrated)} turbines migrated")
+    return migrated
+
+async def pending(db: AsyncIOMotorClient) -> Dict[str, int]:
+    '''old schema readings left per turbine'''
+    pipeline = [{"$match": LEGACY_FILTER}, {"$group": {"_id": "$metadata.turbine_id", "readings": {"$sum": 1}}}]
+    return {doc["_id"]: doc["readings"] async for doc in db[readings_collection].aggregate(pipeline)}
+
+async def main(args: argparse.Namespace):
+    from mongoconnector import mongo_connector
+    await mongo_connector.connect_to_mongo(os.getenv('TURBINES_COLLECTION'), service="task2")
+    try:
+        db = mongo_connector.mongodb.db
+        if args.dry_run:
+            for turbine_id, readings in sorted((await pending(db)).items()):
+                logger.info(f"{turbine_id}: {readings} readings to migrate")
+            return
+        await migrate(db, args.turbine_id, args.batch_size, args.pause)
+    finally:
+        await mongo_connector.close_mongo_connection()
+
+if __name__ == "__main__":
+    from customlogger import customlogger
+    customlogger.setup_logging()
+    parser = argparse.ArgumentParser(description="Move measurements out of the turbine_readings metaField")
+    parser.add_argument("--turbine-id", help="only migrate this turbine")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE_SECONDS, help="seconds to wait between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many readings are left per turbine")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+'''
+small registry with one document per turbine, so listing turbines never has to scan the readings
+an entry holds the first and last reading timestamp, the number of readings and the turbine location;
+the CSV ingestion folds every written batch into it and it can be rebuilt from the raw readings
+
+reads are served from an in-process cache that every registry write drops
+'''
+
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from .response_cache import MISSING, TTLCache
+import logging
+
+registry_collection = "turbines"
+readings_collection = "turbine_readings"
+
+READING_INTERVAL_MINUTES = 10
+LOCATION_FIELDS = ["latitude", "longitude", "altitude"]
+
+#writes from this process drop the cache, the TTL bounds staleness for writes from other processes
+registry_cache = TTLCache(maxsize=4, ttl=float(os.getenv("TURBINE_REGISTRY_CACHE_TTL", 60)))
+
+logger = logging.getLogger("task-2")
+
+def registry_updates(documents: List[Dict]) -> List[UpdateOne]:
+    '''
+        folds a batch of readings into one upsert per turbine
+    '''
+    entries: Dict[str, Dict] = {}
+    for document in documents:
+        metadata = document["metadata"]
+        entry = entries.setdefault(metadata["turbine_id"], {"first": document["timestamp"], "last": document["timestamp"], "readings": 0})
+        entry["first"] = min(entry["first"], document["timestamp"])
+        entry["last"] = max(entry["last"], document["timestamp"])
+        entry["readings"] += 1
+        entry["location"] = {field: metadata.get(field) for field in LOCATION_FIELDS}
+
+    now = datetime.now(timezone.utc)
+    return [
+        UpdateOne(
+            {"_id": turbine_id},
+            {
+                "$min": {"first_timestamp": entry["first"]},
+                "$max": {"last_timestamp": entry["last"]},
+                "$inc": {"readings": entry["readings"]},
+                "$set": {**entry["location"], "updated_at": now},
+            },
+            upsert=True,
+        )
+        for turbine_id, entry in entries.items()
+    ]
+
+async def apply_batch(db: AsyncIOMotorClient, documents: List[Dict]):
+    '''adds freshly inserted readings to the registry'''
+    updates = registry_updates(documents)
+    if updates:
+        await db[registry_collection].bulk_write(updates, ordered=False)
+        registry_cache.invalidate()
+
+async def rebuild(db: AsyncIOMotorClient, turbine_id: Optional[str] = None):
+    '''
+        recomputes the entry of one turbine (or all of them) from the raw readings
+        turbines without readings left lose their entry
+    '''
+    await db[registry_collection].delete_many({"_id": turbine_id} if turbine_id else {})
+    pipeline = [
+        {"$match": {"metadata.turbine_id": turbine_id} if turbine_id else {}},
+        {"$sort": {"timestamp": 1}},
+        {
+            "$group": {
+                "_id": "$metadata.turbine_id",
+                "first_timestamp": {"$first": "$timestamp"},
+                "last_timestamp": {"$last": "$timestamp"},
+                "readings": {"$sum": 1},
+                **{field: {"$last": f"$metadata.{field}"} for field in LOCATION_FIELDS},
+            }
+        },
+        {"$set": {"updated_at": "$$NOW"}},
+        {"$merge": {"into": registry_collection, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    async for _ in db[readings_collection].aggregate(pipeline):
+        pass
+    registry_cache.invalidate()
+    logger.info(f"Rebuilt turbine registry for {turbine_id or 'all turbines'}")
+
+async def ensure_registry(db: AsyncIOMotorClient):
+    '''backfills the registry once for readings that were loaded before it existed'''
+    if await db[registry_collection].count_documents({}, limit=1):
+        return
+    if await db[readings_collection].count_documents({}, limit=1):
+        await rebuild(db)
+
+async def list_turbines(db: AsyncIOMotorClient) -> List[Dict]:
+    '''registry entries ordered by turbine id, served from the in-process cache'''
+    cached = registry_cache.get("turbines")
+    if cached is not MISSING:
+        return cached
+    entries = await db[registry_collection].find({}).sort("_id", 1).to_list(length=None)
+    registry_cache.set("turbines", entries)
+    return entries
+
+def coverage(entry: Dict) -> float:
+    '''share of the 10 minute slots between the first and last reading that hold a reading'''
+    slots = (entry["last_timestamp"] - entry["first_timestamp"]).total_seconds() / 60 / READING_INTERVAL_MINUTES + 1
+    return round(min(entry["readings"] / slots, 1.0), 4)
@@ -0,0 +1,17 @@
+import pytest
+
+CSV_HEADER = "Dat/Zeit     ; Wind ; Rotor ; Leistung ; Azimut ; Außen ; Lager\n"
+CSV_UNITS = "             ; m/s  ; U/min ; kW ; ° ; °C ; °C\n"
+
+@pytest.fixture
+def turbine_csv(tmp_path):
+    '''small turbine export with one broken timestamp row'''
+    rows = [
+        "01.01.2016, 00:00;5,2;12,1;1500,5;120;3,5;20,1",
+        "01.01.2016, 00:10;6,1;12,4;1620;121;3,4;20,3",
+        "not a date;6,1;12,4;1620;121;3,4;20,3",
+        "01.01.2016, 00:30;7,4;13;1800,25;119;3,2;20,2",
+    ]
+    path = tmp_path / "Turbine1.csv"
+    path.write_text(CSV_HEADER + CSV_UNITS + "\n".join(rows) + "\n", encoding="utf-8")
+    return path
@@ -0,0 +1,90 @@
+from unittest.mock import AsyncMock, MagicMock
+from datetime import datetime
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+from ..services import bulk_loader
+
+def reading(minute, turbine_id="Turbine1"):
+    return {"timestamp": datetime(2016, 1, 1, 0, minute), "power": 1.0, "wind_speed": 5.0, "metadata": {"turbine_id": turbine_id}}
+
+class StoredReadings:
+    '''async iterable standing in for the dedupe find cursor'''
+    def __init__(self, minutes):
+        self.documents = [{"timestamp": datetime(2016, 1, 1, 0, minute)} for minute in minutes]
+
+    def __aiter__(self):
+        self._iter = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+def mock_db(stored=(), insert_side_effect=None):
+    collection = MagicMock()
+    collection.find = MagicMock(side_effect=lambda *args: StoredReadings(stored))
+    collection.insert_many = AsyncMock(side_effect=insert_side_effect)
+    collection.with_options.return_value = collection
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    return db, collection
+
+@pytest.mark.asyncio
+async def test_load_batch_skips_stored_and_repeated_readings():
+    db, collection = mock_db(stored=[10])
+    documents = [reading(0), reading(10), reading(20), reading(20)]
+
+    result = await bulk_loader.load_batch(db, "turbine_readings", documents)
+
+    assert result.duplicates == 2
+    assert [document["timestamp"].minute for document in result.inserted] == [0, 20]
+    query = collection.find.call_args[0][0]
+    assert query == {"metadata.turbine_id": "Turbine1", "timestamp": {"$gte": datetime(2016, 1, 1, 0, 0), "$lte": datetime(2016, 1, 1, 0, 20)}}
+    assert collection.insert_many.await_args.kwargs == {"ordered": False}
+
+@pytest.mark.asyncio
+async def test_load_batch_retries_only_failed_readings():
+    '''a rejected reading is dropped, a transient failure is sent again without the rest of the batch'''
+    partial = BulkWriteError({"writeErrors": [
+        {"index": 1, "code": 121, "errmsg": "Document failed validation"},
+        {"index": 2, "code": 11600, "errmsg": "interrupted at shutdown"},
+    ]})
+    db, collection = mock_db(insert_side_effect=[partial, None])
+    documents = [reading(0), reading(10), reading(20)]
+
+    result = await bulk_loader.load_batch(db, "turbine_readings", documents, backoff=0)
+
+    assert result.failed == 1 and result.retries == 1
+    assert [document["timestamp"].minute for document in result.inserted] == [0, 20]
+    assert collection.insert_many.await_args_list[1].args[0] == [documents[2]]
+
+@pytest.mark.asyncio
+async def test_load_batch_without_dedupe_still_deduplicates_a_resent_batch():
+    '''the server applied part of the batch before the connection dropped, the retry must not insert it twice'''
+    db, collection = mock_db(stored=[0], insert_side_effect=[AutoReconnect("connection closed"), None])
+    documents = [reading(0), reading(10)]
+
+    result = await bulk_loader.load_batch(db, "turbine_readings", documents, dedupe=False, backoff=0)
+
+    assert collection.insert_many.await_args_list[0].args[0] == documents
+    assert collection.insert_many.await_args_list[1].args[0] == [documents[1]]
+    assert result.duplicates == 1 and result.retries == 1
+    assert [document["timestamp"].minute for document in result.inserted] == [10]
+    assert collection.find.call_count == 1
+
+@pytest.mark.asyncio
+async def test_load_batch_gives_up_after_retries():
+    db, collection = mock_db(insert_side_effect=AutoReconnect("connection closed"))
+
+    with pytest.raises(AutoReconnect):
+        await bulk_loader.load_batch(db, "turbine_readings", [reading(0)], retries=2, backoff=0)
+    assert collection.insert_many.await_count == 3
+    #after a network error the whole batch is deduplicated again before it is resent
+    assert collection.find.call_count == 3
+
+def test_write_concern_from_settings():
+    assert bulk_loader.write_concern("", "") is None
+    assert bulk_loader.write_concern("majority", "true").document == {"w": "majority", "j": True}
+    assert bulk_loader.write_concern("1", "false").document == {"w": 1, "j": False}
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, Future
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from ..services import bulk_loader, csv_service, ingest_manifest
+
+def test_parse_csv_file_batches(turbine_csv):
+    '''rows are split into batches and invalid rows are counted instead of aborting the file'''
+    result = csv_service.parse_csv_file(str(turbine_csv), "Turbine1", batch_size=2)
+
+    assert result["rows"] == 3
+    assert result["skipped"] == 1
+    assert [len(documents) for _, documents in result["batches"]] == [2, 1]
+    assert [end_row for end_row, _ in result["batches"]] == [2, 4]
+
+    first = result["batches"][0][1][0]
+    assert first["timestamp"] == datetime(2016, 1, 1, 0, 0)
+    assert first["power"] == 1500.5
+    assert first["wind_speed"] == 5.2
+    assert first["metadata"]["turbine_id"] == "Turbine1"
+    assert first["external_temperature"] == 3.5
+    #measurements are top level, the metaField only identifies the turbine
+    assert set(first["metadata"]) == {"turbine_id", "latitude", "longitude", "altitude"}
+
+def test_count_csv_file_returns_counts_only(turbine_csv):
+    '''the dry run worker parses like parse_csv_file but sends no documents back'''
+    result = csv_service.count_csv_file(str(turbine_csv), "Turbine1", batch_size=2)
+
+    assert (result["rows"], result["skipped"]) == (3, 1)
+    assert "batches" not in result
+
+def test_parse_csv_file_resumes_after_start_row(turbine_csv):
+    '''rows before start_row were committed by an earlier run and are not parsed again'''
+    result = csv_service.parse_csv_file(str(turbine_csv), "Turbine1", batch_size=2, start_row=3)
+
+    assert result["rows"] == 1
+    assert result["batches"] == [(4, result["batches"][0][1])]
+    assert result["batches"][0][1][0]["timestamp"] == datetime(2016, 1, 1, 0, 30)
+
+def test_parse_csv_columns_matches_row_parser():
+    '''columnar parser returns exactly what parse_csv_row produces, including skipped rows'''
+    fieldnames = ["Dat/Zeit", "Wind", "Rotor", "Leistung", "Azimut", "Außen", "Lager", "Latitude", "Longitude", "Altitude"]
+    rows = [
+        ["01.01.2016, 00:00", "5,2", "12,1", "1500,5", "120", "3,5", "20,1", "", "", ""],
+        ["1.1.2016, 0:10", "6,1", "", "", "121", "3,4", "20,3", "52,1", "13,4", "35"],
+        ["31.02.2016, 00:00", "6,1", "12,4", "1620", "121", "3,4", "20,3", "", "", ""],
+        ["01.01.2016, 00:30", "", "13", "1800", "119", "3,2", "20,2", "", "", ""],
+        ["01.01.2016, 00:40", "7,4", "abc", "1800", "119", "3,2", "20,2", "", "", ""],
+        ["01.01.2016, 00:50", "7,4", "13"],
+    ]
+
+    expected, skipped = [], 0
+    for row in rows:
+        try:
+            expected.append(csv_service.parse_csv_row(dict(zip(fieldnames, row + [None] * (len(fieldnames) - len(row)))), "Turbine1"))
+        except Exception:
+            skipped += 1
+
+    documents, columnar_skipped = csv_service.parse_csv_columns(rows, fieldnames, "Turbine1")
+    assert documents == expected
+    assert columnar_skipped == skipped == 3
+
+
+class InlineExecutor(Executor):
+    '''runs the parser on the calling thread instead of a spawned worker process'''
+    shutdown_threads = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shutdown_threads.append((wait, threading.current_thread()))
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+class FakeWriter:
+    '''
+        write_documents replacement, every batch waits until the test releases it by its first timestamp
+        so the writers can be made to finish batches in any order
+    '''
+    def __init__(self, fail=None):
+        self.released = {}
+        self.written = []
+        self.fail = fail
+
+    def release(self, timestamp: datetime):
+        self.released.setdefault(timestamp, asyncio.Event()).set()
+
+    async def __call__(self, db, turbine_id, documents):
+        timestamp = documents[0]["timestamp"]
+        await self.released.setdefault(timestamp, asyncio.Event()).wait()
+        if timestamp == self.fail:
+            raise RuntimeError("write failed")
+        self.written.append(timestamp)
+        return bulk_loader.LoadResult(inserted=documents)
+
+def fake_db(entry=None):
+    '''manifest and readings collections of a database, the manifest returns the given entry'''
+    collections = {name: MagicMock() for name in (ingest_manifest.manifest_collection, ingest_manifest.readings_collection)}
+    collections[ingest_manifest.manifest_collection].find_one = AsyncMock(return_value=entry)
+    collections[ingest_manifest.manifest_collection].update_one = AsyncMock()
+    collections[ingest_manifest.manifest_collection].delete_many = AsyncMock(return_value=MagicMock(deleted_count=0))
+    collections[ingest_manifest.readings_collection].delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+    db = MagicMock()
+    db.__getitem__.side_effect = collections.__getitem__
+    return db
+
+def manifest_updates(db):
+    '''the $max/$set parts of every manifest update after prepare_file, in order'''
+    updates = [call.args[1] for call in db[ingest_manifest.manifest_collection].update_one.await_args_list]
+    return [(update["$max"], update["$set"].get("status")) for update in updates[1:]]
+
+def _plan(turbine_csv, start_row=0, reason="new"):
+    return ingest_manifest.FilePlan(file_path=str(turbine_csv), file_name="Turbine1.csv", turbine_id="Turbine1",
+                                    size=1, mtime=0, start_row=start_row, reason=reason)
+
+@asynccontextmanager
+async def _ingest(db, plans, writer, writers=2):
+    '''runs ingest_csv_files with one CSV row per batch in the background, the run is awaited on exit'''
+    with patch('api.services.csv_service.ProcessPoolExecutor', InlineExecutor), \
+         patch('api.services.csv_service.ingestion_status'), \
+         patch('api.services.csv_service.write_documents', new=writer), \
+         patch('api.services.ingest_manifest.power_curve_rollup.rebuild', new=AsyncMock()), \
+         patch('api.services.ingest_manifest.turbine_registry.rebuild', new=AsyncMock()):
+        task = asyncio.create_task(csv_service.ingest_csv_files(db, plans, workers=1, writers=writers, batch_size=1))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        yield task
+        await task
+
+T0, T10, T30 = datetime(2016, 1, 1, 0, 0), datetime(2016, 1, 1, 0, 10), datetime(2016, 1, 1, 0, 30)
+
+@pytest.mark.asyncio
+async def test_commit_batch_only_commits_the_contiguous_prefix():
+    stats = csv_service.FileIngestStats(file_name="Turbine1.csv", turbine_id="Turbine1")
+    with patch('api.services.csv_service.ingest_manifest.record_progress', new=AsyncMock()) as record_progress:
+        await csv_service._commit_batch(MagicMock(), stats, 2, 300, T30)
+        await csv_service._commit_batch(MagicMock(), stats, 1, 200, T10)
+        record_progress.assert_not_awaited()
+        assert stats.rows_committed == 0
+
+        await csv_service._commit_batch(MagicMock(), stats, 0, 100, T0)
+
+    record_progress.assert_awaited_once()
+    assert record_progress.await_args.args[1:] == ("Turbine1.csv", 300, T30)
+    assert stats.next_commit == 3 and stats.written == {}
+
+@pytest.mark.asyncio
+async def test_writers_finishing_out_of_order_commit_in_file_order(turbine_csv):
+    '''a later batch written first is only committed once every batch before it is written'''
+    db, writer = fake_db(), FakeWriter()
+    async with _ingest(db, [_plan(turbine_csv)], writer) as task:
+        #rows 1 and 2 are with the two writers, the second one finishes first
+        writer.release(T10)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert manifest_updates(db) == []
+
+        writer.release(T0)
+        writer.release(T30)
+
+    stats = task.result()[0]
+    #the waiting shutdown of the pool runs off the event loop thread
+    assert (True, threading.main_thread()) not in InlineExecutor.shutdown_threads
+    assert any(wait for wait, _ in InlineExecutor.shutdown_threads)
+    assert writer.written == [T10, T0, T30]
+    assert (stats.rows_written, stats.rows_committed, stats.last_timestamp) == (3, 4, T30)
+    #the broken row 3 is an empty batch, written while row 1 was pending, so the first commit already covers it
+    assert manifest_updates(db)[0] == ({"rows_ingested": 3, "last_timestamp": T10}, None)
+    assert manifest_updates(db)[-2:] == [
+        ({"rows_ingested": 4, "last_timestamp": T30}, None),
+        ({"rows_ingested": 4}, ingest_manifest.STATUS_COMPLETE),
+    ]
+
+@pytest.mark.asyncio
+async def test_failed_batch_stops_later_commits(turbine_csv):
+    '''the manifest stays in progress at the last batch before the failure, later batches are left to the resume'''
+    db, writer = fake_db(), FakeWriter(fail=T10)
+    async with _ingest(db, [_plan(turbine_csv)], writer, writers=1) as task:
+        for timestamp in (T0, T10, T30):
+            writer.release(timestamp)
+
+    stats = task.result()[0]
+    assert stats.error == "write failed"
+    assert writer.written == [T0, T30]
+    assert stats.rows_committed == 1
+    assert manifest_updates(db) == [({"rows_ingested": 1, "last_timestamp": T0}, None)]
+
+@pytest.mark.asyncio
+async def test_resume_after_a_crash_deletes_uncommitted_readings(turbine_csv):
+    '''readings written after the last committed batch are deleted and the file continues after its committed rows'''
+    entry = {"_id": "Turbine1.csv", "status": ingest_manifest.STATUS_IN_PROGRESS, "rows_ingested": 1, "last_timestamp": T0}
+    db, writer = fake_db(entry), FakeWriter()
+    async with _ingest(db, [_plan(turbine_csv, start_row=1, reason="resumed")], writer) as task:
+        writer.release(T10)
+        writer.release(T30)
+
+    db[ingest_manifest.readings_collection].delete_many.assert_awaited_once_with(
+        {"metadata.turbine_id": "Turbine1", "timestamp": {"$gt": T0}}
+    )
+    prepared = db[ingest_manifest.manifest_collection].update_one.await_args_list[0].args[1]
+    assert prepared["$set"]["rows_ingested"] == 1 and prepared["$set"]["status"] == ingest_manifest.STATUS_IN_PROGRESS
+    assert writer.written == [T10, T30]
+    assert task.result()[0].rows_committed == 4
+    assert manifest_updates(db)[-1] == ({"rows_ingested": 4}, ingest_manifest.STATUS_COMPLETE)
+
+@pytest.mark.asyncio
+async def test_changed_file_is_reloaded_from_scratch(turbine_csv):
+    entry = {"_id": "Turbine1.csv", "status": ingest_manifest.STATUS_COMPLETE, "rows_ingested": 4, "last_timestamp": T30}
+    db, writer = fake_db(entry), FakeWriter()
+    plan = _plan(turbine_csv, reason="changed")
+    plan.reset = True
+    async with _ingest(db, [plan], writer) as task:
+        for timestamp in (T0, T10, T30):
+            writer.release(timestamp)
+
+    db[ingest_manifest.readings_collection].delete_many.assert_awaited_once_with({"metadata.turbine_id": "Turbine1"})
+    prepared = db[ingest_manifest.manifest_collection].update_one.await_args_list[0].args[1]
+    assert prepared["$set"]["rows_ingested"] == 0 and prepared["$unset"] == {"last_timestamp": ""}
+    assert sorted(writer.written) == [T0, T10, T30]
+    assert task.result()[0].rows_written == 3
+    assert manifest_updates(db)[-1] == ({"rows_ingested": 4}, ingest_manifest.STATUS_COMPLETE)
@@ -0,0 +1,73 @@
+import gzip
+import zipfile
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from ..services import csv_service, csv_sources, ingest_manifest
+
+@pytest.fixture
+def exports(turbine_csv, tmp_path):
+    '''the same export as .csv.gz and as two members of a zip archive'''
+    content = turbine_csv.read_bytes()
+    directory = tmp_path / "exports"
+    directory.mkdir()
+    (directory / "Turbine2.csv.gz").write_bytes(gzip.compress(content))
+    with zipfile.ZipFile(directory / "site.zip", "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("north/Turbine3.csv", content)
+        archive.writestr("south/Turbine4.csv", content)
+        archive.writestr("readme.txt", "not an export")
+    (directory / "notes.txt").write_text("not an export")
+    return directory
+
+def test_discover_maps_every_zip_member_to_its_own_turbine(exports):
+    sources = csv_sources.discover(str(exports))
+
+    assert [(source.turbine_id, source.name) for source in sources] == [
+        ("Turbine2", "Turbine2.csv.gz"),
+        ("Turbine3", "site.zip/north/Turbine3.csv"),
+        ("Turbine4", "site.zip/south/Turbine4.csv"),
+    ]
+
+def test_compressed_sources_parse_like_the_plain_file(turbine_csv, exports):
+    expected = csv_service.parse_csv_file(str(turbine_csv), "Turbine1")["batches"]
+    for source in csv_sources.discover(str(exports)):
+        result = csv_service.parse_csv_file(source.path, "Turbine1", member=source.member)
+        assert result["batches"] == expected
+
+def test_zst_source_parses_like_the_plain_file(turbine_csv, tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / "Turbine5.csv.zst"
+    path.write_bytes(zstandard.ZstdCompressor().compress(turbine_csv.read_bytes()))
+
+    source, = csv_sources.sources_for(str(path))
+    assert source.turbine_id == "Turbine5"
+    assert csv_service.parse_csv_file(source.path, "Turbine1")["batches"] == csv_service.parse_csv_file(str(turbine_csv), "Turbine1")["batches"]
+
+@pytest.mark.asyncio
+async def test_plan_zip_member_uses_member_content(turbine_csv, exports):
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    plan = await ingest_manifest.plan_file(db, str(exports / "site.zip"), "Turbine3", "north/Turbine3.csv")
+
+    #the second lookup checks for readings of the turbine that no manifest entry covers
+    assert collection.find_one.await_args_list[0].args == ({"_id": "site.zip/north/Turbine3.csv"},)
+    assert plan.member == "north/Turbine3.csv"
+    assert plan.size == turbine_csv.stat().st_size
+    assert plan.sha256 == ingest_manifest.file_sha256(str(turbine_csv))
+
+def test_discover_loads_a_turbine_from_one_source_only(turbine_csv, exports, caplog):
+    '''a second source of a turbine would delete the readings of the first one on a reset'''
+    content = turbine_csv.read_bytes()
+    (exports / "Turbine2.csv").write_bytes(content)
+    with zipfile.ZipFile(exports / "archive.zip", "w") as archive:
+        archive.writestr("Turbine3.csv", content)
+
+    sources = csv_sources.discover(str(exports))
+
+    assert [source.name for source in sources] == [
+        "Turbine2.csv", "archive.zip/Turbine3.csv", "site.zip/south/Turbine4.csv",
+    ]
+    assert "Skipping Turbine2.csv.gz: Turbine2.csv is already loaded as turbine_id Turbine2" in caplog.text
+    assert "Skipping site.zip/north/Turbine3.csv" in caplog.text
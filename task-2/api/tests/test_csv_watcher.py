@@ -0,0 +1,111 @@
+import hashlib
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+import pytest
+from ..services import bulk_loader, csv_watcher, ingest_manifest
+from ..services.csv_sources import CsvSource
+
+NEW_ROWS = "01.01.2016, 00:40;8,0;13,2;1900;118;3,1;20,0\n01.01.2016, 00:50;8,2;13,3;1950;118;3,1;20,0\n"
+
+def _plan(path, reason, start_row=0):
+    return ingest_manifest.FilePlan(file_path=str(path), file_name=path.name, turbine_id="Turbine1", size=1, mtime=0,
+                                    start_row=start_row, skip=reason == "unchanged", reason=reason)
+
+def _offset(path, rows):
+    '''bytes of the header, the units and the first `rows` data rows'''
+    return sum(len(line) for line in path.read_bytes().splitlines(keepends=True)[:2 + rows])
+
+def test_tail_from_manifest_reads_only_new_complete_lines(turbine_csv):
+    '''the ingested rows of the manifest are not read again, a half written line is only read once it is complete'''
+    size = turbine_csv.stat().st_size
+    state = csv_watcher.from_manifest(CsvSource(str(turbine_csv), "Turbine1"), rows=4, size=size)
+    assert state.fieldnames[0] == "Dat/Zeit"
+    assert (state.offset, state.rows_pending, state.digest) == (size, 0, None)
+    state.digest = ingest_manifest.file_digest(str(turbine_csv), state.offset)
+    with open(turbine_csv, "a", encoding="utf-8") as file:
+        file.write("01.01.2016, 00:40;8,0;13")
+
+    assert csv_watcher.read_documents(state, 100) == 0
+    with open(turbine_csv, "a", encoding="utf-8") as file:
+        file.write(";1900;118;3,1;20,0\n")
+    assert csv_watcher.read_documents(state, 100) == 1
+    assert [document["timestamp"] for document in state.documents] == [datetime(2016, 1, 1, 0, 40)]
+    assert (state.rows, state.rows_pending) == (5, 1)
+    assert state.last_timestamp == datetime(2016, 1, 1, 0, 40)
+    #the consumed bytes hash like the manifest hashes the file prefix
+    assert state.digest.hexdigest() == ingest_manifest.file_sha256(str(turbine_csv), state.offset)
+
+def test_read_rows_takes_last_line_without_break_when_final(turbine_csv):
+    turbine_csv.write_text(turbine_csv.read_text(encoding="utf-8").rstrip("\n"), encoding="utf-8")
+    state = csv_watcher.TailState(CsvSource(str(turbine_csv), "Turbine1"))
+
+    assert len(csv_watcher.read_rows(state, 100)) == 3
+    assert state.fieldnames[0] == "Dat/Zeit"
+    assert len(csv_watcher.read_rows(state, 100, final=True)) == 1
+    assert state.offset == turbine_csv.stat().st_size
+
+@pytest.mark.asyncio
+async def test_poll_tails_appended_rows_and_flushes_by_size(turbine_csv):
+    '''a full batch is written right away and the manifest gets the consumed size, hash and row'''
+    watcher = csv_watcher.CsvWatcher(MagicMock(), turbine_csv.parent, batch_size=2, flush_seconds=60)
+    result = bulk_loader.LoadResult(inserted=[{}, {}])
+    with patch('api.services.csv_watcher.ingest_manifest.plan_file', new=AsyncMock(return_value=_plan(turbine_csv, "unchanged"))), \
+         patch('api.services.csv_watcher.ingest_manifest.ingested_position', new=AsyncMock(return_value=(4, turbine_csv.stat().st_size))), \
+         patch('api.services.csv_watcher.ingest_manifest.record_tail', new=AsyncMock()) as record_tail, \
+         patch('api.services.csv_watcher.csv_service.write_documents', new=AsyncMock(return_value=result)) as write:
+        await watcher.poll()
+        write.assert_not_awaited()
+        #an unchanged file is neither read nor hashed
+        assert watcher.tails["Turbine1.csv"].digest is None
+
+        with open(turbine_csv, "a", encoding="utf-8") as file:
+            file.write(NEW_ROWS)
+        await watcher.poll()
+
+    documents = write.await_args.args[2]
+    assert [document["timestamp"] for document in documents] == [datetime(2016, 1, 1, 0, 40), datetime(2016, 1, 1, 0, 50)]
+    _, file_name, turbine_id, rows, last_timestamp, size, _, sha256 = record_tail.await_args.args
+    assert (file_name, turbine_id, rows, last_timestamp) == ("Turbine1.csv", "Turbine1", 6, datetime(2016, 1, 1, 0, 50))
+    assert size == turbine_csv.stat().st_size
+    assert sha256 == hashlib.sha256(turbine_csv.read_bytes()).hexdigest()
+    assert watcher.snapshot()["rows_written"] == 2
+    assert watcher.snapshot()["rows_pending"] == 0
+
+@pytest.mark.asyncio
+async def test_poll_flushes_a_partial_batch_after_flush_seconds(turbine_csv):
+    watcher = csv_watcher.CsvWatcher(MagicMock(), turbine_csv.parent, batch_size=1000, flush_seconds=5)
+    clock = MagicMock(return_value=100.0)
+    with patch('api.services.csv_watcher.time.monotonic', new=clock), \
+         patch('api.services.csv_watcher.ingest_manifest.plan_file', new=AsyncMock(return_value=_plan(turbine_csv, "appended", 2))), \
+         patch('api.services.csv_watcher.ingest_manifest.ingested_position', new=AsyncMock(return_value=(2, _offset(turbine_csv, 2)))), \
+         patch('api.services.csv_watcher.ingest_manifest.record_tail', new=AsyncMock()) as record_tail, \
+         patch('api.services.csv_watcher.csv_service.write_documents', new=AsyncMock(return_value=bulk_loader.LoadResult())):
+        await watcher.poll()
+        #rows 3 and 4 are buffered but neither the batch is full nor are they old enough
+        record_tail.assert_not_awaited()
+        assert watcher.snapshot()["rows_pending"] == 2
+
+        clock.return_value = 105.0
+        await watcher.poll()
+
+    assert record_tail.await_args.args[3] == 4
+
+@pytest.mark.asyncio
+async def test_poll_hands_changed_files_to_an_ingestion_run_once(turbine_csv):
+    watcher = csv_watcher.CsvWatcher(MagicMock(), turbine_csv.parent)
+    with patch('api.services.csv_watcher.ingest_manifest.plan_file', new=AsyncMock(return_value=_plan(turbine_csv, "changed"))), \
+         patch('api.services.csv_watcher.csv_service.start_background_ingestion', return_value=True) as start:
+        await watcher.poll()
+        await watcher.poll()
+
+    start.assert_called_once_with(watcher.db, turbine_csv.parent)
+    assert watcher.tails == {}
+
+@pytest.mark.asyncio
+async def test_poll_waits_for_a_running_ingestion(turbine_csv):
+    watcher = csv_watcher.CsvWatcher(MagicMock(), turbine_csv.parent)
+    with patch('api.services.csv_watcher.ingestion_status') as status, \
+         patch('api.services.csv_watcher.ingest_manifest.plan_file', new=AsyncMock()) as plan_file:
+        status.running = True
+        await watcher.poll()
+    plan_file.assert_not_awaited()
@@ -0,0 +1,30 @@
+from datetime import datetime
+import numpy as np
+from ..services import downsampling
+
+def test_lttb_keeps_endpoints_and_target_count():
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+
+    indices = downsampling.lttb(x, y, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+def test_lttb_keeps_spikes():
+    '''a single outlier forms the largest triangle of its bucket and survives the reduction'''
+    x = np.arange(500)
+    y = np.zeros(500)
+    y[237] = 100.0
+
+    assert 237 in downsampling.lttb(x, y, 20)
+
+def test_lttb_returns_short_series_unchanged():
+    x = np.arange(5)
+    assert list(downsampling.lttb(x, x, 10)) == [0, 1, 2, 3, 4]
+
+def test_window_minutes_splits_range_into_points():
+    #a year of 10 minute readings into 500 windows
+    assert downsampling.window_minutes(datetime(2016, 1, 1), datetime(2017, 1, 1), 500) == 1055
+    assert downsampling.window_minutes(datetime(2016, 1, 1), datetime(2016, 1, 1, 1), 500) == 1
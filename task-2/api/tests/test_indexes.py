@@ -0,0 +1,49 @@
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from mongoconnector import index_advisor
+from ..services import indexes
+from ..services.readings_cursor import page_sort
+
+def _probe(route):
+    return next(probe for probe in indexes.PROBES if probe.route == route)
+
+def _explain(*stages):
+    '''explain of a find on a time-series collection, rewritten to an aggregation over the buckets'''
+    return {"stages": [
+        {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}},
+        {"$_internalUnpackBucket": {"timeField": "timestamp", "metaField": "metadata"}},
+        *stages,
+    ]}
+
+def test_page_probes_use_the_route_order():
+    assert list(_probe("GET /timeseries/page").sort.items()) == page_sort({"metadata.turbine_id": "Turbine1"})
+    assert list(_probe("GET /timeseries/page (all turbines)").sort.items()) == page_sort({})
+
+def test_page_orders_are_prefixes_of_an_index():
+    '''the time-series collection can only stream an order that an index on turbine_readings provides'''
+    patterns = [spec.keys for spec in indexes.INDEXES if spec.collection == "turbine_readings"]
+    for selection in ({"metadata.turbine_id": "Turbine1"}, {}):
+        order = page_sort(selection)
+        fields = [name for name, _ in order]
+        assert any(
+            keys[:len(order)] == order or (keys[0][0] in selection and [name for name, _ in keys[1:]] == fields)
+            for keys in patterns
+        )
+
+@pytest.mark.asyncio
+async def test_explain_probe_reports_in_memory_sorts():
+    db = MagicMock()
+    db.command = AsyncMock(return_value=_explain({"$sort": {"sortKey": {"metadata.turbine_id": 1, "timestamp": 1}}}))
+
+    assert await index_advisor.explain_probe(db, _probe("GET /timeseries/page (all turbines)")) == ["in-memory $sort"]
+    command = db.command.await_args.args[0]["explain"]
+    assert command["sort"] == {"metadata.turbine_id": 1, "timestamp": 1}
+    assert "$or" in command["filter"]["$and"][1]
+
+@pytest.mark.asyncio
+async def test_explain_probe_accepts_bounded_sorts():
+    '''$_internalBoundedSort streams buckets in index order, it is what the page routes should get'''
+    db = MagicMock()
+    db.command = AsyncMock(return_value=_explain({"$_internalBoundedSort": {"sortKey": {"timestamp": 1}}}))
+
+    assert await index_advisor.explain_probe(db, _probe("GET /timeseries/page")) == []
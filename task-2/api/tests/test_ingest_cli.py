@@ -0,0 +1,43 @@
+from unittest.mock import AsyncMock, patch
+import pytest
+from .. import ingest
+from ..services import csv_service, ingest_manifest
+from ..services.csv_sources import CsvSource
+
+def test_discover_files_accepts_files_and_directories(turbine_csv, tmp_path):
+    (tmp_path / "notes.txt").write_text("not a turbine")
+
+    assert ingest.discover_files([str(tmp_path)]) == [CsvSource(str(turbine_csv), "Turbine1")]
+    assert ingest.discover_files([str(turbine_csv)]) == [CsvSource(str(turbine_csv), "Turbine1")]
+    with pytest.raises(FileNotFoundError):
+        ingest.discover_files([str(tmp_path / "missing")])
+
+def test_dry_run_parses_without_database(turbine_csv, capsys):
+    with patch('api.ingest.mongo_connector.connect_to_mongo', new=AsyncMock()) as connect:
+        assert ingest.main([str(turbine_csv), "--dry-run", "--workers", "1"]) == 0
+    connect.assert_not_awaited()
+    output = capsys.readouterr().out
+    assert "Turbine1.csv: 3 rows (1 skipped)" in output
+    assert "dry run: 3 rows from 1 files" in output
+
+def test_ingest_reports_parse_and_write_rates(turbine_csv, capsys):
+    plan = ingest_manifest.FilePlan(file_path=str(turbine_csv), file_name="Turbine1.csv", turbine_id="Turbine1", size=1, mtime=0)
+    stats = csv_service.FileIngestStats(file_name="Turbine1.csv", turbine_id="Turbine1", rows_parsed=3, rows_written=2,
+                                        rows_duplicate=1, parse_seconds=0.5, write_seconds=0.25)
+    with patch('api.ingest.mongo_connector') as mock_connector, \
+         patch('api.ingest.ensure_indexes', new=AsyncMock()), \
+         patch('api.ingest.power_curve_rollup.ensure_rollups', new=AsyncMock()), \
+         patch('api.ingest.turbine_registry.ensure_registry', new=AsyncMock()), \
+         patch('api.ingest.ingest_manifest.plan_file', new=AsyncMock(return_value=plan)), \
+         patch('api.ingest.csv_service.ingest_csv_files', new=AsyncMock(return_value=[stats])) as ingest_files:
+        mock_connector.connect_to_mongo = AsyncMock()
+        mock_connector.close_mongo_connection = AsyncMock()
+
+        assert ingest.main([str(turbine_csv), "--database", "time_series_data", "--workers", "3", "--batch-size", "500"]) == 0
+
+    mock_connector.connect_to_mongo.assert_awaited_once_with("time_series_data", service="task2")
+    mock_connector.close_mongo_connection.assert_awaited_once()
+    assert ingest_files.await_args.kwargs["workers"] == 3 and ingest_files.await_args.kwargs["batch_size"] == 500
+    output = capsys.readouterr().out
+    assert "Turbine1.csv: 2 rows written, 1 duplicates" in output
+    assert "parse 0.50s 6 rows/s, write 0.25s 8 rows/s" in output
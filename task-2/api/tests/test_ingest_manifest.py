@@ -0,0 +1,112 @@
+import os
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from ..services import ingest_manifest
+
+def mock_db(entry):
+    '''db whose manifest collection returns the given entry'''
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=entry)
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    return db
+
+@pytest.mark.asyncio
+async def test_plan_new_file(turbine_csv):
+    '''files without a manifest entry are loaded from the first row'''
+    plan = await ingest_manifest.plan_file(mock_db(None), str(turbine_csv), "Turbine1")
+
+    assert not plan.skip and not plan.reset
+    assert plan.start_row == 0
+    assert plan.sha256 == ingest_manifest.file_sha256(str(turbine_csv))
+
+@pytest.mark.asyncio
+async def test_plan_unchanged_file_is_skipped(turbine_csv):
+    stat = os.stat(turbine_csv)
+    entry = {"_id": "Turbine1.csv", "status": "complete", "size": stat.st_size, "mtime": stat.st_mtime, "rows_ingested": 1}
+
+    plan = await ingest_manifest.plan_file(mock_db(entry), str(turbine_csv), "Turbine1")
+    assert plan.skip
+
+@pytest.mark.asyncio
+async def test_plan_appended_file_resumes_after_ingested_rows(turbine_csv):
+    '''only the rows after the recorded ones are loaded when the old content is still a prefix'''
+    entry = {
+        "_id": "Turbine1.csv",
+        "status": "complete",
+        "size": os.path.getsize(turbine_csv),
+        "mtime": 0.0,
+        "sha256": ingest_manifest.file_sha256(str(turbine_csv)),
+        "rows_ingested": 1,
+    }
+    with open(turbine_csv, "a", encoding="utf-8") as file:
+        file.write("01.01.2016, 00:10;6,1;12,4;1620;121;3,4;20,3\n")
+
+    plan = await ingest_manifest.plan_file(mock_db(entry), str(turbine_csv), "Turbine1")
+    assert not plan.skip and not plan.reset
+    assert plan.start_row == 1
+    assert plan.reason == "appended"
+
+@pytest.mark.asyncio
+async def test_plan_rewritten_file_is_reloaded(turbine_csv):
+    entry = {"_id": "Turbine1.csv", "status": "complete", "size": 10, "mtime": 0.0, "sha256": "stale", "rows_ingested": 1}
+
+    plan = await ingest_manifest.plan_file(mock_db(entry), str(turbine_csv), "Turbine1")
+    assert plan.reset
+    assert plan.start_row == 0
+
+def collections_db(**collections):
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+    return db
+
+@pytest.mark.asyncio
+async def test_plan_file_without_entry_reloads_untracked_readings(turbine_csv):
+    '''a database loaded before the manifest existed is reloaded instead of getting every reading a second time'''
+    manifest, readings = MagicMock(), MagicMock()
+    manifest.find_one = AsyncMock(return_value=None)
+    readings.find_one = AsyncMock(return_value={"_id": 1})
+    db = collections_db(ingestion_manifest=manifest, turbine_readings=readings)
+
+    plan = await ingest_manifest.plan_file(db, str(turbine_csv), "Turbine1")
+
+    assert plan.reset and plan.reason == "untracked"
+    assert plan.start_row == 0
+    assert readings.find_one.await_args.args[0] == {"metadata.turbine_id": "Turbine1"}
+
+@pytest.mark.asyncio
+async def test_prepare_file_removes_untracked_readings(turbine_csv, monkeypatch):
+    manifest, readings = MagicMock(), MagicMock()
+    manifest.find_one = AsyncMock(return_value=None)
+    manifest.update_one = AsyncMock()
+    manifest.delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+    readings.delete_many = AsyncMock(return_value=MagicMock(deleted_count=3))
+    db = collections_db(ingestion_manifest=manifest, turbine_readings=readings)
+    rebuild_rollup, rebuild_registry = AsyncMock(), AsyncMock()
+    monkeypatch.setattr(ingest_manifest.power_curve_rollup, "rebuild", rebuild_rollup)
+    monkeypatch.setattr(ingest_manifest.turbine_registry, "rebuild", rebuild_registry)
+    plan = ingest_manifest.FilePlan(file_path=str(turbine_csv), file_name="Turbine1.csv", turbine_id="Turbine1",
+                                    size=1, mtime=0, reset=True, reason="untracked")
+
+    await ingest_manifest.prepare_file(db, plan)
+
+    readings.delete_many.assert_awaited_once_with({"metadata.turbine_id": "Turbine1"})
+    rebuild_rollup.assert_awaited_once_with(db, "Turbine1")
+    rebuild_registry.assert_awaited_once_with(db, "Turbine1")
+    #a file the reloaded one replaced (Turbine1.csv.gz before) lost its readings as well
+    manifest.delete_many.assert_awaited_once_with({"turbine_id": "Turbine1", "_id": {"$ne": "Turbine1.csv"}})
+    update = manifest.update_one.await_args.args[1]
+    assert update["$set"]["status"] == "in_progress" and update["$set"]["rows_ingested"] == 0
+
+@pytest.mark.asyncio
+async def test_prepare_file_keeps_readings_of_other_files_for_a_new_file(turbine_csv):
+    manifest, readings = MagicMock(), MagicMock()
+    manifest.find_one = AsyncMock(return_value=None)
+    manifest.update_one = AsyncMock()
+    readings.delete_many = AsyncMock()
+    db = collections_db(ingestion_manifest=manifest, turbine_readings=readings)
+    plan = ingest_manifest.FilePlan(file_path=str(turbine_csv), file_name="Turbine1.csv", turbine_id="Turbine1", size=1, mtime=0)
+
+    await ingest_manifest.prepare_file(db, plan)
+
+    readings.delete_many.assert_not_awaited()
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from ..main import app
+from ..services.ingest_status import IngestionStatus
+
+client = TestClient(app)
+
+def running_status(pending_turbine: str, loaded_turbine: str) -> IngestionStatus:
+    '''status of a run where one turbine is loaded and another one is still being written'''
+    ingestion = IngestionStatus()
+    ingestion.begin()
+    ingestion.scanning([pending_turbine, loaded_turbine])
+    ingestion.ingesting([
+        SimpleNamespace(turbine_id=pending_turbine, finished=None, error=None, size=1000, rows_written=10, rows_duplicate=0, rows_failed=0, batches_written=1, batches_total=4),
+        SimpleNamespace(turbine_id=loaded_turbine, finished=1.0, error=None, size=1000, rows_written=40, rows_duplicate=2, rows_failed=0, batches_written=4, batches_total=4),
+    ])
+    return ingestion
+
+def test_fetch_ingestion_status():
+    '''progress is reported while the background run is busy'''
+    with patch('api.routes.ingestion.ingestion_status', running_status("Turbine1", "Turbine2")):
+        response = client.get("/ingestion/status")
+
+        assert response.status_code == 200
+        response_data = response.json()
+        assert response_data["state"] == "running"
+        assert response_data["files_total"] == 2
+        assert response_data["files_done"] == 1
+        assert response_data["rows_written"] == 50
+        assert response_data["rows_duplicate"] == 2
+        assert response_data["pending_turbines"] == ["Turbine1"]
+
+def test_aggregation_warming_up_for_pending_turbine():
+    '''turbines that are still loading answer 503 instead of partial aggregates'''
+    with patch('api.routes.timeseries.ingestion_status', running_status("Turbine1", "Turbine2")), \
+         patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        response = client.get("/aggregated_timeseries", params={"turbine_id": "Turbine1"})
+
+        assert response.status_code == 503
+        assert "warming up" in response.json()["detail"]
+        assert response.headers["Retry-After"] == "10"
+        mock_mongodb.db.__getitem__.assert_not_called()
+
+        #all turbines together are only ready once the whole run is done
+        response = client.get("/aggregated_timeseries")
+        assert response.status_code == 503
+
+def test_run_ingestion_conflict_while_running():
+    with patch('api.routes.ingestion.csv_service.start_background_ingestion', return_value=False), \
+         patch('api.routes.ingestion.mongo_connector.mongodb'):
+        response = client.post("/ingestion/run")
+        assert response.status_code == 409
@@ -0,0 +1,56 @@
+import json
+import logging
+from customlogger import customlogger
+
+def record(name="task-2", level=logging.INFO, msg="Processing Turbine1.csv", lineno=1):
+    #the apps log f-strings, the message is already formatted and differs on every call
+    return logging.LogRecord(name, level, __file__, lineno, msg, None, None)
+
+def test_rate_limit_filter_drops_a_noisy_message(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(customlogger.time, "monotonic", lambda: clock[0])
+    rate_limit = customlogger.RateLimitFilter(limit=2, interval=1.0)
+
+    assert [rate_limit.filter(record(msg=f"Processing Turbine{i}.csv")) for i in range(4)] == [True, True, False, False]
+    #other log calls of the same logger, other loggers and warnings have their own budget
+    assert rate_limit.filter(record(msg="Finished Turbine1.csv", lineno=2))
+    assert rate_limit.filter(record(name="mongoconnector"))
+    assert rate_limit.filter(record(level=logging.WARNING))
+
+    clock[0] = 1.5
+    next_window = record()
+    assert rate_limit.filter(next_window)
+    assert next_window.getMessage() == "Processing Turbine1.csv (2 similar messages from task-2 were rate limited)"
+
+def test_rate_limit_filter_drops_expired_windows(monkeypatch):
+    '''windows are kept per log call, not per message, and expire'''
+    clock = [0.0]
+    monkeypatch.setattr(customlogger.time, "monotonic", lambda: clock[0])
+    rate_limit = customlogger.RateLimitFilter(limit=1000, interval=1.0)
+
+    for i in range(1000):
+        rate_limit.filter(record(msg=f"Inserted batch {i}", lineno=i % 3))
+    assert len(rate_limit._windows) == 3
+
+    clock[0] = 2.0
+    rate_limit.filter(record(lineno=10))
+    assert list(rate_limit._windows) == [("task-2", __file__, 10)]
+
+def test_rate_limit_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv("LOG_RATE_LIMIT", raising=False)
+    monkeypatch.setenv("LOG_QUEUE", "false")
+    customlogger.setup_logging()
+    try:
+        filters = [f for handler in logging.getLogger().handlers for f in handler.filters if isinstance(f, customlogger.RateLimitFilter)]
+        assert filters
+        assert all(f.filter(record()) for f in filters for _ in range(1000))
+    finally:
+        #back to the queue mode the app modules configured on import
+        monkeypatch.delenv("LOG_QUEUE")
+        customlogger.setup_logging()
+
+def test_json_formatter_writes_one_object_per_record():
+    entry = json.loads(customlogger.JSONFormatter().format(record()))
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "task-2"
+    assert entry["message"] == "Processing Turbine1.csv"
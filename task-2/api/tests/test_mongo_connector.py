@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from mongoconnector import mongo_connector, command_monitor
+from ..main import app
+from ..services.turbine_registry import registry_cache
+
+client = TestClient(app)
+
+def test_client_options_prefer_service_variables(monkeypatch):
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "50")
+    monkeypatch.setenv("TASK2_MONGO_MAX_POOL_SIZE", "20")
+    monkeypatch.setenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+    monkeypatch.setenv("MONGO_COMPRESSORS", "zlib,doesnotexist")
+
+    options = mongo_connector.client_options("task2")
+
+    assert options["maxPoolSize"] == 20
+    assert options["readPreference"] == "secondaryPreferred"
+    #compressors without their package are dropped instead of failing the connection
+    assert options["compressors"] == "zlib"
+    assert mongo_connector.client_options("task1")["maxPoolSize"] == 50
+
+def test_pool_listener_counts_checkouts_and_waiters():
+    listener = mongo_connector.PoolStatsListener()
+    address = ("mongodb", 27017)
+
+    listener.connection_created(SimpleNamespace(address=address))
+    listener.connection_check_out_started(SimpleNamespace(address=address))
+    listener.connection_check_out_started(SimpleNamespace(address=address))
+    listener.connection_checked_out(SimpleNamespace(address=address, duration=0.2))
+    stats = listener.stats()[0]
+    assert stats["checked_out"] == 1 and stats["waiters"] == 1 and stats["max_waiters"] == 2
+
+    listener.connection_check_out_failed(SimpleNamespace(address=address, duration=1.0))
+    listener.connection_checked_in(SimpleNamespace(address=address))
+    stats = listener.stats()[0]
+    assert stats["address"] == "mongodb:27017"
+    assert stats["checked_out"] == 0 and stats["waiters"] == 0
+    assert stats["checkout_failures"] == 1
+    assert stats["wait_seconds_max"] == 1.0
+    assert stats["wait_seconds_avg"] == 0.6
+
+def command_event(name, command, request_id, duration_ms=None, database="turbines"):
+    event = SimpleNamespace(command_name=name, command=command, request_id=request_id,
+                            connection_id=("mongodb", 27017), database_name=database)
+    if duration_ms is not None:
+        event.duration_micros = int(duration_ms * 1000)
+    return event
+
+def test_command_listener_histograms_by_collection_and_route(caplog):
+    listener = command_monitor.CommandStatsListener(slow_ms=100)
+    pipeline = [{"$match": {"metadata.turbine_id": "Turbine 1"}}]
+
+    command_monitor.set_route("/aggregated_timeseries")
+    listener.started(command_event("aggregate", {"aggregate": "turbine_readings", "pipeline": pipeline}, 1))
+    listener.started(command_event("getMore", {"getMore": 123, "collection": "turbine_readings"}, 2))
+    command_monitor.set_route(None)
+    listener.started(command_event("hello", {"hello": 1}, 3))
+    listener.started(command_event("find", {"find": "turbines", "filter": {}}, 4))
+
+    with caplog.at_level("WARNING", logger="mongoconnector"):
+        listener.succeeded(command_event("aggregate", {}, 1, duration_ms=250))
+        listener.succeeded(command_event("getMore", {}, 2, duration_ms=3))
+        listener.succeeded(command_event("hello", {}, 3, duration_ms=1))
+        listener.failed(command_event("find", {}, 4, duration_ms=0.5))
+
+    stats = {(entry["command"], entry["collection"], entry["route"]): entry for entry in listener.stats()}
+    assert set(stats) == {
+        ("aggregate", "turbine_readings", "/aggregated_timeseries"),
+        ("getMore", "turbine_readings", "/aggregated_timeseries"),
+        ("find", "turbines", None),
+    }
+    aggregate = stats[("aggregate", "turbine_readings", "/aggregated_timeseries")]
+    assert aggregate["slow"] == 1 and aggregate["max_ms"] == 250
+    assert aggregate["buckets"]["100"] == 0 and aggregate["buckets"]["250"] == 1 and aggregate["buckets"]["+Inf"] == 1
+    assert stats[("find", "turbines", None)]["failures"] == 1
+    #only the slow aggregate is logged, with its pipeline
+    assert len(caplog.records) == 1
+    assert "metadata.turbine_id" in caplog.records[0].getMessage()
+
+def test_requests_tag_commands_with_their_route():
+    '''the route template is visible to the driver calls a request makes'''
+    registry_cache.clear()
+    seen = []
+    async def to_list(length=None):
+        seen.append(command_monitor.current_route.get())
+        return []
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+        mock_collection.find.return_value.sort.return_value.to_list = to_list
+        mock_collection.distinct = AsyncMock(return_value=[])
+
+        client.get("/turbines")
+    registry_cache.clear()
+    assert seen == ["/turbines"]
+
+def test_db_endpoints_come_from_the_shared_router():
+    with patch('mongoconnector.db_routes.mongo_connector.pool_stats', return_value={"checked_out": 1}), \
+         patch('mongoconnector.db_routes.mongo_connector.metrics', return_value={"commands": []}):
+        assert client.get("/db/pool").json() == {"checked_out": 1}
+        assert client.get("/db/metrics").json() == {"commands": []}
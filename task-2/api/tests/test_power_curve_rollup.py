@@ -0,0 +1,61 @@
+from datetime import datetime
+from ..services import power_curve_rollup
+
+def reading(timestamp, wind_speed, power, turbine_id="Turbine1"):
+    return {
+        "timestamp": timestamp,
+        "power": power,
+        "wind_speed": wind_speed,
+        "rpm": 10.0,
+        "azimuth": 90.0,
+        "external_temperature": 5.0,
+        "internal_temperature": 20.0,
+        "metadata": {"turbine_id": turbine_id},
+    }
+
+def test_wind_bin_matches_bucket_boundaries():
+    assert power_curve_rollup.wind_bin(0.0) == 0.0
+    assert power_curve_rollup.wind_bin(0.49) == 0.0
+    assert power_curve_rollup.wind_bin(12.5) == 12.5
+    assert power_curve_rollup.wind_bin(25.4) == 25.0
+    #outside the boundaries $bucket uses its default bucket, which the power curve drops
+    assert power_curve_rollup.wind_bin(25.5) is None
+    assert power_curve_rollup.wind_bin(-1.0) is None
+    assert power_curve_rollup.wind_bin(None) is None
+
+def test_rollup_updates_fold_batch_per_turbine_day_and_bin():
+    documents = [
+        reading(datetime(2016, 1, 1, 0, 0), 5.1, 100.0),
+        reading(datetime(2016, 1, 1, 0, 10), 5.3, 300.0),
+        reading(datetime(2016, 1, 2, 0, 0), 5.2, 50.0),
+        reading(datetime(2016, 1, 2, 0, 10), 30.0, 50.0),
+    ]
+
+    updates = {(u._filter["day"], u._filter["bin"]): u._doc["$inc"] for u in power_curve_rollup.rollup_updates(documents)}
+
+    assert set(updates) == {(datetime(2016, 1, 1), 5.0), (datetime(2016, 1, 2), 5.0)}
+    assert updates[(datetime(2016, 1, 1), 5.0)]["count"] == 2
+    assert updates[(datetime(2016, 1, 1), 5.0)]["power_sum"] == 400.0
+    assert updates[(datetime(2016, 1, 1), 5.0)]["rpm_sum"] == 20.0
+
+def test_split_range_into_days_and_edges():
+    days, edges = power_curve_rollup.split_range(datetime(2016, 1, 1, 6), datetime(2016, 1, 4, 12))
+    assert days == (datetime(2016, 1, 2), datetime(2016, 1, 4))
+    assert edges == [(datetime(2016, 1, 1, 6), datetime(2016, 1, 2)), (datetime(2016, 1, 4), datetime(2016, 1, 4, 12))]
+
+    #less than a whole day is read from the raw readings only
+    days, edges = power_curve_rollup.split_range(datetime(2016, 1, 1, 6), datetime(2016, 1, 1, 12))
+    assert days is None
+    assert edges == [(datetime(2016, 1, 1, 6), datetime(2016, 1, 1, 12))]
+
+def test_bin_config_rollup_compatibility():
+    '''bins that are whole multiples of the rollup bins on the same grid are re-binned from the partials'''
+    assert power_curve_rollup.BinConfig().rollup_compatible()
+    assert power_curve_rollup.BinConfig(1.0, 2.0, 20.0).rollup_compatible()
+    assert not power_curve_rollup.BinConfig(0.3, 0.0, 25.0).rollup_compatible()
+    assert not power_curve_rollup.BinConfig(1.0, 0.25, 20.0).rollup_compatible()
+    #the last bin would reach past the rollup range
+    assert not power_curve_rollup.BinConfig(1.0, 0.0, 25.0).rollup_compatible()
+
+    bins = power_curve_rollup.BinConfig(2.0, 1.0, 10.0)
+    assert bins.bins == 5 and bins.upper == 11.0
@@ -0,0 +1,111 @@
+import io
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from .. import export
+from ..services import readings_export
+
+METADATA = {"turbine_id": "Turbine1", "latitude": None, "longitude": None, "altitude": None}
+
+def _reading(minute, **fields):
+    return {"timestamp": datetime(2016, 1, 1, 0, minute), "power": 1500.0 + minute, "wind_speed": 5.2, "rpm": 12.1,
+            "azimuth": 120.0, "external_temperature": 3.5, "internal_temperature": 20.1, "metadata": METADATA, **fields}
+
+class AsyncCursorMock:
+    def __init__(self, items):
+        self.items = iter(items)
+        self.batch = None
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        self.batch = size
+        return self
+
+    def limit(self, limit):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+def _db(readings):
+    db = MagicMock()
+    db.__getitem__.return_value.find.return_value = AsyncCursorMock(readings)
+    return db
+
+async def _export(readings, export_format, batch_size=2):
+    return b"".join([chunk async for chunk in readings_export.export_readings(_db(readings), {}, export_format, batch_size)])
+
+@pytest.mark.asyncio
+async def test_parquet_export_writes_a_row_group_per_batch():
+    readings = [_reading(minute) for minute in (0, 10, 20)]
+
+    data = await _export(readings, "parquet")
+
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 2
+    table = parquet.read()
+    assert table.column("timestamp").to_pylist() == [reading["timestamp"] for reading in readings]
+    assert table.column("power").to_pylist() == [1500.0, 1510.0, 1520.0]
+    assert table.column("turbine_id").to_pylist() == ["Turbine1"] * 3
+    assert table.column("latitude").null_count == 3
+
+@pytest.mark.asyncio
+async def test_arrow_export_reads_old_schema_readings_and_maps_zero_copy(tmp_path):
+    '''measurements still stored in the metaField end up in their own column'''
+    legacy = {key: value for key, value in _reading(10).items() if key != "rpm"}
+    legacy["metadata"] = {**METADATA, "rpm": 9.5}
+
+    path = tmp_path / "Turbine1.arrow"
+    path.write_bytes(await _export([_reading(0), legacy], "arrow"))
+
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        assert table.schema == readings_export.SCHEMA
+        assert table.column("rpm").to_pylist() == [12.1, 9.5]
+    assert readings_export.row_count(str(path), "arrow") == 2
+
+@pytest.mark.asyncio
+async def test_empty_selection_is_a_valid_file():
+    table = pq.read_table(io.BytesIO(await _export([], "parquet")))
+    assert table.num_rows == 0
+    assert table.schema.names == readings_export.SCHEMA.names
+
+@pytest.mark.asyncio
+async def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        await _export([], "csv")
+
+def test_file_name_names_turbine_and_range():
+    assert readings_export.file_name("Turbine1", datetime(2016, 1, 1), datetime(2016, 2, 1), "parquet") == "Turbine1_20160101-20160201.parquet"
+    assert readings_export.file_name(None, None, None, "arrow") == "turbines.arrow"
+
+def test_export_cli_writes_the_selection(tmp_path, capsys):
+    output = tmp_path / "Turbine1.arrow"
+    db = _db([_reading(0), _reading(10)])
+    with patch('api.export.mongo_connector') as mock_connector:
+        mock_connector.connect_to_mongo = AsyncMock()
+        mock_connector.close_mongo_connection = AsyncMock()
+        mock_connector.mongodb.db = db
+
+        assert export.main([str(output), "--turbine-id", "Turbine1", "--start-date", "2016-01-01",
+                            "--database", "time_series_data"]) == 0
+
+    query = db.__getitem__.return_value.find.call_args.args[0]
+    assert query == {"metadata.turbine_id": "Turbine1", "timestamp": {"$gte": datetime(2016, 1, 1)}}
+    assert readings_export.row_count(str(output), "arrow") == 2
+    assert not (tmp_path / "Turbine1.arrow.partial").exists()
+    assert "2 readings" in capsys.readouterr().out
+
+def test_export_cli_rejects_an_inverted_range(tmp_path):
+    assert export.main([str(tmp_path / "out.parquet"), "--start-date", "2016-02-01", "--end-date", "2016-01-01",
+                        "--database", "time_series_data"]) == 2
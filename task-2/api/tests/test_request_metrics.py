@@ -0,0 +1,44 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from requestmetrics import requestmetrics
+from ..main import app
+from ..services.turbine_registry import registry_cache
+
+client = TestClient(app)
+
+def test_histogram_buckets_are_cumulative():
+    registry = requestmetrics.MetricsRegistry(duration_buckets=[0.1, 1], size_buckets=[10])
+    registry.observe("GET", "/turbines", 200, 0.05, 5)
+    registry.observe("GET", "/turbines", 200, 0.5, 50)
+    registry.observe("GET", "/turbines", 404, 5, 20)
+
+    text = registry.render()
+
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/turbines",le="0.1"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/turbines",le="1"} 2' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/turbines",le="+Inf"} 3' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/turbines"} 3' in text
+    assert 'http_response_size_bytes_bucket{method="GET",route="/turbines",le="10"} 1' in text
+    assert 'http_requests_total{method="GET",route="/turbines",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/turbines",status="404"} 1' in text
+
+def test_metrics_endpoint_records_route_templates():
+    '''requests are labelled with the route template, unknown paths share one label'''
+    registry_cache.clear()
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+        mock_collection.find.return_value.sort.return_value.to_list = AsyncMock(return_value=[])
+        mock_collection.distinct = AsyncMock(return_value=["Turbine 1"])
+
+        client.get("/turbines")
+        client.get("/does/not/exist")
+        response = client.get("/metrics")
+    registry_cache.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/turbines",status="200"}' in response.text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in response.text
+    assert "http_requests_in_flight 1" in response.text
+    assert "# TYPE mongodb_command_duration_seconds histogram" in response.text
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone, timedelta
+from ..services.response_cache import MISSING, TTLCache, normalize_datetime
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(maxsize=4, ttl=10, clock=clock)
+    cache.set("key", [1], "Turbine1")
+
+    assert cache.get("key") == [1]
+    clock.now = 10
+    assert cache.get("key") is MISSING
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidate_turbine_keeps_other_turbines():
+    '''new data for a turbine drops its entries and the all-turbine ones'''
+    cache = TTLCache(maxsize=8, ttl=60)
+    cache.set("t1", 1, "Turbine1")
+    cache.set("t2", 2, "Turbine2")
+    cache.set("all", 3, None)
+
+    cache.invalidate("Turbine1")
+    assert cache.get("t1") is MISSING and cache.get("all") is MISSING
+    assert cache.get("t2") == 2
+
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["invalidations"] == 3
+
+def test_set_skips_values_computed_across_an_invalidation():
+    '''a curve computed while the ingestion invalidated its turbine is not stored'''
+    cache = TTLCache(maxsize=8, ttl=60)
+    generation = cache.generation("Turbine1")
+    other = cache.generation("Turbine2")
+    fleet = cache.generation()
+
+    cache.invalidate("Turbine1")
+    cache.set("t1", 1, "Turbine1", generation)
+    cache.set("t2", 2, "Turbine2", other)
+    cache.set("fleet", 3, None, fleet)
+
+    assert cache.get("t1") is MISSING and cache.get("fleet") is MISSING
+    assert cache.get("t2") == 2
+    assert cache.stats()["stale_sets"] == 2
+
+    generation = cache.generation("Turbine2")
+    cache.invalidate()
+    cache.set("t2", 2, "Turbine2", generation)
+    assert cache.get("t2") is MISSING
+
+def test_normalize_datetime_matches_naive_utc():
+    aware = datetime(2016, 1, 1, 1, 0, tzinfo=timezone(timedelta(hours=1)))
+    assert normalize_datetime(aware) == datetime(2016, 1, 1, 0, 0)
+    assert normalize_datetime(datetime(2016, 1, 1)) == datetime(2016, 1, 1)
@@ -0,0 +1,45 @@
+from unittest.mock import AsyncMock, MagicMock
+from datetime import datetime
+from bson import ObjectId
+import pytest
+from ..services import schema_migration
+
+def legacy_reading(minute):
+    return {
+        "_id": ObjectId(),
+        "timestamp": datetime(2016, 1, 1, 0, minute),
+        "power": 1500.0,
+        "wind_speed": 5.2,
+        "metadata": {"turbine_id": "Turbine1", "rpm": 12.1, "azimuth": 120.0, "external_temperature": 3.5,
+                     "internal_temperature": 20.1, "latitude": None, "longitude": None, "altitude": None},
+    }
+
+def test_flatten_reading_moves_measurements_out_of_metadata():
+    flattened = schema_migration.flatten_reading(legacy_reading(0))
+
+    assert flattened["rpm"] == 12.1 and flattened["internal_temperature"] == 20.1
+    assert flattened["metadata"] == {"turbine_id": "Turbine1", "latitude": None, "longitude": None, "altitude": None}
+    #readings in the new shape are left alone
+    assert schema_migration.flatten_reading(flattened) is flattened
+
+@pytest.mark.asyncio
+async def test_migrate_rewrites_batches_until_no_old_readings_are_left():
+    batches = [[legacy_reading(0), legacy_reading(10)], [legacy_reading(20)], []]
+    collection = MagicMock()
+    collection.distinct = AsyncMock(return_value=["Turbine1"])
+    collection.find.return_value.sort.return_value.limit.return_value.to_list = AsyncMock(side_effect=batches)
+    collection.insert_many = AsyncMock()
+    collection.delete_many = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    migrated = await schema_migration.migrate(db, batch_size=2, pause=0)
+
+    assert migrated == {"Turbine1": 3}
+    copies = collection.insert_many.await_args_list[0].args[0]
+    assert all("_id" not in copy and copy["rpm"] == 12.1 for copy in copies)
+    #every batch first drops copies left by an interrupted run, then deletes the old readings by _id
+    cleanup, delete_old = collection.delete_many.await_args_list[:2]
+    assert cleanup.args[0]["timestamp"] == {"$in": [batches[0][0]["timestamp"], batches[0][1]["timestamp"]]}
+    assert cleanup.args[0]["metadata.rpm"] == {"$exists": False}
+    assert delete_old.args[0]["_id"] == {"$in": [reading["_id"] for reading in batches[0]]}
@@ -1,12 +1,24 @@
 from fastapi.testclient import TestClient
+import io
+import json
+import pyarrow.parquet as pq
+from bson import ObjectId
 import pytest
 from datetime import datetime
 from unittest.mock import patch, AsyncMock, MagicMock
 from fastapi import HTTPException
 from ..main import app
+from ..services.response_cache import power_curve_cache
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def empty_power_curve_cache():
+    #responses are cached across requests, every test starts from an empty cache
+    power_curve_cache.clear()
+    yield
+    power_curve_cache.clear()
+
 '''fetch all timeseries data with valid parameters'''
 
 @pytest.mark.asyncio
@@ -16,16 +28,17 @@ async def test_fetch_timeseries_with_valid_parameters():
     test_start_date = datetime(2023, 1, 1)
     test_end_date = datetime(2023, 1, 2)
     
+    #whole days are served from the daily rollups, so the mocked aggregation returns summed partials
     mock_results = [
         {
             "_id": 5.0,
-            "avg_wind_speed": 5.2,
-            "average_power": 1500.5,
-            "avg_azimuth": 120.3,
-            "average_external_temperature": 15.2,
-            "average_internal_temperature": 20.1,
-            "average_rpm": 12.5,
-            "count": 10
+            "count": 10,
+            "wind_speed_sum": 52.0,
+            "power_sum": 15005.0,
+            "azimuth_sum": 1203.0,
+            "external_temperature_sum": 152.0,
+            "internal_temperature_sum": 201.0,
+            "rpm_sum": 125.0
         }
     ]
     
@@ -75,14 +88,30 @@ async def test_fetch_timeseries_with_valid_parameters():
         assert response_data[0]["average_wind_speed"] == 5.2
         assert response_data[0]["average_power"] == 1500.5
         
-        # Verify aggregation pipeline
+        assert response_data[0]["average_rpm"] == 12.5
+        
+        # Verify aggregation pipeline, a whole day range only reads the rollup collection
         mock_collection.aggregate.assert_called_once()
+        mock_db.__getitem__.assert_called_once_with("power_curve_daily")
         pipeline = mock_collection.aggregate.call_args[0][0]
         
         # Verify match stage includes turbine_id
-        assert pipeline[0]["$match"]["metadata.turbine_id"] == test_turbine_id
-        assert pipeline[0]["$match"]["timestamp"]["$gte"] == test_start_date
-        assert pipeline[0]["$match"]["timestamp"]["$lt"] == test_end_date
+        assert pipeline[0]["$match"]["turbine_id"] == test_turbine_id
+        assert pipeline[0]["$match"]["day"]["$gte"] == test_start_date
+        assert pipeline[0]["$match"]["day"]["$lt"] == test_end_date
+
+        # The same request again is answered from the cache without touching the database
+        cached = client.get(
+            "/aggregated_timeseries",
+            params={
+                "start_date": test_start_date.isoformat(),
+                "end_date": test_end_date.isoformat(),
+                "turbine_id": test_turbine_id
+            }
+        )
+        assert cached.json() == response_data
+        mock_collection.aggregate.assert_called_once()
+        assert client.get("/aggregated_timeseries/cache").json()["hits"] == 1
 
 
 @pytest.mark.asyncio
@@ -130,4 +159,281 @@ async def test_fetch_timeseries_invalid_dates():
         #assert "start_date must be earlier than end_date" in response.json()["detail"]
 
 '''fetch all data with invalid parameters'''
-''''''
\ No newline at end of file
+''''''
+def test_stream_timeseries_as_ndjson():
+    """Readings are streamed one JSON document per line, filtered on the metaField"""
+    readings = [
+        {"timestamp": datetime(2016, 1, 1, 0, 0), "power": 1500.0, "wind_speed": 5.2, "metadata": {"turbine_id": "Turbine1"}},
+        {"timestamp": datetime(2016, 1, 1, 0, 10), "power": 1620.0, "wind_speed": 6.1, "metadata": {"turbine_id": "Turbine1"}},
+    ]
+
+    class AsyncCursorMock:
+        def __init__(self, items):
+            self.items = iter(items)
+
+        def sort(self, *args):
+            return self
+
+        def batch_size(self, size):
+            return self
+
+        def limit(self, limit):
+            return self
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.items)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find.return_value = AsyncCursorMock(readings)
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get("/timeseries/stream", params={"turbine_id": "Turbine1", "batch_size": 1})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[1])["timestamp"] == "2016-01-01T00:10:00"
+
+        query, projection = mock_collection.find.call_args[0]
+        assert query == {"metadata.turbine_id": "Turbine1"}
+        assert projection == {"_id": 0}
+
+def test_stream_timeseries_compares_aware_and_naive_dates():
+    """A Z-suffixed date next to a naive one is compared and queried as naive UTC"""
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find.return_value.sort.return_value.batch_size.return_value.__aiter__.return_value = []
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get("/timeseries/stream", params={"start_date": "2016-01-01T00:00:00Z", "end_date": "2016-01-02T00:00:00"})
+        assert response.status_code == 200
+        query = mock_collection.find.call_args[0][0]
+        assert query == {"timestamp": {"$gte": datetime(2016, 1, 1), "$lte": datetime(2016, 1, 2)}}
+
+        response = client.get("/timeseries/stream", params={"start_date": "2016-01-02T00:00:00+01:00", "end_date": "2016-01-01T00:00:00"})
+        assert response.status_code == 400
+
+def test_export_timeseries_as_parquet():
+    """Readings are downloaded as a Parquet file named after the selection"""
+    readings = [
+        {"timestamp": datetime(2016, 1, 1, 0, 0), "power": 1500.0, "wind_speed": 5.2, "metadata": {"turbine_id": "Turbine1"}},
+        {"timestamp": datetime(2016, 1, 1, 0, 10), "power": 1620.0, "wind_speed": 6.1, "metadata": {"turbine_id": "Turbine1"}},
+    ]
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find.return_value.sort.return_value.batch_size.return_value.__aiter__.return_value = readings
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get("/timeseries/export", params={"turbine_id": "Turbine1", "start_date": "2016-01-01T00:00:00"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.apache.parquet"
+        assert response.headers["content-disposition"] == 'attachment; filename="Turbine1_20160101-.parquet"'
+        table = pq.read_table(io.BytesIO(response.content))
+        assert table.column("power").to_pylist() == [1500.0, 1620.0]
+        assert table.column("rpm").null_count == 2
+
+        response = client.get("/timeseries/export", params={"format": "csv"})
+        assert response.status_code == 422
+
+def test_export_timeseries_compares_aware_and_naive_dates():
+    with patch('api.routes.timeseries.mongo_connector.mongodb'):
+        response = client.get("/timeseries/export", params={"start_date": "2016-01-02T00:00:00Z", "end_date": "2016-01-01T00:00:00"})
+        assert response.status_code == 400
+
+def test_timeseries_page_returns_keyset_cursor():
+    """A full page returns a cursor that continues strictly after its last reading"""
+    metadata = {"turbine_id": "Turbine1", "rpm": 12.1, "azimuth": 120.0, "external_temperature": 3.5,
+                "internal_temperature": 20.1, "latitude": None, "longitude": None, "altitude": None}
+    readings = [
+        {"_id": ObjectId(), "timestamp": datetime(2016, 1, 1, 0, minute), "power": 1500.0, "wind_speed": 5.2, "metadata": metadata}
+        for minute in (0, 10, 20)
+    ]
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find.return_value.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=readings)
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get("/timeseries/page", params={"turbine_id": "Turbine1", "limit": 2})
+        assert response.status_code == 200
+        page = response.json()
+        assert page["has_more"] and page["count"] == 2
+        #readings written before the schema change come out with top level measurements
+        assert page["readings"][0]["rpm"] == 12.1 and "rpm" not in page["readings"][0]["metadata"]
+
+        client.get("/timeseries/page", params={"turbine_id": "Turbine1", "limit": 2, "cursor": page["next_cursor"]})
+        query = mock_collection.find.call_args[0][0]
+        assert query == {"$and": [{"metadata.turbine_id": "Turbine1"}, {"timestamp": {"$gt": readings[1]["timestamp"]}}]}
+        #one turbine is paged in the order of the (turbine_id, timestamp) index, no _id tie breaker
+        mock_collection.find.return_value.sort.assert_called_with([("timestamp", 1)])
+
+def test_timeseries_page_over_all_turbines_continues_turbine_by_turbine():
+    readings = [
+        {"_id": ObjectId(), "timestamp": datetime(2016, 1, 1, 0, 0), "power": 1500.0, "wind_speed": 5.2, "rpm": 12.1,
+         "azimuth": 120.0, "external_temperature": 3.5, "internal_temperature": 20.1,
+         "metadata": {"turbine_id": turbine_id, "latitude": None, "longitude": None, "altitude": None}}
+        for turbine_id in ("Turbine1", "Turbine2")
+    ]
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find.return_value.sort.return_value.limit.return_value.to_list = AsyncMock(return_value=readings)
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        page = client.get("/timeseries/page", params={"limit": 1}).json()
+        client.get("/timeseries/page", params={"limit": 1, "cursor": page["next_cursor"]})
+
+    query = mock_collection.find.call_args[0][0]
+    assert query == {
+        "metadata.turbine_id": {"$gte": "Turbine1"},
+        "$or": [{"metadata.turbine_id": {"$gt": "Turbine1"}},
+                {"metadata.turbine_id": "Turbine1", "timestamp": {"$gt": datetime(2016, 1, 1, 0, 0)}}],
+    }
+    mock_collection.find.return_value.sort.assert_called_with([("metadata.turbine_id", 1), ("timestamp", 1)])
+
+def test_timeseries_page_rejects_invalid_cursor():
+    with patch('api.routes.timeseries.mongo_connector.mongodb'):
+        response = client.get("/timeseries/page", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+def test_fleet_power_curves_use_one_aggregation():
+    """All requested turbines are grouped in a single pass over the daily rollups"""
+    partials = [
+        {"_id": {"turbine_id": turbine_id, "bin": 4.0}, "count": 4, "wind_speed_sum": 18.0, "power_sum": 4000.0,
+         "azimuth_sum": 400.0, "external_temperature_sum": 20.0, "internal_temperature_sum": 80.0, "rpm_sum": 40.0}
+        for turbine_id in ("Turbine1", "Turbine2")
+    ]
+
+    class AsyncCursorMock:
+        def __init__(self, items):
+            self.items = iter(items)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.items)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.aggregate.return_value = AsyncCursorMock(partials)
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get(
+            "/aggregated_timeseries/fleet",
+            params={
+                "turbine_ids": ["Turbine2", "Turbine1", "Turbine3"],
+                "start_date": "2016-01-01T00:00:00",
+                "end_date": "2016-01-03T00:00:00",
+                "bin_size": 2.0,
+                "max_wind_speed": 22.0,
+            }
+        )
+
+        assert response.status_code == 200
+        curves = response.json()
+        assert [curve["turbine_id"] for curve in curves] == ["Turbine2", "Turbine1", "Turbine3"]
+        assert curves[0]["power_curve"][0]["wind_speed_bin"] == 4.0
+        assert curves[0]["power_curve"][0]["average_power"] == 1000.0
+        assert curves[2]["power_curve"] == []
+
+        mock_collection.aggregate.assert_called_once()
+        pipeline = mock_collection.aggregate.call_args[0][0]
+        assert pipeline[0]["$match"]["turbine_id"] == {"$in": ["Turbine2", "Turbine1", "Turbine3"]}
+        assert pipeline[1]["$group"]["_id"]["turbine_id"] == "$turbine_id"
+
+def test_power_curve_rejects_inverted_wind_range():
+    with patch('api.routes.timeseries.mongo_connector.mongodb'):
+        response = client.get("/aggregated_timeseries", params={"min_wind_speed": 10, "max_wind_speed": 5})
+        assert response.status_code == 400
+
+def test_downsampled_minmax_groups_time_windows():
+    """minmax points come from a $dateTrunc window sized to the requested point count"""
+    windows = [{"timestamp": datetime(2016, 1, 1, 0, 0), "value": 1500.0, "min": 900.0, "max": 2100.0, "count": 6}]
+
+    class AsyncCursorMock:
+        def __init__(self, items):
+            self.items = iter(items)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.items)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.aggregate.return_value = AsyncCursorMock(windows)
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get(
+            "/timeseries/downsampled",
+            params={"turbine_id": "Turbine1", "start_date": "2016-01-01T00:00:00", "end_date": "2016-01-11T00:00:00", "points": 240}
+        )
+
+        assert response.status_code == 200
+        series = response.json()
+        assert series["window_minutes"] == 60
+        assert series["points"][0]["max"] == 2100.0
+        pipeline = mock_collection.aggregate.call_args[0][0]
+        assert pipeline[1]["$group"]["_id"]["$dateTrunc"]["binSize"] == 60
+
+def test_downsampled_fills_a_missing_bound_next_to_an_aware_date():
+    """the stored bounds are naive, a Z-suffixed start_date is normalized before it is compared with them"""
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.find_one = AsyncMock(return_value={"timestamp": datetime(2016, 1, 11)})
+        mock_collection.aggregate.return_value.__aiter__.return_value = []
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        response = client.get("/timeseries/downsampled", params={"turbine_id": "Turbine1", "start_date": "2016-01-01T00:00:00Z"})
+
+        assert response.status_code == 200
+        match = mock_collection.aggregate.call_args[0][0][0]["$match"]
+        assert match["timestamp"] == {"$gte": datetime(2016, 1, 1), "$lte": datetime(2016, 1, 11)}
+
+def test_power_curve_invalidated_while_computed_is_not_cached():
+    """new readings written while the curve is aggregated make it stale, the next request computes it again"""
+    async def aggregate_during_ingestion(*args, **kwargs):
+        power_curve_cache.invalidate("Turbine1")
+        return {}
+
+    with patch('api.routes.timeseries.mongo_connector.mongodb'), \
+         patch('api.routes.timeseries.power_curve_rollup.power_curve', new=AsyncMock(side_effect=aggregate_during_ingestion)) as power_curve:
+        params = {"turbine_id": "Turbine1", "start_date": "2016-01-01T00:00:00", "end_date": "2016-01-02T00:00:00"}
+        assert client.get("/aggregated_timeseries", params=params).status_code == 200
+        assert client.get("/aggregated_timeseries", params=params).status_code == 200
+
+    assert power_curve.await_count == 2
+    assert power_curve_cache.stats()["size"] == 0
+
+def test_power_curve_accepts_timezone_aware_dates():
+    """Dates with Z or an offset are compared as naive UTC when the range is split into rollup days"""
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_collection.aggregate.return_value.__aiter__.return_value = []
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+
+        hits = power_curve_cache.stats()["hits"]
+        aware = client.get("/aggregated_timeseries", params={"start_date": "2016-01-01T00:00:00Z", "end_date": "2016-01-05T02:00:00+02:00"})
+        naive = client.get("/aggregated_timeseries", params={"start_date": "2016-01-01T00:00:00", "end_date": "2016-01-05T00:00:00"})
+
+        assert aware.status_code == 200
+        assert naive.status_code == 200
+        #both ask for the same UTC range, the second request is answered from the cache
+        assert power_curve_cache.stats()["hits"] == hits + 1
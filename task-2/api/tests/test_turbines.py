@@ -1,11 +1,24 @@
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from datetime import datetime
 from bson import ObjectId
 from fastapi.testclient import TestClient
 import pytest
 from ..main import app
+from ..services.turbine_registry import registry_cache
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def empty_registry_cache():
+    registry_cache.clear()
+    yield
+    registry_cache.clear()
+
+def mock_registry(collection, entries):
+    '''registry lookups go through find().sort().to_list()'''
+    collection.find = MagicMock()
+    collection.find.return_value.sort.return_value.to_list = AsyncMock(return_value=entries)
+
 #turbines list
 @pytest.fixture
 def mock_turbines():
@@ -25,7 +38,8 @@ def test_fetch_turbines_empty():
         mock_collection = AsyncMock()
         mock_db.__getitem__.return_value = mock_collection
         
-        # Mock distinct() to return our test data
+        # Empty registry falls back to distinct()
+        mock_registry(mock_collection, [])
         mock_collection.distinct = AsyncMock(return_value=[])
         
         # Make the request
@@ -52,7 +66,8 @@ def test_fetch_all_turbines(mock_turbines: any):
         mock_collection = AsyncMock()
         mock_db.__getitem__.return_value = mock_collection
         
-        # Mock distinct() to return our test data
+        # Registry not filled yet, distinct() returns our test data
+        mock_registry(mock_collection, [])
         mock_collection.distinct = AsyncMock(return_value=mock_turbines)
         
         # Make the request
@@ -67,3 +82,41 @@ def test_fetch_all_turbines(mock_turbines: any):
         # Verify database call
         mock_collection.distinct.assert_awaited_once_with('metadata.turbine_id')
 '''fetch single turbines'''
+
+def test_fetch_turbines_from_registry(mock_turbines: any):
+    '''a filled registry answers without distinct() and later calls come from the cache'''
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+        mock_registry(mock_collection, [{"_id": turbine_id} for turbine_id in mock_turbines])
+        mock_collection.distinct = AsyncMock()
+
+        assert client.get("/turbines").json() == mock_turbines
+        assert client.get("/turbines").json() == mock_turbines
+
+        mock_mongodb.db.__getitem__.assert_called_once_with("turbines")
+        mock_collection.find.return_value.sort.return_value.to_list.assert_awaited_once()
+        mock_collection.distinct.assert_not_awaited()
+
+def test_fetch_turbines_coverage():
+    with patch('api.routes.timeseries.mongo_connector.mongodb') as mock_mongodb:
+        mock_collection = MagicMock()
+        mock_mongodb.db.__getitem__.return_value = mock_collection
+        mock_registry(mock_collection, [{
+            "_id": "Turbine1",
+            "first_timestamp": datetime(2016, 1, 1, 0, 0),
+            "last_timestamp": datetime(2016, 1, 1, 1, 30),
+            "readings": 5,
+            "latitude": 52.5,
+            "longitude": 13.4,
+            "altitude": None,
+        }])
+
+        response = client.get("/turbines/coverage")
+
+        assert response.status_code == 200
+        entry = response.json()[0]
+        assert entry["turbine_id"] == "Turbine1"
+        #10 slots between the first and the last reading, 5 of them hold a reading
+        assert entry["coverage"] == 0.5
+        assert entry["latitude"] == 52.5